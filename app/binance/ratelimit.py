@@ -0,0 +1,94 @@
+# app/binance/ratelimit.py
+"""
+Binance REST 權重限流（token bucket）。
+
+- 桶容量 = 每分鐘權重預算（預設 BINANCE_WEIGHT_BUDGET，低於官方 2400 留安全邊界），
+  以「預算 / 60 秒」的速率回補；每次請求前 acquire(weight)。
+- 每次回應後用 X-MBX-USED-WEIGHT-1M 校正：伺服器說已用多少，本地可用額度就不超過「預算 - 已用」。
+  已用量達預算時暫停到下一個整分鐘（Binance 的權重視窗以整分鐘重置）。
+- 429 / 418：依 Retry-After 暫停所有請求。
+多執行緒共用同一個 limiter；等待時不持有鎖。
+"""
+from __future__ import annotations
+import threading
+import time
+import logging
+from typing import Mapping, Optional
+
+log = logging.getLogger("binance")
+
+
+def klines_weight(limit: int) -> int:
+    """/fapi/v1/klines 的權重依 limit 而定：[1,100)=1、[100,500)=2、[500,1000]=5、>1000=10。"""
+    n = int(limit or 500)
+    if n < 100:
+        return 1
+    if n < 500:
+        return 2
+    if n <= 1000:
+        return 5
+    return 10
+
+
+class WeightLimiter:
+    def __init__(self, budget_per_min: int = 2000, *, clock=time.monotonic, wall=time.time) -> None:
+        self.budget = max(1, int(budget_per_min))
+        self._rate = self.budget / 60.0
+        self._tokens = float(self.budget)
+        self._clock = clock
+        self._wall = wall
+        self._last = clock()
+        self._blocked_until = 0.0  # monotonic 時間；429 / 用量滿時設定
+        self._lock = threading.Lock()
+        self.server_used: Optional[int] = None
+        self.waited_s = 0.0
+        self.throttled = 0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(float(self.budget), self._tokens + (now - self._last) * self._rate)
+        self._last = now
+
+    def acquire(self, weight: int = 1) -> None:
+        """取得 weight 點額度；不足時睡到足夠為止。"""
+        w = min(max(1, int(weight)), self.budget)
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._refill(now)
+                if now < self._blocked_until:
+                    wait = self._blocked_until - now
+                elif self._tokens >= w:
+                    self._tokens -= w
+                    return
+                else:
+                    wait = (w - self._tokens) / self._rate
+            self.waited_s += wait
+            time.sleep(wait)
+
+    def observe(self, headers: Mapping[str, str]) -> None:
+        """以回應標頭校正本地額度。"""
+        raw = headers.get("X-MBX-USED-WEIGHT-1M") or headers.get("x-mbx-used-weight-1m")
+        if raw is None:
+            return
+        try:
+            used = int(raw)
+        except (TypeError, ValueError):
+            return
+        with self._lock:
+            self.server_used = used
+            now = self._clock()
+            self._refill(now)
+            self._tokens = min(self._tokens, float(max(0, self.budget - used)))
+            if used >= self.budget:
+                # 等到下一個整分鐘（伺服器視窗重置）
+                wall = self._wall()
+                self._blocked_until = max(self._blocked_until, now + (60.0 - wall % 60.0))
+                self.throttled += 1
+
+    def backoff(self, retry_after_s: float) -> None:
+        """收到 429 / 418：全部請求暫停 retry_after_s 秒。"""
+        with self._lock:
+            self._tokens = 0.0
+            self._blocked_until = max(self._blocked_until, self._clock() + max(0.0, float(retry_after_s)))
+            self.throttled += 1
+        log.warning("Binance 限流（429/418），暫停 %.1fs", retry_after_s)
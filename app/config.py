@@ -10,6 +10,11 @@ except Exception:
 @dataclass
 class Config:
     # ===== DB（固定走 SSH 隧道 → 127.0.0.1:3307）=====
+    # DB_BACKEND=sqlite：改用本機 SQLite（不開隧道），DB_SQLITE_PATH 為檔案路徑或 :memory:，
+    # 啟動時載入翻譯後的 DB_SQLITE_SCHEMA（空字串 = 預設的 schema_mysql.sql）
+    DB_BACKEND: str = os.getenv("DB_BACKEND", "mysql")
+    DB_SQLITE_PATH: str = os.getenv("DB_SQLITE_PATH", ":memory:")
+    DB_SQLITE_SCHEMA: str = os.getenv("DB_SQLITE_SCHEMA", "")
     DB_HOST: str = os.getenv("DB_HOST", "127.0.0.1")
     DB_PORT: int = int(os.getenv("DB_PORT", "3307"))
     DB_NAME: str = os.getenv("DB_NAME", "u327657097_autobot_db")
@@ -17,6 +22,17 @@ class Config:
     DB_PASS: str = os.getenv("DB_PASS", "")
     DB_CHARSET: str = os.getenv("DB_CHARSET", "utf8mb4")
     DB_COLLATION: str = os.getenv("DB_COLLATION", "utf8mb4_general_ci")
+    # 多列 INSERT 的封包上限（需小於伺服器 max_allowed_packet；預設保守 1MB）
+    DB_MAX_PACKET: int = int(os.getenv("DB_MAX_PACKET", str(1024 * 1024)))
+    DB_BULK_MAX_ROWS: int = int(os.getenv("DB_BULK_MAX_ROWS", "1000"))
+    # text() 解析結果 LRU 的容量（0 = 每次重新解析）；DB_PREPARED=1 時熱門讀取走預編譯語句（db.prepare）
+    DB_STMT_CACHE: int = int(os.getenv("DB_STMT_CACHE", "512"))
+    DB_PREPARED: bool = os.getenv("DB_PREPARED", "1").lower() in ("1", "true", "yes")
+    # 查詢統計（db.query_stats）：每個 SQL 指紋保留最近 DB_STATS_WINDOW 筆延遲算 p50/p95/p99
+    DB_STATS_ENABLED: bool = os.getenv("DB_STATS_ENABLED", "1").lower() in ("1", "true", "yes")
+    DB_STATS_WINDOW: int = int(os.getenv("DB_STATS_WINDOW", "1024"))
+    DB_STATS_DUMP_S: int = int(os.getenv("DB_STATS_DUMP_S", "300"))   # 寫入 db_query_stats 的週期；0 = 不寫
+    DB_SLOW_MS: float = float(os.getenv("DB_SLOW_MS", "500"))          # 超過即記 autobot.db.slow；0 = 關閉
 
     # ===== SSH（本機開隧道用；你原本 .env 已有）=====
     SSH_HOST: str = os.getenv("SSH_HOST", "")
@@ -28,10 +44,42 @@ class Config:
     BINANCE_API_KEY: str = os.getenv("BINANCE_API_KEY", "")
     BINANCE_API_SECRET: str = os.getenv("BINANCE_API_SECRET", "")
     BINANCE_BASE: str = os.getenv("BINANCE_BASE", "https://fapi.binance.com")
+    # REST 每分鐘權重預算（官方上限 2400，保留安全邊界）與 K 線並行抓取的執行緒數
+    BINANCE_WEIGHT_BUDGET: int = int(os.getenv("BINANCE_WEIGHT_BUDGET", "2000"))
+    COLLECTOR_WORKERS: int = int(os.getenv("COLLECTOR_WORKERS", "16"))
+    # WebSocket K 線串流（需 websocket-client；關閉時全走 REST 輪詢）
+    STREAM_ENABLED: bool = os.getenv("STREAM_ENABLED", "0").lower() in ("1", "true", "yes")
+    BINANCE_WS_BASE: str = os.getenv("BINANCE_WS_BASE", "wss://fstream.binance.com")
+    STREAM_FLUSH_MS: int = int(os.getenv("STREAM_FLUSH_MS", "200"))
+    # 15m/30m/1h/4h 改由 1m 在本機合成（app/data/resample.py）；冷啟與落後時仍走 REST
+    RESAMPLE_FROM_1M: bool = os.getenv("RESAMPLE_FROM_1M", "0").lower() in ("1", "true", "yes")
+
+    # ===== 行程內 K 線快取（app/data/candle_store.py）=====
+    CANDLE_STORE_ENABLED: bool = os.getenv("CANDLE_STORE_ENABLED", "1").lower() in ("1", "true", "yes")
+    CANDLE_STORE_BARS: int = int(os.getenv("CANDLE_STORE_BARS", "2048"))   # 每組保留根數
+    CANDLE_STORE_MB: float = float(os.getenv("CANDLE_STORE_MB", "64"))     # 全部序列的記憶體上限
+    CANDLE_STORE_DIR: str = os.getenv("CANDLE_STORE_DIR", "")              # 設定後以 .npy memmap 持久化
 
     # ===== Runtime =====
     TIMEZONE: str = os.getenv("TIMEZONE", "Asia/Taipei")
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    # 遙測表（job_progress / risk_journal / decisions_log）非同步批次寫入（app/reporter/writebehind.py）
+    WRITEBEHIND_ENABLED: bool = os.getenv("WRITEBEHIND_ENABLED", "1").lower() in ("1", "true", "yes")
+    WRITEBEHIND_FLUSH_MS: int = int(os.getenv("WRITEBEHIND_FLUSH_MS", "500"))
+    WRITEBEHIND_MAX: int = int(os.getenv("WRITEBEHIND_MAX", "5000"))        # 緩衝上限（筆）
+    WRITEBEHIND_BLOCK_MS: int = int(os.getenv("WRITEBEHIND_BLOCK_MS", "200"))  # 滿載時重要資料最多等待
+    # 啟動時自動套用 app/migrations 內未套用的 schema 遷移（關閉時請手動 python -m app.migrate）
+    MIGRATE_ON_START: bool = os.getenv("MIGRATE_ON_START", "1").lower() in ("1", "true", "yes")
+    # settings 快照多久檢查一次 updated_at（秒）；主迴圈每輪開頭另會強制檢查一次
+    SETTINGS_TTL_S: float = float(os.getenv("SETTINGS_TTL_S", "30"))
+    # 模板池快取多久檢查一次 template_registry_version（秒）
+    TEMPLATE_REGISTRY_TTL_S: float = float(os.getenv("TEMPLATE_REGISTRY_TTL_S", "5"))
+    # 動態進場門檻：每個 (symbol, interval) 保留最近 GAP_WINDOW 筆 gap；每 GAP_SNAPSHOT_S 秒寫一次快照（0 = 不寫）
+    GAP_WINDOW: int = int(os.getenv("GAP_WINDOW", "300"))
+    GAP_SNAPSHOT_S: int = int(os.getenv("GAP_SNAPSHOT_S", "300"))
+    # LinUCB 模板選擇（settings.bandit_mode='linucb'）：探索係數與 ridge 正則化 λ
+    LINUCB_ALPHA: float = float(os.getenv("LINUCB_ALPHA", "1.0"))
+    LINUCB_LAMBDA: float = float(os.getenv("LINUCB_LAMBDA", "1.0"))
 
     # ===== 週期對應策略（不破壞前端；可用 .env 覆蓋）=====
     FETCH_COLD_1M:  int = int(os.getenv("FETCH_COLD_1M", 200))
@@ -0,0 +1,54 @@
+# app/data/bar_gate.py
+"""
+收線閘門：每個 (symbol, interval) 只有在 candles 出現新的已收線 bar 時，
+才往下跑 features → policy → executor（1h 週期不再每分鐘重算、重寫 decisions_log）。
+
+依據為 collector 寫入後的最新 close_time（優先讀 candle_store，否則查 DB）；
+下游全部成功才 mark_done，失敗的 bar 下一輪會再跑一次。
+"""
+from __future__ import annotations
+import threading
+from typing import Dict, Optional, Tuple
+
+from . import candle_store
+from .collector import _last_candle_close_ms
+
+Key = Tuple[str, str]
+
+
+class BarGate:
+    def __init__(self) -> None:
+        self._done: Dict[Key, int] = {}
+        self._lock = threading.Lock()
+        self.ran = 0
+        self.skipped = 0
+
+    @staticmethod
+    def latest_close(symbol: str, interval: str) -> Optional[int]:
+        if candle_store.enabled():
+            last = candle_store.store().last(symbol, interval)
+            return last[0] if last else None
+        return _last_candle_close_ms(symbol, interval)
+
+    def check(self, symbol: str, interval: str) -> Tuple[bool, Optional[int]]:
+        """回傳 (是否要跑下游, 最新 close_time)；沒有新 bar（或還沒有任何 K 線）時為 False。"""
+        ct = self.latest_close(symbol, interval)
+        with self._lock:
+            if ct is None or self._done.get((symbol, interval)) == ct:
+                self.skipped += 1
+                return False, ct
+            self.ran += 1
+            return True, ct
+
+    def mark_done(self, symbol: str, interval: str, close_time: Optional[int]) -> None:
+        if close_time is None:
+            return
+        with self._lock:
+            self._done[(symbol, interval)] = int(close_time)
+
+    def forget(self, symbol: str, interval: str) -> None:
+        with self._lock:
+            self._done.pop((symbol, interval), None)
+
+
+gate = BarGate()
@@ -0,0 +1,324 @@
+# app/data/candle_store.py
+"""
+行程內 K 線快取（欄式 NumPy 環形緩衝），讓 features / executor / horizon 不必每根 bar 都經隧道讀 candles。
+
+- 每個 (symbol, interval) 一塊 float64 陣列 shape=(6, 2C)：列依序為 close_time, open, high, low, close, volume
+  （close_time 以 float64 存，毫秒時間戳 < 2^53 可精確表示）。
+- 雙倍長度寫法：第 k 根同時寫到 k%C 與 k%C + C，因此「最近 n 根（n<=C）」永遠是一段連續切片，
+  view() 回傳零拷貝視圖；之後最多再 append C-n 根之前，視圖內容不會被覆蓋（讀者不要長期持有視圖）。
+- 與 DB 同步：collector 寫入 candles 後呼叫 ingest()；未快取的 (symbol, interval) 第一次讀取時從 DB 載入最近 C 根。
+- 記憶體上限 CANDLE_STORE_MB（超過時 LRU 淘汰），retain(symbols) 淘汰已不在 settings.symbols_json 的幣。
+- CANDLE_STORE_DIR 有設定時改用 .npy memmap（np.lib.format.open_memmap），重啟可直接沿用；
+  載入時會以 DB 的 MAX(close_time) 驗證，不一致就從 DB 重建。
+"""
+from __future__ import annotations
+import os
+import json
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..db import exec
+from ..config import Config
+
+log = logging.getLogger("autobot")
+
+Key = Tuple[str, str]
+_FIELDS = ("close_time", "open", "high", "low", "close", "volume")
+
+
+class CandleView(NamedTuple):
+    close_time: np.ndarray
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+
+    @property
+    def n(self) -> int:
+        return int(self.close_time.shape[0])
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """轉成與 DB 查詢相同鍵名的 dict 列（close_time 為 int）。"""
+        cols = [c.tolist() for c in self]
+        return [{"close_time": int(ct), "open": o, "high": h, "low": l, "close": c, "volume": v}
+                for ct, o, h, l, c, v in zip(*cols)]
+
+
+class _Series:
+    def __init__(self, capacity: int, buf: Optional[np.ndarray] = None) -> None:
+        self.cap = int(capacity)
+        self.buf = buf if buf is not None else np.zeros((6, 2 * self.cap), dtype=np.float64)
+        self.count = 0          # 曾經 append 的總根數
+        self.complete = False   # True：快取內已含該序列在 DB 的全部歷史
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.buf.nbytes)
+
+    def size(self) -> int:
+        return min(self.count, self.cap)
+
+    def _span(self, n: int) -> Tuple[int, int]:
+        pos = (self.count - 1) % self.cap
+        return pos + 1 + self.cap - n, pos + 1 + self.cap
+
+    def view(self, n: Optional[int] = None) -> CandleView:
+        m = self.size() if n is None else max(0, min(int(n), self.size()))
+        if m == 0:
+            empty = self.buf[:, :0]
+            return CandleView(*empty)
+        a, b = self._span(m)
+        blk = self.buf[:, a:b]
+        return CandleView(*blk)
+
+    def last_ct(self) -> Optional[int]:
+        if self.count == 0:
+            return None
+        pos = (self.count - 1) % self.cap
+        return int(self.buf[0, pos])
+
+    def append(self, row: Sequence[float]) -> None:
+        pos = self.count % self.cap
+        self.buf[:, pos] = row
+        self.buf[:, pos + self.cap] = row
+        self.count += 1
+        if self.count > self.cap:
+            self.complete = False   # 環形緩衝開始覆寫最舊的 bar，快取不再含完整歷史
+
+    def put(self, row: Sequence[float]) -> bool:
+        """
+        寫入一根（row 依 _FIELDS 順序）；新 bar 追加、既有 close_time 就地覆寫。
+        比快取最舊還舊或落在中間缺口的 bar 無法放入，回 False（呼叫端會讓序列失效）。
+        """
+        ct = float(row[0])
+        last = self.last_ct()
+        if last is None or ct > last:
+            self.append(row)
+            return True
+        cts = self.view().close_time
+        j = int(np.searchsorted(cts, ct))
+        if j < cts.shape[0] and cts[j] == ct:
+            a, _ = self._span(self.size())
+            idx = (a + j) % self.cap
+            self.buf[:, idx] = row
+            self.buf[:, idx + self.cap] = row
+            return True
+        return False
+
+
+class CandleStore:
+    def __init__(self, capacity: Optional[int] = None, budget_mb: Optional[float] = None,
+                 directory: Optional[str] = None) -> None:
+        self.capacity = max(16, int(capacity if capacity is not None else getattr(Config, "CANDLE_STORE_BARS", 2048)))
+        mb = budget_mb if budget_mb is not None else getattr(Config, "CANDLE_STORE_MB", 64)
+        self.budget = int(float(mb) * 1024 * 1024)
+        d = directory if directory is not None else getattr(Config, "CANDLE_STORE_DIR", "")
+        self.directory = d or None
+        self._series: "OrderedDict[Key, _Series]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.stats = {"hits": 0, "loads": 0, "evictions": 0, "invalidations": 0}
+
+    # ---------- 內部 ----------
+
+    def _path(self, key: Key) -> str:
+        return os.path.join(self.directory or ".", f"{key[0]}_{key[1]}.npy")
+
+    def _save_meta(self, key: Key, s: _Series) -> None:
+        if not self.directory:
+            return
+        try:
+            with open(self._path(key) + ".json", "w", encoding="utf-8") as fh:
+                json.dump({"count": s.count, "complete": s.complete, "cap": s.cap}, fh)
+        except Exception as e:
+            log.debug("candle_store meta 寫入失敗：%s %s", key, e)
+
+    def _new_series(self, key: Key) -> _Series:
+        if not self.directory:
+            return _Series(self.capacity)
+        os.makedirs(self.directory, exist_ok=True)
+        mm = np.lib.format.open_memmap(self._path(key), mode="w+", dtype=np.float64,
+                                       shape=(6, 2 * self.capacity))
+        return _Series(self.capacity, mm)
+
+    def _open_memmap(self, key: Key) -> Optional[_Series]:
+        if not self.directory:
+            return None
+        p = self._path(key)
+        if not (os.path.exists(p) and os.path.exists(p + ".json")):
+            return None
+        try:
+            with open(p + ".json", encoding="utf-8") as fh:
+                meta = json.load(fh)
+            if int(meta.get("cap", 0)) != self.capacity:
+                return None
+            mm = np.lib.format.open_memmap(p, mode="r+")
+            s = _Series(self.capacity, mm)
+            s.count = int(meta.get("count", 0))
+            s.complete = bool(meta.get("complete", False))
+        except Exception as e:
+            log.info("candle_store memmap 讀取失敗，改由 DB 重建：%s %s", key, e)
+            return None
+        db_last = exec("SELECT MAX(close_time) FROM candles WHERE symbol=:s AND `interval`=:i",
+                       s=key[0], i=key[1]).scalar()
+        if s.count == 0 or db_last is None or int(db_last) != s.last_ct():
+            return None
+        return s
+
+    def _load(self, key: Key) -> _Series:
+        s = self._open_memmap(key)
+        if s is None:
+            rows = exec(
+                """
+                SELECT close_time, open, high, low, close, volume
+                FROM candles
+                WHERE symbol=:s AND `interval`=:i
+                ORDER BY close_time DESC
+                LIMIT :n
+                """,
+                s=key[0], i=key[1], n=self.capacity
+            ).all()
+            s = self._new_series(key)
+            for r in reversed(list(rows or [])):
+                s.append([float(x) for x in r])
+            s.complete = len(rows or []) < self.capacity
+            self._save_meta(key, s)
+        self.stats["loads"] += 1
+        self._series[key] = s
+        self._enforce_budget(keep=key)
+        return s
+
+    def _get(self, key: Key, load: bool = True) -> Optional[_Series]:
+        s = self._series.get(key)
+        if s is not None:
+            self._series.move_to_end(key)
+            self.stats["hits"] += 1
+            return s
+        return self._load(key) if load else None
+
+    def _drop(self, key: Key, *, remove_files: bool = False) -> None:
+        s = self._series.pop(key, None)
+        if s is not None and isinstance(s.buf, np.memmap):
+            try:
+                s.buf.flush()
+            except Exception:
+                pass
+        if remove_files and self.directory:
+            for p in (self._path(key), self._path(key) + ".json"):
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+
+    def _enforce_budget(self, keep: Optional[Key] = None) -> None:
+        while self._series and self.nbytes() > self.budget:
+            victim = next((k for k in self._series if k != keep), None)
+            if victim is None:
+                break
+            self._drop(victim)
+            self.stats["evictions"] += 1
+
+    # ---------- 對外 ----------
+
+    def nbytes(self) -> int:
+        return sum(s.nbytes for s in self._series.values())
+
+    def ingest(self, symbol: str, interval: str, rows: Iterable[Sequence[Any]]) -> None:
+        """
+        collector 寫入 candles 後同步快取；rows 為 (open_time, o, h, l, c, v, close_time)。
+        未快取的序列不處理（下次讀取時從 DB 載入）。
+        """
+        key = (symbol, interval)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                return
+            for (_ot, o, h, l, c, v, ct) in sorted(rows, key=lambda r: int(r[6])):
+                if not s.put((float(ct), float(o), float(h), float(l), float(c), float(v))):
+                    # 寫到快取視窗之外（補舊資料）→ 快取不再連續，整段失效
+                    self._drop(key)
+                    self.stats["invalidations"] += 1
+                    return
+            self._save_meta(key, s)
+
+    def view(self, symbol: str, interval: str, n: Optional[int] = None) -> CandleView:
+        """最近 n 根（ASC）的零拷貝視圖；n=None 取快取內全部。"""
+        with self._lock:
+            return self._get((symbol, interval)).view(n)
+
+    def covers(self, symbol: str, interval: str, since_ct: int) -> bool:
+        """快取是否含 close_time >= since_ct 的全部 bar（與 DB 相同）。"""
+        with self._lock:
+            s = self._get((symbol, interval))
+            if s.complete:
+                return True
+            cts = s.view().close_time
+            return cts.shape[0] > 0 and cts[0] <= since_ct
+
+    def since(self, symbol: str, interval: str, ct: int, *, inclusive: bool = True,
+              until: Optional[int] = None) -> Optional[CandleView]:
+        """close_time >= ct（或 > ct）且 <= until 的視圖；快取無法完整涵蓋時回 None（呼叫端改查 DB）。"""
+        with self._lock:
+            s = self._get((symbol, interval))
+            v = s.view()
+            cts = v.close_time
+            if not s.complete and (cts.shape[0] == 0 or cts[0] > ct):
+                return None
+            a = int(np.searchsorted(cts, ct, side="left" if inclusive else "right"))
+            b = cts.shape[0] if until is None else int(np.searchsorted(cts, until, side="right"))
+            return CandleView(*(c[a:max(a, b)] for c in v))
+
+    def before(self, symbol: str, interval: str, ct: int, n: int) -> Optional[CandleView]:
+        """close_time <= ct 的最後 n 根；快取內不足 n 根且非完整歷史時回 None。"""
+        with self._lock:
+            s = self._get((symbol, interval))
+            v = s.view()
+            b = int(np.searchsorted(v.close_time, ct, side="right"))
+            a = max(0, b - int(n))
+            if b - a < int(n) and not s.complete:
+                return None
+            return CandleView(*(c[a:b] for c in v))
+
+    def last(self, symbol: str, interval: str) -> Optional[Tuple[int, float]]:
+        """(close_time, close) of 最新一根。"""
+        with self._lock:
+            s = self._get((symbol, interval))
+            if s.count == 0:
+                return None
+            pos = (s.count - 1) % s.cap
+            return int(s.buf[0, pos]), float(s.buf[4, pos])
+
+    def retain(self, symbols: Iterable[str]) -> int:
+        """淘汰不在 symbols 內的序列（含 memmap 檔）；回傳淘汰數。"""
+        keep = set(symbols)
+        with self._lock:
+            victims = [k for k in self._series if k[0] not in keep]
+            for k in victims:
+                self._drop(k, remove_files=True)
+            self.stats["evictions"] += len(victims)
+            return len(victims)
+
+    def invalidate(self, symbol: str, interval: str) -> None:
+        with self._lock:
+            self._drop((symbol, interval))
+
+
+_store: Optional[CandleStore] = None
+_store_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return bool(getattr(Config, "CANDLE_STORE_ENABLED", True))
+
+
+def store() -> CandleStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = CandleStore()
+    return _store
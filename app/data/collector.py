@@ -1,13 +1,18 @@
 # app/data/collector.py
 from __future__ import annotations
 import time
-from typing import Any, Dict, List, Optional, Tuple
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 import logging
 import math
 import requests
+from requests.adapters import HTTPAdapter
 
-from ..db import exec
+from ..db import exec, bulk_upsert, prepare
 from ..config import Config
+from ..binance.ratelimit import WeightLimiter, klines_weight
+from . import candle_store
 
 log = logging.getLogger("autobot")
 
@@ -16,6 +21,24 @@ BINANCE_BASE = getattr(Config, "BINANCE_BASE", "https://fapi.binance.com").rstri
 # Binance 單次最大根數（期貨 K 線可到 1500；保守取 1000 也足夠）
 MAX_LIMIT = 1000
 
+# 所有 K 線請求共用一個連線池與權重限流器（多執行緒安全）
+_http: Optional[requests.Session] = None
+_http_lock = threading.Lock()
+limiter = WeightLimiter(int(getattr(Config, "BINANCE_WEIGHT_BUDGET", 2000)))
+
+def _session() -> requests.Session:
+    global _http
+    if _http is None:
+        with _http_lock:
+            if _http is None:
+                n = max(4, int(getattr(Config, "COLLECTOR_WORKERS", 16)))
+                sess = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=n)
+                sess.mount("https://", adapter)
+                sess.mount("http://", adapter)
+                _http = sess
+    return _http
+
 # 依據 interval 轉換毫秒
 def _interval_ms(interval: str) -> int:
     s = (interval or "").lower().strip()
@@ -30,18 +53,20 @@ def _now_close_ms(interval_ms: int) -> int:
     now_ms = int(time.time() * 1000)
     return (now_ms // interval_ms) * interval_ms - 1
 
+_Q_LAST_CANDLE_CT = prepare("SELECT MAX(close_time) AS mx FROM candles WHERE symbol=:s AND `interval`=:i")
+
+
 def _last_candle_close_ms(symbol: str, interval: str) -> Optional[int]:
-    row = exec(
-        "SELECT MAX(close_time) AS mx FROM candles WHERE symbol=:s AND `interval`=:i",
-        s=symbol, i=interval
-    ).mappings().first()
+    row = _Q_LAST_CANDLE_CT(s=symbol, i=interval).mappings().first()
     mx = row and row.get("mx")
     return int(mx) if mx is not None else None
 
-def _insert_candles(symbol: str, interval: str, rows: List[Tuple[int,float,float,float,float,float,int]]) -> int:
+_CANDLE_COLS = ("symbol", "interval", "open_time", "open", "high", "low", "close", "volume", "close_time")
+_CANDLE_UPD = ("open", "high", "low", "close", "volume")
+
+def _insert_candles_loop(symbol: str, interval: str, rows: List[Tuple[int,float,float,float,float,float,int]]) -> int:
     """
-    rows: list of (open_time, open, high, low, close, volume, close_time)
-    回傳實際 upsert 的筆數（新寫/覆寫都算 1）。
+    舊版逐筆 upsert（每筆一次 round trip）；僅保留給 benchmark 對照用。
     """
     if not rows:
         return 0
@@ -68,6 +93,40 @@ def _insert_candles(symbol: str, interval: str, rows: List[Tuple[int,float,float
         wrote += 1
     return wrote
 
+def upsert_candles_bulk(symbol: str, interval: str,
+                        rows: List[Tuple[int,float,float,float,float,float,int]]) -> Dict[str, int]:
+    """
+    一頁 K 線以多列 INSERT ... ON DUPLICATE KEY UPDATE 寫入（依封包大小自動分塊）。
+    rows: list of (open_time, open, high, low, close, volume, close_time)
+    回傳 {"inserted": 新寫入筆數, "updated": 覆寫既有筆數}。
+    既有筆數以同區間 close_time 計數得出（Binance 一頁為連續 K 線，區間內既有列必屬本頁）。
+    """
+    if not rows:
+        return {"inserted": 0, "updated": 0}
+    cts = [int(r[6]) for r in rows]
+    existing = exec(
+        "SELECT COUNT(*) FROM candles WHERE symbol=:s AND `interval`=:i AND close_time BETWEEN :a AND :b",
+        s=symbol, i=interval, a=min(cts), b=max(cts)
+    ).scalar()
+    existing = min(int(existing or 0), len(rows))
+    bulk_upsert(
+        "candles", _CANDLE_COLS,
+        [(symbol, interval, int(ot), float(o), float(h), float(l), float(c), float(v), int(ct))
+         for (ot, o, h, l, c, v, ct) in rows],
+        update_columns=_CANDLE_UPD,
+    )
+    if candle_store.enabled():
+        candle_store.store().ingest(symbol, interval, rows)
+    return {"inserted": len(rows) - existing, "updated": existing}
+
+def _insert_candles(symbol: str, interval: str, rows: List[Tuple[int,float,float,float,float,float,int]]) -> int:
+    """
+    rows: list of (open_time, open, high, low, close, volume, close_time)
+    回傳實際 upsert 的筆數（新寫/覆寫都算 1）。
+    """
+    st = upsert_candles_bulk(symbol, interval, rows)
+    return st["inserted"] + st["updated"]
+
 def _fetch_binance_klines(symbol: str, interval: str, start_ms: Optional[int], end_ms: Optional[int], limit: int) -> List[list]:
     """
     呼叫 Binance 期貨 K 線 /fapi/v1/klines
@@ -84,7 +143,18 @@ def _fetch_binance_klines(symbol: str, interval: str, start_ms: Optional[int], e
         params["endTime"] = int(end_ms)
 
     url = f"{BINANCE_BASE}/fapi/v1/klines"
-    resp = requests.get(url, params=params, timeout=10)
+    for attempt in range(4):
+        limiter.acquire(klines_weight(limit))
+        resp = _session().get(url, params=params, timeout=10)
+        limiter.observe(resp.headers)
+        if resp.status_code in (429, 418) and attempt < 3:
+            try:
+                retry_after = float(resp.headers.get("Retry-After") or 1.0)
+            except ValueError:
+                retry_after = 1.0
+            limiter.backoff(retry_after)
+            continue
+        break
     resp.raise_for_status()
     data = resp.json()
     if not isinstance(data, list):
@@ -143,11 +213,13 @@ def fetch_klines_to_db(symbol: str, interval: str) -> int:
         if not parsed:
             break
 
-        wrote = _insert_candles(symbol, interval, parsed)
+        st = upsert_candles_bulk(symbol, interval, parsed)
+        wrote = st["inserted"] + st["updated"]
         if wrote > 0:
             wrote_total += wrote
             ct_min = parsed[0][6]; ct_max = parsed[-1][6]
-            log.info("寫入 candles：%s %s wrote=%d range=[%d,%d]", symbol, interval, wrote, ct_min, ct_max)
+            log.info("寫入 candles：%s %s wrote=%d (inserted=%d updated=%d) range=[%d,%d]",
+                     symbol, interval, wrote, st["inserted"], st["updated"], ct_min, ct_max)
             # 下一輪從最後一筆之後繼續
             start_ms = ct_max + 1
             # 更新 remain：以實際寫入根數遞減，避免上游重疊
@@ -155,11 +227,32 @@ def fetch_klines_to_db(symbol: str, interval: str) -> int:
         else:
             break  # 沒寫入 → 代表都重覆了
 
-        # Binance 速率保守一點
-        time.sleep(0.2)
-
     if wrote_total == 0:
         log.warning("collector wrote 0 rows: %s %s", symbol, interval)
     else:
         log.info("collector wrote: %s %s = %d rows", symbol, interval, wrote_total)
     return wrote_total
+
+def _run_pairs(fn, pairs: Iterable[Tuple[str, str]], workers: Optional[int] = None) -> Dict[Tuple[str, str], Any]:
+    """以執行緒池對每組 (symbol, interval) 呼叫 fn(symbol, interval)；例外收進結果不外拋。"""
+    todo = list(dict.fromkeys(pairs))
+    if not todo:
+        return {}
+    n = max(1, min(int(workers or getattr(Config, "COLLECTOR_WORKERS", 16)), len(todo)))
+    out: Dict[Tuple[str, str], Any] = {}
+    with ThreadPoolExecutor(max_workers=n, thread_name_prefix="collector") as pool:
+        futs = {pool.submit(fn, s, i): (s, i) for (s, i) in todo}
+        for fut, key in futs.items():
+            try:
+                out[key] = fut.result()
+            except Exception as e:
+                log.warning("collector 失敗：%s %s | %s", key[0], key[1], e)
+                out[key] = e
+    return out
+
+def fetch_klines_many(pairs: Iterable[Tuple[str, str]], *, workers: Optional[int] = None) -> Dict[Tuple[str, str], Any]:
+    """
+    並行補齊多組 (symbol, interval)；共用連線池，由 limiter 依權重節流（取代逐組的固定 sleep）。
+    回傳 {(symbol, interval): 寫入筆數 或 Exception}（單組失敗不影響其他組）。
+    """
+    return _run_pairs(fetch_klines_to_db, pairs, workers)
@@ -1,9 +1,20 @@
 # app/data/features.py
 from __future__ import annotations
 import math
+import logging
+from collections import OrderedDict
 from typing import List, Dict, Any, Tuple, Optional
-from ..db import exec
+import numpy as np
+
+from ..db import exec, bulk_upsert, prepare
 from ..config import Config
+from . import indicators as ind
+from .rolling import rolling_min, rolling_max
+from . import indicator_state as istate
+from . import candle_store
+from .candle_store import CandleView
+
+log = logging.getLogger("autobot")
 
 # ---------- 指標工具 ----------
 
@@ -74,20 +85,14 @@ def _macd(values: List[float], fast: int = 12, slow: int = 26, signal: int = 9
             hist.append(d - e)
     return dif, dea, hist
 
-def _rolling_min(arr: List[float], window: int, i: int) -> float:
-    j = max(0, i - window + 1)
-    return min(arr[j:i+1])
-
-def _rolling_max(arr: List[float], window: int, i: int) -> float:
-    j = max(0, i - window + 1)
-    return max(arr[j:i+1])
-
 def _kdj(high: List[float], low: List[float], close: List[float], n: int = 9, k_smooth: int = 3, d_smooth: int = 3
         ) -> Tuple[List[Optional[float]], List[Optional[float]], List[Optional[float]]]:
     rsv: List[Optional[float]] = [None] * len(close)
+    lows = rolling_min(low, n)
+    highs = rolling_max(high, n)
     for i in range(len(close)):
-        ll = _rolling_min(low, n, i)
-        hh = _rolling_max(high, n, i)
+        ll = lows[i]
+        hh = highs[i]
         denom = (hh - ll)
         if denom == 0:
             rsv[i] = 50.0
@@ -162,11 +167,11 @@ def _finite(x: Optional[float], default: float = 0.0) -> float:
 
 # ---------- DB 讀寫 ----------
 
+_Q_LAST_FEATURES_CT = prepare("SELECT MAX(close_time) AS mx FROM features WHERE symbol=:s AND `interval`=:i")
+
+
 def _fetch_last_features_ct(symbol: str, interval: str) -> Optional[int]:
-    row = exec(
-        "SELECT MAX(close_time) AS mx FROM features WHERE symbol=:s AND `interval`=:i",
-        s=symbol, i=interval
-    ).mappings().first()
+    row = _Q_LAST_FEATURES_CT(s=symbol, i=interval).mappings().first()
     if not row: return None
     mx = row.get("mx")
     return int(mx) if mx is not None else None
@@ -174,12 +179,17 @@ def _fetch_last_features_ct(symbol: str, interval: str) -> Optional[int]:
 def _fetch_candles_for_increment(symbol: str, interval: str, last_ft: Optional[int], warmup: int
                                 ) -> List[Dict[str, Any]]:
     """
-    取自 last_ft 往前 warmup 根（用於指標暖機），直到最新。
+    取 last_ft 之後的新 K 線，並往前補 warmup 根（用於指標暖機）。
     若 last_ft 為 None，則抓 lookback + warmup 根。
     """
+    cs = candle_store.store() if candle_store.enabled() else None
     if last_ft is None:
         # 沒算過特徵：抓 lookback + warmup
         need = int(Config.policy(interval)["lookback"]) + warmup
+        if cs is not None:
+            v = cs.view(symbol, interval, need)
+            if v.n >= need or cs.covers(symbol, interval, 0):
+                return v.rows()
         rows = exec(
             """
             SELECT close_time, open, high, low, close, volume
@@ -190,140 +200,173 @@ def _fetch_candles_for_increment(symbol: str, interval: str, last_ft: Optional[i
             """,
             s=symbol, i=interval, n=need
         ).mappings().all()
-    else:
-        rows = exec(
-            """
-            SELECT close_time, open, high, low, close, volume
-            FROM candles
-            WHERE symbol=:s AND `interval`=:i
-              AND close_time >= :from_ct
-            ORDER BY close_time ASC
-            """,
-            s=symbol, i=interval, from_ct=max(0, last_ft - 10_000_000_000)  # 保守，不靠毫秒算，改抓區段後面再裁切
-        ).mappings().all()
-    rows = list(rows or [])
-    # 轉成時間序（ASC）
-    rows.sort(key=lambda r: int(r["close_time"]))
-    if last_ft is not None and rows:
-        # 往前補 warmup
-        head = exec(
-            """
-            SELECT close_time, open, high, low, close, volume
-            FROM candles
-            WHERE symbol=:s AND `interval`=:i AND close_time < :from_ct
-            ORDER BY close_time DESC
-            LIMIT :n
-            """,
-            s=symbol, i=interval, from_ct=rows[0]["close_time"], n=warmup
-        ).mappings().all()
-        rows = list(reversed(list(head or []))) + rows
-    return rows
+        rows = list(rows or [])
+        rows.reverse()  # 轉成時間序（ASC）
+        return rows
+
+    if cs is not None:
+        new = cs.since(symbol, interval, int(last_ft), inclusive=False)
+        if new is not None:
+            if new.n == 0:
+                return []
+            head = cs.before(symbol, interval, int(last_ft), warmup)
+            if head is not None:
+                return head.rows() + new.rows()
+
+    rows = list(exec(
+        """
+        SELECT close_time, open, high, low, close, volume
+        FROM candles
+        WHERE symbol=:s AND `interval`=:i
+          AND close_time > :ft
+        ORDER BY close_time ASC
+        """,
+        s=symbol, i=interval, ft=int(last_ft)
+    ).mappings().all() or [])
+    if not rows:
+        return []
+    # 往前補 warmup（只讀 last_ft 之前的 warmup 根，不再掃整段歷史）
+    head = exec(
+        """
+        SELECT close_time, open, high, low, close, volume
+        FROM candles
+        WHERE symbol=:s AND `interval`=:i AND close_time <= :ft
+        ORDER BY close_time DESC
+        LIMIT :n
+        """,
+        s=symbol, i=interval, ft=int(last_ft), n=warmup
+    ).mappings().all()
+    return list(reversed(list(head or []))) + rows
+
+def _fetch_candles_since_state(symbol: str, interval: str, state_ct: int, limit: int) -> List[Dict[str, Any]]:
+    """增量用：讀狀態最後一根（校驗用）與之後的新 K 線。"""
+    if candle_store.enabled():
+        v = candle_store.store().since(symbol, interval, int(state_ct))
+        if v is not None:
+            return CandleView(*(c[:int(limit)] for c in v)).rows()
+    rows = exec(
+        """
+        SELECT close_time, open, high, low, close, volume
+        FROM candles
+        WHERE symbol=:s AND `interval`=:i AND close_time >= :ct
+        ORDER BY close_time ASC
+        LIMIT :n
+        """,
+        s=symbol, i=interval, ct=int(state_ct), n=int(limit)
+    ).mappings().all()
+    return list(rows or [])
+
+_FEAT_COLS = ("symbol", "interval", "close_time",
+              "rsi", "macd_dif", "macd_dea", "macd_hist",
+              "k", "d", "kd_diff", "vol_ratio", "atr_pct", "slope", "range_pct", "regime")
+_FEAT_UPD = _FEAT_COLS[3:]
+
+# 最近寫入過的特徵值：(symbol, interval) -> {close_time: 值 tuple}；用來略過內容沒變的重寫
+_WRITTEN_KEEP = 2048
+_written: Dict[Tuple[str, str], "OrderedDict[int, Tuple[Any, ...]]"] = {}
 
 def _upsert_features_batch(symbol: str, interval: str, feats: List[Dict[str, Any]]) -> int:
-    """逐筆 upsert；回傳實際處理筆數（新寫/覆寫都算 1）。"""
-    if not feats: return 0
-    sql = """
-    INSERT INTO features(
-      symbol, `interval`, close_time,
-      rsi, macd_dif, macd_dea, macd_hist,
-      k, d, kd_diff, vol_ratio, atr_pct, slope, range_pct, regime
-    ) VALUES (
-      :symbol, :interval, :close_time,
-      :rsi, :macd_dif, :macd_dea, :macd_hist,
-      :k, :d, :kd_diff, :vol_ratio, :atr_pct, :slope, :range_pct, :regime
-    )
-    ON DUPLICATE KEY UPDATE
-      rsi=VALUES(rsi),
-      macd_dif=VALUES(macd_dif),
-      macd_dea=VALUES(macd_dea),
-      macd_hist=VALUES(macd_hist),
-      k=VALUES(k),
-      d=VALUES(d),
-      kd_diff=VALUES(kd_diff),
-      vol_ratio=VALUES(vol_ratio),
-      atr_pct=VALUES(atr_pct),
-      slope=VALUES(slope),
-      range_pct=VALUES(range_pct),
-      regime=VALUES(regime)
     """
-    wrote = 0
+    多列 VALUES 批次 upsert（同一交易、一次 COMMIT）；
+    與上次寫入內容完全相同的列直接略過。回傳實際送出的筆數。
+    """
+    if not feats: return 0
+    seen = _written.setdefault((symbol, interval), OrderedDict())
+    rows: List[Tuple[Any, ...]] = []
+    keys: List[Tuple[int, Tuple[Any, ...]]] = []
     for r in feats:
-        exec(sql, **r)
-        wrote += 1
-    return wrote
+        ct = int(r["close_time"])
+        vals = tuple(r[c] for c in _FEAT_UPD)
+        if seen.get(ct) == vals:
+            continue
+        rows.append((symbol, interval, ct) + vals)
+        keys.append((ct, vals))
+    if not rows:
+        return 0
+
+    bulk_upsert("features", _FEAT_COLS, rows, update_columns=_FEAT_UPD, single_tx=True)
+
+    # 交易成功後才記錄
+    for ct, vals in keys:
+        seen[ct] = vals
+        seen.move_to_end(ct)
+    while len(seen) > _WRITTEN_KEEP:
+        seen.popitem(last=False)
+    return len(rows)
 
 # ---------- 對外 API ----------
 
-def compute_and_store_features(symbol: str, interval: str) -> int:
+def _compute_incremental(symbol: str, interval: str, st: istate.IndicatorState, warmup: int) -> Optional[int]:
     """
-    增量計算：
-    只寫入 close_time > last_features_close_time 的 bar。
-    回傳本輪實際寫入的筆數。
+    以持久化狀態做 O(1)/bar 的增量計算。
+    回傳寫入筆數；狀態失效（校驗和不符、缺口過大）時回 None，由呼叫端改走完整重算。
     """
-    warmup = 200  # 讓 MACD/KDJ/ATR 有夠長的緩衝
+    limit = int(Config.policy(interval)["lookback"]) + warmup
+    rows = _fetch_candles_since_state(symbol, interval, int(st.close_time or 0), limit + 1)
+    if not rows or int(rows[0]["close_time"]) != st.close_time \
+            or istate.candle_checksum(rows[0]) != st.anchor:
+        log.info("indicator_state 失效（錨點 K 線不存在或已被覆寫），改走完整重算：%s %s", symbol, interval)
+        istate.drop(symbol, interval)
+        return None
+    if len(rows) > limit:
+        # 缺口比 lookback 還大：完整重算比逐根追趕更省
+        istate.drop(symbol, interval)
+        return None
+    new_rows = rows[1:]
+    if not new_rows:
+        return 0
+
+    work = st.clone()  # 寫入成功才替換狀態
+    feats: List[Dict[str, Any]] = []
+    for r in new_rows:
+        f = work.update(r)
+        f["symbol"] = symbol
+        f["interval"] = interval
+        feats.append(f)
+    wrote = _upsert_features_batch(symbol, interval, feats)
+    istate.save(symbol, interval, work)
+    return wrote
+
+def _compute_full(symbol: str, interval: str, warmup: int) -> int:
+    """完整重算（冷啟或狀態失效）：NumPy 向量化計算，並順便重建指標狀態。"""
     last_ft = _fetch_last_features_ct(symbol, interval)
     candles = _fetch_candles_for_increment(symbol, interval, last_ft, warmup)
     if not candles or len(candles) < 5:
         return 0
 
-    # 準備序列
-    ct  = [int(r["close_time"]) for r in candles]
-    op  = [float(r["open"])  for r in candles]
-    hi  = [float(r["high"])  for r in candles]
-    lo  = [float(r["low"])   for r in candles]
-    cl  = [float(r["close"]) for r in candles]
-    vol = [float(r["volume"]) for r in candles]
-
-    rsi = _rsi(cl, 14)
-    macd_dif, macd_dea, macd_hist = _macd(cl, 12, 26, 9)
-    k, d, kd_diff = _kdj(hi, lo, cl, 9, 3, 3)
-    atr = _atr(hi, lo, cl, 14)
-    vol_ema20 = _ema_series(vol, 20)
-    slope10 = _linreg_slope(cl, 10)
+    # 準備序列（NumPy 向量化；純 Python 版 _rsi/_macd/... 保留作為對照基準）
+    ct  = np.fromiter((int(r["close_time"]) for r in candles), dtype=np.int64, count=len(candles))
+    hi  = np.fromiter((float(r["high"])  for r in candles), dtype=np.float64, count=len(candles))
+    lo  = np.fromiter((float(r["low"])   for r in candles), dtype=np.float64, count=len(candles))
+    cl  = np.fromiter((float(r["close"]) for r in candles), dtype=np.float64, count=len(candles))
+    vol = np.fromiter((float(r["volume"]) for r in candles), dtype=np.float64, count=len(candles))
 
-    feats: List[Dict[str, Any]] = []
+    cols = ind.compute_feature_columns(hi, lo, cl, vol)
+
+    # 只輸出「新 bar」
     last_cut = last_ft if last_ft is not None else -1
-    for i in range(len(ct)):
-        # 只輸出「新 bar」
-        if ct[i] <= last_cut:
-            continue
-        close_val = cl[i]
-        atr_pct = _finite(atr[i], 0.0) / (close_val if close_val != 0 else 1.0)
-        vr = 0.0
-        if vol_ema20[i] is not None and vol_ema20[i] != 0:
-            vr = vol[i] / vol_ema20[i]
-        range_pct = (hi[i] - lo[i]) / (close_val if close_val != 0 else 1.0)
-        regime = 1 if _finite(macd_hist[i], 0.0) >= 0 else -1
-
-        feats.append({
-            "symbol": symbol,
-            "interval": interval,
-            "close_time": ct[i],
-            "rsi": _finite(rsi[i], 50.0),
-            "macd_dif": _finite(macd_dif[i], 0.0),
-            "macd_dea": _finite(macd_dea[i], 0.0),
-            "macd_hist": _finite(macd_hist[i], 0.0),
-            "k": _finite(k[i], 50.0),
-            "d": _finite(d[i], 50.0),
-            "kd_diff": _finite(kd_diff[i], 0.0),
-            "vol_ratio": _finite(vr, 1.0),
-            "atr_pct": _finite(atr_pct, 0.0),
-            "slope": _finite(slope10[i], 0.0),
-            "range_pct": _finite(range_pct, 0.0),
-            "regime": regime,
-        })
+    start = int(np.searchsorted(ct, last_cut, side="right"))
+    feats = ind.feature_rows(symbol, interval, ct, cols, start=start)
 
     wrote = _upsert_features_batch(symbol, interval, feats)
-    # 記錄摘要（模仿你原本的 log 風格）
-    if wrote > 0:
-        try:
-            ct_min = ct[0]
-            ct_max = ct[-1]
-            raw = len(ct)
-            use = wrote
-            drop = raw - use if raw >= use else 0
-            from .. import db as _db  # 只為了記錄樣式一致，不產生環狀匯入
-            _db.log = _db.log if hasattr(_db, "log") else None  # 容錯
-        except Exception:
-            pass
+    # 用同一段視窗重建狀態，之後每根只需增量更新
+    try:
+        istate.save(symbol, interval, istate.IndicatorState.replay(candles))
+    except Exception as e:
+        log.warning("indicator_state 儲存失敗（下輪仍走完整重算）：%s %s | %s", symbol, interval, e)
     return wrote
+
+def compute_and_store_features(symbol: str, interval: str) -> int:
+    """
+    增量計算：
+    只寫入 close_time > last_features_close_time 的 bar。
+    有指標狀態時每根 O(1) 更新；狀態缺失或失效時退回完整重算。
+    回傳本輪實際寫入的筆數。
+    """
+    warmup = 200  # 讓 MACD/KDJ/ATR 有夠長的緩衝
+    st = istate.load(symbol, interval)
+    if st is not None:
+        wrote = _compute_incremental(symbol, interval, st, warmup)
+        if wrote is not None:
+            return wrote
+    return _compute_full(symbol, interval, warmup)
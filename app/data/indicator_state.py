@@ -0,0 +1,299 @@
+# app/data/indicator_state.py
+"""
+每個 (symbol, interval) 的指標狀態：有了它，新增一根 bar 只要 O(1) 運算，
+不必每輪重讀 200 根暖機 K 線再從頭算 RSI/MACD/ATR/KDJ。
+
+狀態內容：
+- EMA：ema12 / ema26 / dea(9) / 量能 ema20
+- Wilder：RSI 的 avg_gain / avg_loss、ATR（含種子期累加）
+- KDJ：最近 9 根高低點、最近 3 根 RSV 與 3 根 K
+- 斜率：最近 10 根收盤與 Σy、Σxy 的滾動和
+
+持久化到 indicator_state 表；anchor_sum 為「狀態最後一根 K 線」的校驗和，
+K 線被覆寫（內容改變）、狀態版本不符或缺狀態時，由呼叫端退回完整重算。
+"""
+from __future__ import annotations
+from collections import deque
+from typing import Any, Deque, Dict, Mapping, Optional, Sequence, Tuple
+import hashlib
+import json
+import logging
+import math
+
+from ..db import exec
+from .rolling import RollingMinMax
+
+log = logging.getLogger("autobot")
+
+# 狀態格式版本：欄位或演算法有變就 +1，舊狀態會自動失效
+STATE_VERSION = 1
+
+# 參數與 compute_and_store_features 一致
+_RSI_P = 14
+_ATR_P = 14
+_EMA_FAST, _EMA_SLOW, _EMA_SIG = 12, 26, 9
+_VOL_EMA = 20
+_KDJ_N, _K_SMOOTH, _D_SMOOTH = 9, 3, 3
+_SLOPE_WIN = 10
+_SLOPE_RESYNC = 1000  # 每 N 次更新用視窗原值重算一次滾動和，避免浮點累積誤差
+
+# 行程內快取：避免每輪都讀狀態表
+_cache: Dict[Tuple[str, str], "IndicatorState"] = {}
+
+
+def candle_checksum(row: Mapping[str, Any]) -> str:
+    """單根 K 線的校驗和（close_time + OHLCV）。"""
+    s = "|".join([
+        str(int(row["close_time"])),
+        repr(float(row["open"])), repr(float(row["high"])), repr(float(row["low"])),
+        repr(float(row["close"])), repr(float(row["volume"])),
+    ])
+    return hashlib.sha1(s.encode("utf-8")).hexdigest()
+
+
+def _ema_step(prev: Optional[float], x: float, period: int) -> float:
+    if prev is None or period <= 1:
+        return float(x)
+    alpha = 2.0 / (period + 1.0)
+    return alpha * x + (1 - alpha) * prev
+
+
+def _fin(x: Optional[float], default: float) -> float:
+    if x is None or math.isnan(x) or math.isinf(x):
+        return default
+    return float(x)
+
+
+class IndicatorState:
+    def __init__(self) -> None:
+        self.n = 0
+        self.close_time: Optional[int] = None
+        self.anchor: str = ""
+        self.prev_close: Optional[float] = None
+        # EMA / MACD
+        self.ema_fast: Optional[float] = None
+        self.ema_slow: Optional[float] = None
+        self.dea: Optional[float] = None
+        self.vol_ema: Optional[float] = None
+        # RSI（Wilder）
+        self.gain_sum = 0.0
+        self.loss_sum = 0.0
+        self.avg_gain: Optional[float] = None
+        self.avg_loss: Optional[float] = None
+        # ATR（Wilder）
+        self.tr_sum = 0.0
+        self.atr: Optional[float] = None
+        # KDJ
+        self.hl = RollingMinMax(_KDJ_N)
+        self.rsv_win: Deque[float] = deque(maxlen=_K_SMOOTH)
+        self.k_win: Deque[float] = deque(maxlen=_D_SMOOTH)
+        # 斜率
+        self.closes: Deque[float] = deque(maxlen=_SLOPE_WIN)
+        self.sy = 0.0
+        self.sxy = 0.0
+        self._since_resync = 0
+
+    # ---------- 單根更新 ----------
+
+    def _slope_push(self, y: float) -> Optional[float]:
+        w = _SLOPE_WIN
+        if len(self.closes) == w:
+            y0 = self.closes[0]
+            # 視窗左移一格：每個 x 減 1 → Σxy 扣掉 (Σy - y0)，新值放在 x=w-1
+            self.sxy = self.sxy - (self.sy - y0) + (w - 1) * y
+            self.sy = self.sy - y0 + y
+            self.closes.append(y)
+            self._since_resync += 1
+            if self._since_resync >= _SLOPE_RESYNC:
+                self._resync_slope()
+        else:
+            self.sxy += len(self.closes) * y
+            self.sy += y
+            self.closes.append(y)
+        if len(self.closes) < w:
+            return None
+        fn = float(w)
+        sx = w * (w - 1) / 2.0
+        sxx = (w - 1) * w * (2 * w - 1) / 6.0
+        denom = fn * sxx - sx * sx
+        if denom == 0:
+            return 0.0
+        return (fn * self.sxy - sx * self.sy) / denom
+
+    def _resync_slope(self) -> None:
+        self.sy = float(sum(self.closes))
+        self.sxy = float(sum(i * y for i, y in enumerate(self.closes)))
+        self._since_resync = 0
+
+    def update(self, row: Mapping[str, Any]) -> Dict[str, Any]:
+        """
+        推入一根 K 線（需含 close_time/open/high/low/close/volume），
+        回傳該根的 features 欄位（與 indicators.compute_feature_columns 相同的預設值規則）。
+        """
+        i = self.n
+        h = float(row["high"]); l = float(row["low"]); c = float(row["close"]); v = float(row["volume"])
+
+        # MACD
+        self.ema_fast = _ema_step(self.ema_fast, c, _EMA_FAST)
+        self.ema_slow = _ema_step(self.ema_slow, c, _EMA_SLOW)
+        dif = self.ema_fast - self.ema_slow
+        self.dea = _ema_step(self.dea, dif, _EMA_SIG)
+        hist = dif - self.dea
+        self.vol_ema = _ema_step(self.vol_ema, v, _VOL_EMA)
+
+        # RSI
+        rsi: Optional[float] = None
+        if i >= 1:
+            delta = c - float(self.prev_close)
+            gain = max(delta, 0.0); loss = max(-delta, 0.0)
+            if i < _RSI_P:
+                self.gain_sum += gain; self.loss_sum += loss
+            elif i == _RSI_P:
+                self.gain_sum += gain; self.loss_sum += loss
+                self.avg_gain = self.gain_sum / _RSI_P
+                self.avg_loss = self.loss_sum / _RSI_P
+            else:
+                self.avg_gain = (self.avg_gain * (_RSI_P - 1) + gain) / _RSI_P
+                self.avg_loss = (self.avg_loss * (_RSI_P - 1) + loss) / _RSI_P
+            if self.avg_gain is not None:
+                rsi = 100.0 if self.avg_loss == 0 else 100.0 - 100.0 / (1.0 + self.avg_gain / self.avg_loss)
+
+        # ATR
+        if i == 0:
+            tr = h - l
+        else:
+            pc = float(self.prev_close)
+            tr = max(h - l, abs(h - pc), abs(l - pc))
+        if i < _ATR_P - 1:
+            self.tr_sum += tr
+        elif i == _ATR_P - 1:
+            self.tr_sum += tr
+            self.atr = self.tr_sum / _ATR_P
+        else:
+            self.atr = (self.atr * (_ATR_P - 1) + tr) / _ATR_P
+
+        # KDJ
+        ll, hh = self.hl.push(l, h)
+        denom = hh - ll
+        rsv = 50.0 if denom == 0 else (c - ll) / denom * 100.0
+        self.rsv_win.append(rsv)
+        k = d = None
+        if len(self.rsv_win) == _K_SMOOTH:
+            k = sum(self.rsv_win) / _K_SMOOTH
+            self.k_win.append(k)
+            if len(self.k_win) == _D_SMOOTH:
+                d = sum(self.k_win) / _D_SMOOTH
+
+        slope = self._slope_push(c)
+
+        self.n = i + 1
+        self.prev_close = c
+        self.close_time = int(row["close_time"])
+        self.anchor = candle_checksum(row)
+
+        close_val = c if c != 0 else 1.0
+        vr = (v / self.vol_ema) if self.vol_ema else 0.0
+        hist_f = _fin(hist, 0.0)
+        return {
+            "close_time": self.close_time,
+            "rsi": _fin(rsi, 50.0),
+            "macd_dif": _fin(dif, 0.0),
+            "macd_dea": _fin(self.dea, 0.0),
+            "macd_hist": hist_f,
+            "k": _fin(k, 50.0),
+            "d": _fin(d, 50.0),
+            "kd_diff": _fin(None if (k is None or d is None) else k - d, 0.0),
+            "vol_ratio": _fin(vr, 1.0),
+            "atr_pct": _fin(_fin(self.atr, 0.0) / close_val, 0.0),
+            "slope": _fin(slope, 0.0),
+            "range_pct": _fin((h - l) / close_val, 0.0),
+            "regime": 1 if hist_f >= 0 else -1,
+        }
+
+    @classmethod
+    def replay(cls, rows: Sequence[Mapping[str, Any]]) -> "IndicatorState":
+        """從一段 K 線（ASC）重建狀態；種子與完整重算相同的視窗起點。"""
+        st = cls()
+        for r in rows:
+            st.update(r)
+        return st
+
+    # ---------- 序列化 ----------
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "n": self.n, "close_time": self.close_time, "anchor": self.anchor,
+            "prev_close": self.prev_close,
+            "ema_fast": self.ema_fast, "ema_slow": self.ema_slow, "dea": self.dea, "vol_ema": self.vol_ema,
+            "gain_sum": self.gain_sum, "loss_sum": self.loss_sum,
+            "avg_gain": self.avg_gain, "avg_loss": self.avg_loss,
+            "tr_sum": self.tr_sum, "atr": self.atr,
+            "hl": self.hl.values(), "rsv": list(self.rsv_win), "k": list(self.k_win),
+            "closes": list(self.closes), "sy": self.sy, "sxy": self.sxy,
+        }
+
+    @classmethod
+    def from_dict(cls, d: Mapping[str, Any]) -> "IndicatorState":
+        st = cls()
+        st.n = int(d["n"])
+        st.close_time = int(d["close_time"]) if d.get("close_time") is not None else None
+        st.anchor = str(d.get("anchor") or "")
+        for k in ("prev_close", "ema_fast", "ema_slow", "dea", "vol_ema", "avg_gain", "avg_loss", "atr"):
+            setattr(st, k, (float(d[k]) if d.get(k) is not None else None))
+        st.gain_sum = float(d.get("gain_sum") or 0.0)
+        st.loss_sum = float(d.get("loss_sum") or 0.0)
+        st.tr_sum = float(d.get("tr_sum") or 0.0)
+        st.hl = RollingMinMax.from_values(_KDJ_N, d.get("hl") or [])
+        st.rsv_win.extend(float(x) for x in d.get("rsv") or [])
+        st.k_win.extend(float(x) for x in d.get("k") or [])
+        st.closes.extend(float(x) for x in d.get("closes") or [])
+        st.sy = float(d.get("sy") or 0.0)
+        st.sxy = float(d.get("sxy") or 0.0)
+        return st
+
+    def clone(self) -> "IndicatorState":
+        return IndicatorState.from_dict(self.to_dict())
+
+
+# ---------- DB 讀寫（表由 app/migrations/0002_indicator_state.sql 建立）----------
+
+def load(symbol: str, interval: str) -> Optional[IndicatorState]:
+    """先看行程內快取，再讀 indicator_state；版本不符或解析失敗回 None。"""
+    key = (symbol, interval)
+    st = _cache.get(key)
+    if st is not None:
+        return st
+    row = exec(
+        "SELECT close_time, version, anchor_sum, state_json FROM indicator_state WHERE symbol=:s AND `interval`=:i",
+        s=symbol, i=interval
+    ).mappings().first()
+    if not row or int(row["version"] or 0) != STATE_VERSION:
+        return None
+    try:
+        st = IndicatorState.from_dict(json.loads(row["state_json"]))
+    except Exception as e:
+        log.warning("indicator_state 解析失敗（改走完整重算）：%s %s | %s", symbol, interval, e)
+        return None
+    if st.close_time != int(row["close_time"]) or st.anchor != str(row["anchor_sum"]):
+        return None
+    _cache[key] = st
+    return st
+
+
+def save(symbol: str, interval: str, st: IndicatorState) -> None:
+    exec("""
+        INSERT INTO indicator_state(symbol, `interval`, close_time, version, anchor_sum, state_json)
+        VALUES(:s, :i, :ct, :v, :a, :j)
+        ON DUPLICATE KEY UPDATE
+          close_time=VALUES(close_time),
+          version=VALUES(version),
+          anchor_sum=VALUES(anchor_sum),
+          state_json=VALUES(state_json)
+    """, s=symbol, i=interval, ct=int(st.close_time or 0), v=STATE_VERSION, a=st.anchor,
+         j=json.dumps(st.to_dict(), separators=(",", ":")))
+    _cache[(symbol, interval)] = st
+
+
+def drop(symbol: str, interval: str) -> None:
+    """讓行程內快取失效（下次會重讀或完整重算）。"""
+    _cache.pop((symbol, interval), None)
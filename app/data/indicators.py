@@ -0,0 +1,228 @@
+# app/data/indicators.py
+"""
+NumPy 版技術指標引擎（features.py 的向量化實作）。
+
+輸入為連續 float64 陣列，輸出與 features.py 的純 Python 版本
+（_rsi / _macd / _ema_series / _kdj / _atr / _linreg_slope）逐點對齊：
+- EMA：以第一個值當種子，alpha = 2/(period+1)
+- RSI / ATR：前 period 根取簡單平均當種子，之後 Wilder 平滑
+- KDJ：RSV 視窗在開頭不足 n 根時用「已有的根數」，K/D 為 3 根 SMA
+- 暖機期不足的位置以 NaN 表示（對應 Python 版的 None）
+
+誤差：種子（EMA 首值、RSI/ATR 前 period 根平均）與 Python 版逐位相同；
+遞迴項（EMA / Wilder）改用一階 IIR 濾波、SMA 與線性回歸斜率改用累加和 / 視窗內積，
+與逐步累加的結果只有浮點捨入差，相對誤差 < 1e-9（FEATURE_RTOL），絕對誤差 < 1e-9（FEATURE_ATOL）。
+"""
+from __future__ import annotations
+from typing import Dict, Any, List
+
+import numpy as np
+
+from .rolling import rolling_min_np, rolling_max_np
+
+try:
+    from scipy.signal import lfilter as _lfilter
+except Exception:  # scipy 為選配；沒有時退回逐步迴圈
+    _lfilter = None
+
+# 與 Python 版比對時的容許誤差（np.allclose 參數）
+FEATURE_RTOL = 1e-9
+FEATURE_ATOL = 1e-9
+
+
+# ---------- 基礎：一階遞迴 y[i] = a*x[i] + b*y[i-1] ----------
+
+def _recursive(x: np.ndarray, a: float, b: float, y0: float) -> np.ndarray:
+    """
+    y[0] = y0；i>=1 時 y[i] = a*x[i] + b*y[i-1]。
+    有 scipy 時走 C 實作的 lfilter，否則用陣列上的逐步迴圈。
+    """
+    n = x.shape[0]
+    out = np.empty(n, dtype=np.float64)
+    if n == 0:
+        return out
+    out[0] = y0
+    if n == 1:
+        return out
+    if _lfilter is not None:
+        out[1:] = _lfilter([a], [1.0, -b], x[1:], zi=[b * y0])[0]
+        return out
+    prev = y0
+    for i in range(1, n):
+        prev = a * x[i] + b * prev
+        out[i] = prev
+    return out
+
+
+def ema(values: np.ndarray, period: int) -> np.ndarray:
+    v = np.asarray(values, dtype=np.float64)
+    if period <= 1 or v.shape[0] == 0:
+        return v.copy()
+    alpha = 2.0 / (period + 1.0)
+    return _recursive(v, alpha, 1 - alpha, float(v[0]))
+
+
+def _wilder(x: np.ndarray, period: int, seed_idx: int, seed: float) -> np.ndarray:
+    """Wilder 平滑：out[seed_idx]=seed，之後 out[i] = (out[i-1]*(p-1) + x[i]) / p；之前為 NaN。"""
+    n = x.shape[0]
+    out = np.full(n, np.nan, dtype=np.float64)
+    if seed_idx >= n:
+        return out
+    out[seed_idx:] = _recursive(x[seed_idx:], 1.0 / period, (period - 1) / period, seed)
+    return out
+
+
+# ---------- 指標 ----------
+
+def rsi(close: np.ndarray, period: int = 14) -> np.ndarray:
+    c = np.asarray(close, dtype=np.float64)
+    n = c.shape[0]
+    out = np.full(n, np.nan, dtype=np.float64)
+    if n < period + 1:
+        return out
+    delta = np.diff(c)
+    gains = np.concatenate(([0.0], np.maximum(delta, 0.0)))
+    losses = np.concatenate(([0.0], np.maximum(-delta, 0.0)))
+    avg_gain = _wilder(gains, period, period, sum(gains[1:period + 1].tolist()) / period)
+    avg_loss = _wilder(losses, period, period, sum(losses[1:period + 1].tolist()) / period)
+    g = avg_gain[period:]
+    l = avg_loss[period:]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        val = 100.0 - 100.0 / (1.0 + g / l)
+    out[period:] = np.where(l == 0, 100.0, val)
+    return out
+
+
+def macd(close: np.ndarray, fast: int = 12, slow: int = 26, signal: int = 9):
+    c = np.asarray(close, dtype=np.float64)
+    dif = ema(c, fast) - ema(c, slow)
+    dea = ema(dif, signal)
+    return dif, dea, dif - dea
+
+
+def _sma_valid(x: np.ndarray, m: int) -> np.ndarray:
+    """
+    對「前段為 NaN、之後連續有值」的序列做 m 根 SMA；
+    對齊 Python 版 _sma：第一個有值位置起算滿 m 根才輸出。
+    """
+    n = x.shape[0]
+    out = np.full(n, np.nan, dtype=np.float64)
+    valid = np.flatnonzero(~np.isnan(x))
+    if valid.shape[0] < m:
+        return out
+    start = int(valid[0])
+    seg = x[start:]
+    csum = np.concatenate(([0.0], np.cumsum(seg)))
+    out[start + m - 1:] = (csum[m:] - csum[:-m]) / m
+    return out
+
+
+def kdj(high: np.ndarray, low: np.ndarray, close: np.ndarray,
+        n: int = 9, k_smooth: int = 3, d_smooth: int = 3):
+    h = np.asarray(high, dtype=np.float64)
+    l = np.asarray(low, dtype=np.float64)
+    c = np.asarray(close, dtype=np.float64)
+    ll = rolling_min_np(l, n)
+    hh = rolling_max_np(h, n)
+    denom = hh - ll
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsv = np.where(denom == 0, 50.0, (c - ll) / denom * 100.0)
+    k = _sma_valid(rsv, k_smooth)
+    d = _sma_valid(k, d_smooth)
+    return k, d, k - d
+
+
+def atr(high: np.ndarray, low: np.ndarray, close: np.ndarray, period: int = 14) -> np.ndarray:
+    h = np.asarray(high, dtype=np.float64)
+    l = np.asarray(low, dtype=np.float64)
+    c = np.asarray(close, dtype=np.float64)
+    n = c.shape[0]
+    if n < period:
+        return np.full(n, np.nan, dtype=np.float64)
+    tr = h - l
+    if n > 1:
+        prev = c[:-1]
+        tr[1:] = np.maximum(np.maximum(h[1:] - l[1:], np.abs(h[1:] - prev)), np.abs(l[1:] - prev))
+    return _wilder(tr, period, period - 1, sum(tr[:period].tolist()) / period)
+
+
+def linreg_slope(values: np.ndarray, win: int = 10) -> np.ndarray:
+    y = np.asarray(values, dtype=np.float64)
+    n = y.shape[0]
+    out = np.full(n, np.nan, dtype=np.float64)
+    if n < win:
+        return out
+    xs = np.arange(win, dtype=np.float64)
+    sx = float(xs.sum())
+    sxx = float((xs * xs).sum())
+    fn = float(win)
+    denom = fn * sxx - sx * sx
+    if denom == 0:
+        out[win - 1:] = 0.0
+        return out
+    w = np.lib.stride_tricks.sliding_window_view(y, win)
+    sy = w.sum(axis=1)
+    sxy = w @ xs
+    out[win - 1:] = (fn * sxy - sx * sy) / denom
+    return out
+
+
+# ---------- 對外：一次算出 features 表所需欄位 ----------
+
+def compute_feature_columns(high: np.ndarray, low: np.ndarray, close: np.ndarray,
+                            volume: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    回傳與 features 表同名的欄位陣列（已套用 _finite 預設值與衍生欄位）：
+    rsi, macd_dif, macd_dea, macd_hist, k, d, kd_diff, vol_ratio, atr_pct, slope, range_pct, regime
+    """
+    hi = np.ascontiguousarray(high, dtype=np.float64)
+    lo = np.ascontiguousarray(low, dtype=np.float64)
+    cl = np.ascontiguousarray(close, dtype=np.float64)
+    vol = np.ascontiguousarray(volume, dtype=np.float64)
+
+    r = rsi(cl, 14)
+    dif, dea, hist = macd(cl, 12, 26, 9)
+    k, d, kd_diff = kdj(hi, lo, cl, 9, 3, 3)
+    a = atr(hi, lo, cl, 14)
+    vol_ema20 = ema(vol, 20)
+    slope10 = linreg_slope(cl, 10)
+
+    def _fin(x: np.ndarray, default: float) -> np.ndarray:
+        return np.where(np.isfinite(x), x, default)
+
+    denom_close = np.where(cl != 0, cl, 1.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        vr = np.where(vol_ema20 != 0, vol / vol_ema20, 0.0)
+    hist_f = _fin(hist, 0.0)
+    return {
+        "rsi": _fin(r, 50.0),
+        "macd_dif": _fin(dif, 0.0),
+        "macd_dea": _fin(dea, 0.0),
+        "macd_hist": hist_f,
+        "k": _fin(k, 50.0),
+        "d": _fin(d, 50.0),
+        "kd_diff": _fin(kd_diff, 0.0),
+        "vol_ratio": _fin(vr, 1.0),
+        "atr_pct": _fin(_fin(a, 0.0) / denom_close, 0.0),
+        "slope": _fin(slope10, 0.0),
+        "range_pct": _fin((hi - lo) / denom_close, 0.0),
+        "regime": np.where(hist_f >= 0, 1, -1).astype(np.int8),
+    }
+
+
+def feature_rows(symbol: str, interval: str, close_time: np.ndarray,
+                 cols: Dict[str, np.ndarray], start: int = 0) -> List[Dict[str, Any]]:
+    """把欄位陣列 [start:] 轉成 features upsert 用的 dict 列表。"""
+    names = ("rsi", "macd_dif", "macd_dea", "macd_hist", "k", "d", "kd_diff",
+             "vol_ratio", "atr_pct", "slope", "range_pct")
+    lists = {nm: cols[nm][start:].tolist() for nm in names}
+    regime = cols["regime"][start:].tolist()
+    cts = np.asarray(close_time)[start:].tolist()
+    out: List[Dict[str, Any]] = []
+    for j, ct in enumerate(cts):
+        row: Dict[str, Any] = {"symbol": symbol, "interval": interval, "close_time": int(ct)}
+        for nm in names:
+            row[nm] = float(lists[nm][j])
+        row["regime"] = int(regime[j])
+        out.append(row)
+    return out
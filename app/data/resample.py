@@ -0,0 +1,122 @@
+# app/data/resample.py
+"""
+由 1m K 線在本機合成 15m / 30m / 1h / 4h（RESAMPLE_FROM_1M=1 時啟用）：
+Binance 只需抓 1m，高週期與 1m 來源一致，API 權重約降為 1 / 週期數。
+
+- 分桶：open_time // 週期毫秒（與 Binance 相同，以 UTC epoch 對齊）
+- 一個高週期 bar 只有在「所有 1m 子 bar 都存在」時才視為已收線並寫入；
+  缺子 bar 的桶先不寫，等子 bar 補齊（REST 補洞 / 串流）後下一輪再合成。
+- 高週期落後 >= 2 根（冷啟、1m 歷史不夠、長期缺子 bar）時退回 REST 直接抓該週期。
+"""
+from __future__ import annotations
+import time
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from ..db import exec
+from . import candle_store
+from .collector import upsert_candles_bulk, fetch_klines_to_db, _interval_ms, _last_candle_close_ms
+
+log = logging.getLogger("autobot")
+
+BASE = "1m"
+BASE_MS = 60_000
+DERIVABLE = ("15m", "30m", "1h", "4h")
+
+
+def resample_ohlcv(close_time: np.ndarray, open_: np.ndarray, high: np.ndarray, low: np.ndarray,
+                   close: np.ndarray, volume: np.ndarray, target_ms: int, base_ms: int = BASE_MS
+                   ) -> Tuple[np.ndarray, ...]:
+    """
+    把 ASC、close_time 不重複的低週期 OHLCV 聚合為 target_ms 週期；只回傳子 bar 齊全的桶。
+    回傳 (open_time, open, high, low, close, volume, close_time)，open_time / close_time 為 int64。
+    """
+    ct = np.asarray(close_time, dtype=np.int64)
+    n = ct.shape[0]
+    if n == 0:
+        e = np.empty(0, dtype=np.int64)
+        f = np.empty(0, dtype=np.float64)
+        return e, f, f, f, f, f, e
+    need = int(target_ms) // int(base_ms)
+    bucket = (ct - (base_ms - 1)) // target_ms
+    starts = np.flatnonzero(np.concatenate(([True], bucket[1:] != bucket[:-1])))
+    counts = np.diff(np.concatenate((starts, [n])))
+    ends = starts + counts - 1
+
+    o = np.asarray(open_, dtype=np.float64)[starts]
+    h = np.maximum.reduceat(np.asarray(high, dtype=np.float64), starts)
+    l = np.minimum.reduceat(np.asarray(low, dtype=np.float64), starts)
+    c = np.asarray(close, dtype=np.float64)[ends]
+    v = np.add.reduceat(np.asarray(volume, dtype=np.float64), starts)
+    ot = bucket[starts] * target_ms
+
+    ok = counts == need
+    return ot[ok], o[ok], h[ok], l[ok], c[ok], v[ok], ot[ok] + target_ms - 1
+
+
+def _load_base(symbol: str, since_ct: int) -> Tuple[np.ndarray, ...]:
+    """讀 close_time >= since_ct 的 1m（優先走 candle_store）。"""
+    if candle_store.enabled():
+        v = candle_store.store().since(symbol, BASE, since_ct)
+        if v is not None:
+            return v.close_time, v.open, v.high, v.low, v.close, v.volume
+    rows = exec(
+        """
+        SELECT close_time, open, high, low, close, volume
+        FROM candles
+        WHERE symbol=:s AND `interval`=:i AND close_time >= :ct
+        ORDER BY close_time ASC
+        """,
+        s=symbol, i=BASE, ct=int(since_ct)
+    ).all()
+    a = np.asarray([tuple(r) for r in rows or []], dtype=np.float64).reshape(-1, 6)
+    return tuple(a[:, k] for k in range(6))
+
+
+def derive_interval(symbol: str, interval: str, now_ms: Optional[int] = None) -> int:
+    """
+    以 1m 合成 symbol 的 interval，寫入 DB 最後一根之後、已收線的 bar。
+    落後 >= 2 根時改走 REST（fetch_klines_to_db）。回傳寫入根數。
+    """
+    itv = _interval_ms(interval)
+    now = int(now_ms if now_ms is not None else time.time() * 1000)
+    now_ct = (now // itv) * itv - 1
+    last = _last_candle_close_ms(symbol, interval)
+
+    wrote = 0
+    if last is not None:
+        arrs = _load_base(symbol, last + BASE_MS)  # 第一個子 bar 的 close_time = last + 1m
+        ot, o, h, l, c, v, ct = resample_ohlcv(*arrs, target_ms=itv)
+        keep = (ct > last) & (ct <= now_ct)
+        # 只取緊接 last 的連續前綴：中間缺子 bar 的桶沒合成前，不讓後面的桶越過它
+        expect = last + itv * np.cumsum(keep)
+        keep &= np.cumprod(~keep | (ct == expect)).astype(bool)
+        if keep.any():
+            rows = list(zip(ot[keep].tolist(), o[keep].tolist(), h[keep].tolist(), l[keep].tolist(),
+                            c[keep].tolist(), v[keep].tolist(), ct[keep].tolist()))
+            upsert_candles_bulk(symbol, interval, rows)
+            wrote = len(rows)
+            last = int(ct[keep][-1])
+
+    behind = (now_ct - last) // itv if last is not None else None
+    if behind is None or behind >= 2:
+        log.info("resample：%s %s 落後 %s 根，改用 REST 補", symbol, interval, behind)
+        wrote += int(fetch_klines_to_db(symbol, interval) or 0)
+    return wrote
+
+
+def derive_many(symbols: Iterable[str], intervals: Iterable[str]) -> Dict[Tuple[str, str], object]:
+    """對每個 symbol 合成 intervals 中可由 1m 導出的週期；回傳 {(symbol, interval): 寫入根數 或 Exception}。"""
+    out: Dict[Tuple[str, str], object] = {}
+    targets: List[str] = [i for i in intervals if i in DERIVABLE]
+    now = int(time.time() * 1000)
+    for s in symbols:
+        for i in targets:
+            try:
+                out[(s, i)] = derive_interval(s, i, now_ms=now)
+            except Exception as e:
+                log.warning("resample 失敗：%s %s | %s", s, i, e)
+                out[(s, i)] = e
+    return out
@@ -0,0 +1,120 @@
+# app/data/rolling.py
+"""
+滾動極值（rolling min / max）共用工具：KDJ、之後的 Donchian / Williams %R 都可共用。
+
+視窗定義一律為 [max(0, i-w+1), i]：開頭不足 w 根時只看已有的根數（與原本 _kdj 相同）。
+- rolling_min / rolling_max：純 Python，單調雙端佇列，O(n)
+- rolling_min_np / rolling_max_np：NumPy，van Herk / Gil-Werman 分塊前後綴極值，O(n) 且不逐 bar 配置
+- RollingMinMax：串流版（一次推一根），給增量計算使用
+"""
+from __future__ import annotations
+from collections import deque
+from typing import Deque, List, Sequence, Tuple
+
+import numpy as np
+
+
+# ---------- 純 Python：單調佇列 ----------
+
+def _rolling_ext(values: Sequence[float], window: int, is_min: bool) -> List[float]:
+    w = max(int(window), 1)
+    out: List[float] = [0.0] * len(values)
+    dq: Deque[int] = deque()  # 存 index；對應值單調（min 遞增 / max 遞減）
+    for i, v in enumerate(values):
+        if is_min:
+            while dq and values[dq[-1]] >= v:
+                dq.pop()
+        else:
+            while dq and values[dq[-1]] <= v:
+                dq.pop()
+        dq.append(i)
+        if dq[0] <= i - w:
+            dq.popleft()
+        out[i] = values[dq[0]]
+    return out
+
+
+def rolling_min(values: Sequence[float], window: int) -> List[float]:
+    return _rolling_ext(values, window, True)
+
+
+def rolling_max(values: Sequence[float], window: int) -> List[float]:
+    return _rolling_ext(values, window, False)
+
+
+# ---------- NumPy：van Herk / Gil-Werman ----------
+
+def _rolling_ext_np(x: np.ndarray, window: int, op: np.ufunc, pad: float) -> np.ndarray:
+    a = np.asarray(x, dtype=np.float64)
+    n = a.shape[0]
+    w = max(int(window), 1)
+    if n == 0 or w == 1:
+        return a.copy()
+    # 前面補 w-1 個中性值 → 第 i 個輸出 = op(padded[i : i+w])
+    m = n + w - 1
+    nb = -(-m // w)
+    p = np.full(nb * w, pad, dtype=np.float64)
+    p[w - 1:m] = a
+    blocks = p.reshape(nb, w)
+    prefix = op.accumulate(blocks, axis=1).ravel()
+    suffix = op.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+    return op(suffix[:n], prefix[w - 1:w - 1 + n])
+
+
+def rolling_min_np(x: np.ndarray, window: int) -> np.ndarray:
+    return _rolling_ext_np(x, window, np.minimum, np.inf)
+
+
+def rolling_max_np(x: np.ndarray, window: int) -> np.ndarray:
+    return _rolling_ext_np(x, window, np.maximum, -np.inf)
+
+
+# ---------- 串流版 ----------
+
+class RollingMinMax:
+    """
+    一次推一根的滾動高低點；push 為攤銷 O(1)。
+    values() 可取回視窗內原始值（持久化用），from_values() 可還原。
+    """
+
+    def __init__(self, window: int) -> None:
+        self.window = max(int(window), 1)
+        self._i = 0
+        self._buf: Deque[Tuple[float, float]] = deque(maxlen=self.window)
+        self._mn: Deque[Tuple[int, float]] = deque()
+        self._mx: Deque[Tuple[int, float]] = deque()
+
+    def push(self, lo: float, hi: float) -> Tuple[float, float]:
+        """推入一根（最低價、最高價），回傳 (視窗最低, 視窗最高)。"""
+        i = self._i
+        self._i += 1
+        self._buf.append((lo, hi))
+        while self._mn and self._mn[-1][1] >= lo:
+            self._mn.pop()
+        self._mn.append((i, lo))
+        while self._mx and self._mx[-1][1] <= hi:
+            self._mx.pop()
+        self._mx.append((i, hi))
+        if self._mn[0][0] <= i - self.window:
+            self._mn.popleft()
+        if self._mx[0][0] <= i - self.window:
+            self._mx.popleft()
+        return self._mn[0][1], self._mx[0][1]
+
+    @property
+    def low(self) -> float:
+        return self._mn[0][1]
+
+    @property
+    def high(self) -> float:
+        return self._mx[0][1]
+
+    def values(self) -> List[Tuple[float, float]]:
+        return list(self._buf)
+
+    @classmethod
+    def from_values(cls, window: int, values: Sequence[Sequence[float]]) -> "RollingMinMax":
+        rm = cls(window)
+        for lo, hi in values:
+            rm.push(float(lo), float(hi))
+        return rm
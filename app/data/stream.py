@@ -0,0 +1,266 @@
+# app/data/stream.py
+"""
+WebSocket K 線串流（選配；需要 websocket-client）：
+訂閱 combined streams `<symbol>@kline_<interval>`，只收「已收線」(k.x = true) 的 K 線，
+暫存後批次寫入 candles；REST 只用在斷線重連後與串流跳號時補洞。
+每次連線前，還沒有 last_ct 的組合先以 DB 最後一根收線時間當起點，
+DB 最後一根與第一個串流 frame 之間漏掉的 bar 也當成跳號補。
+
+- handle_message(raw)：處理一個原始 frame（錄下來的 frame 也可直接餵，見 scripts/replay_stream.py）
+- flush()：把暫存的已收線 K 線寫入 DB，並設定 bar_event 通知主迴圈
+- consume(conn)：處理單一條連線直到斷線；run_forever() 負責重連、退避與補洞
+"""
+from __future__ import annotations
+import json
+import time
+import threading
+import logging
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from ..config import Config
+from .collector import upsert_candles_bulk, fetch_klines_to_db, _interval_ms, _last_candle_close_ms
+
+try:
+    import websocket  # websocket-client
+except Exception:  # 沒裝就只能用 REST 輪詢
+    websocket = None
+
+log = logging.getLogger("autobot")
+
+Pair = Tuple[str, str]
+Row = Tuple[int, float, float, float, float, float, int]
+
+
+def available() -> bool:
+    return websocket is not None
+
+
+def stream_url(pairs: Iterable[Pair], base: Optional[str] = None) -> str:
+    b = (base or getattr(Config, "BINANCE_WS_BASE", "wss://fstream.binance.com")).rstrip("/")
+    names = "/".join(f"{s.lower()}@kline_{i}" for s, i in pairs)
+    return f"{b}/stream?streams={names}"
+
+
+def _default_connect(url: str):
+    if websocket is None:
+        raise RuntimeError("未安裝 websocket-client，無法使用串流模式")
+    return websocket.create_connection(url, timeout=10, enable_multithread=True)
+
+
+class KlineStream:
+    def __init__(self, pairs: Iterable[Pair], *,
+                 connect: Callable[[str], Any] = _default_connect,
+                 sink: Callable[[str, str, List[Row]], Any] = upsert_candles_bulk,
+                 repair: Callable[[str, str], Any] = fetch_klines_to_db,
+                 last_close: Callable[[str, str], Optional[int]] = _last_candle_close_ms,
+                 flush_ms: Optional[int] = None) -> None:
+        self.pairs: List[Pair] = list(dict.fromkeys(pairs))
+        self._connect = connect
+        self._sink = sink
+        self._repair = repair
+        self._last_close = last_close
+        self.flush_s = max(0.0, (flush_ms if flush_ms is not None
+                                 else int(getattr(Config, "STREAM_FLUSH_MS", 200))) / 1000.0)
+        self._buf: Dict[Pair, Dict[int, Row]] = {}
+        self._buf_since: Optional[float] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._conn = None
+        self._thread: Optional[threading.Thread] = None
+        self._need_repair: Set[Pair] = set()
+        self.last_ct: Dict[Pair, int] = {}
+        self.connected = False
+        self.bar_event = threading.Event()      # flush 後 set；主迴圈等它以便立刻處理新 bar
+        self.closed_at: Dict[Pair, float] = {}   # 最近一次收線 frame 到達時間（time.time()）
+        self.stats = {"frames": 0, "closed": 0, "flushed": 0, "reconnects": 0, "repairs": 0, "bad": 0}
+
+    # ---------- frame 處理 ----------
+
+    def handle_message(self, raw: Any) -> bool:
+        """處理一個 frame；收到已收線 K 線回 True。"""
+        self.stats["frames"] += 1
+        try:
+            msg = json.loads(raw) if isinstance(raw, (str, bytes, bytearray)) else raw
+            data = msg.get("data", msg)
+            if data.get("e") != "kline":
+                return False
+            k = data["k"]
+            if not k.get("x"):
+                return False
+            key = (str(k.get("s") or data.get("s")).upper(), str(k["i"]))
+            row: Row = (int(k["t"]), float(k["o"]), float(k["h"]), float(k["l"]),
+                        float(k["c"]), float(k["v"]), int(k["T"]))
+        except Exception as e:
+            self.stats["bad"] += 1
+            log.warning("stream frame 解析失敗：%s | %r", e, raw if isinstance(raw, str) else type(raw))
+            return False
+
+        with self._lock:
+            prev = self.last_ct.get(key)
+            if prev is not None and row[6] > prev + _interval_ms(key[1]):
+                # 串流跳號（漏了中間的 bar）→ 交給 REST 補
+                self._need_repair.add(key)
+            if prev is None or row[6] > prev:
+                self.last_ct[key] = row[6]
+            self._buf.setdefault(key, {})[row[6]] = row
+            if self._buf_since is None:
+                self._buf_since = time.monotonic()
+            self.closed_at[key] = time.time()
+        self.stats["closed"] += 1
+        return True
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(len(v) for v in self._buf.values())
+
+    def flush(self) -> int:
+        """把暫存的已收線 K 線批次寫入；回傳寫入根數。寫入失敗的保留到下次。"""
+        with self._lock:
+            buf, self._buf, self._buf_since = self._buf, {}, None
+        n = 0
+        for key, rows in buf.items():
+            ordered = [rows[ct] for ct in sorted(rows)]
+            try:
+                self._sink(key[0], key[1], ordered)
+                n += len(ordered)
+            except Exception as e:
+                log.warning("stream flush 失敗（保留待重試）：%s %s | %s", key[0], key[1], e)
+                with self._lock:
+                    self._buf.setdefault(key, {}).update(rows)
+                    if self._buf_since is None:
+                        self._buf_since = time.monotonic()
+        if n:
+            self.stats["flushed"] += n
+            self.bar_event.set()
+        self._run_repairs()
+        return n
+
+    def _run_repairs(self) -> None:
+        with self._lock:
+            todo, self._need_repair = self._need_repair, set()
+        for s, i in todo:
+            try:
+                self._repair(s, i)
+                self.stats["repairs"] += 1
+            except Exception as e:
+                log.warning("stream 補洞失敗：%s %s | %s", s, i, e)
+                with self._lock:
+                    self._need_repair.add((s, i))
+
+    def _seed_last_ct(self) -> None:
+        """還沒收過 frame 的組合以 DB 最後一根 close_time 為起點；讀不到就直接排入補洞。"""
+        for key in self.pairs:
+            with self._lock:
+                if key in self.last_ct:
+                    continue
+            try:
+                ct = self._last_close(*key)
+            except Exception as e:
+                log.warning("stream 讀取最後一根失敗（改排入補洞）：%s %s | %s", key[0], key[1], e)
+                with self._lock:
+                    self._need_repair.add(key)
+                continue
+            if ct is not None:
+                with self._lock:
+                    self.last_ct.setdefault(key, int(ct))
+
+    # ---------- 連線 ----------
+
+    def consume(self, conn) -> None:
+        """讀取單一連線直到斷線或 stop()；閒置 flush_s 或暫存超過 flush_s 即 flush。"""
+        try:
+            conn.settimeout(self.flush_s or 0.2)
+        except Exception:
+            pass
+        while not self._stop.is_set():
+            try:
+                raw = conn.recv()
+            except Exception as e:
+                if _is_timeout(e):
+                    if self._buf_since is not None:
+                        self.flush()
+                    continue
+                raise
+            if raw is None or raw == "":
+                raise ConnectionError("stream 已關閉")
+            self.handle_message(raw)
+            since = self._buf_since
+            if since is not None and time.monotonic() - since >= self.flush_s:
+                self.flush()
+
+    def run_forever(self) -> None:
+        delay = 1.0
+        first = True
+        while not self._stop.is_set():
+            try:
+                self._seed_last_ct()
+                self._conn = self._connect(stream_url(self.pairs))
+                self.connected = True
+                if not first:
+                    # 重連：斷線期間的 bar 由 REST 補
+                    self.stats["reconnects"] += 1
+                    with self._lock:
+                        self._need_repair.update(self.pairs)
+                    self._run_repairs()
+                first = False
+                delay = 1.0
+                log.info("stream 已連線：%d 組", len(self.pairs))
+                self.consume(self._conn)
+            except Exception as e:
+                if self._stop.is_set():
+                    break
+                log.warning("stream 斷線，%.0fs 後重連：%s", delay, e)
+            finally:
+                self.connected = False
+                if self.pending():
+                    self.flush()
+                try:
+                    if self._conn is not None:
+                        self._conn.close()
+                except Exception:
+                    pass
+                self._conn = None
+            if self._stop.wait(delay):
+                break
+            delay = min(delay * 2, 30.0)
+
+    def start(self) -> "KlineStream":
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run_forever, daemon=True, name="kline-stream")
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        try:
+            if self._conn is not None:
+                self._conn.close()
+        except Exception:
+            pass
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def covers(self, pair: Pair) -> bool:
+        """串流目前是否負責這組（已連線且沒有待補的洞）。"""
+        return self.connected and pair in self.pairs and pair not in self._need_repair
+
+    def set_pairs(self, pairs: Iterable[Pair]) -> None:
+        """訂閱組合有變就斷線重連（run_forever 會用新清單重新訂閱並補洞）。"""
+        new = list(dict.fromkeys(pairs))
+        if new == self.pairs:
+            return
+        self.pairs = new
+        try:
+            if self._conn is not None:
+                self._conn.close()
+        except Exception:
+            pass
+
+
+def _is_timeout(e: Exception) -> bool:
+    if isinstance(e, TimeoutError):
+        return True
+    if websocket is not None and isinstance(e, websocket.WebSocketTimeoutException):
+        return True
+    return "timed out" in str(e).lower()
@@ -1,20 +1,40 @@
 # app/db.py
 from __future__ import annotations
-from typing import Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
 import urllib.parse
+import hashlib
 import logging
+import math
+import os
+import re
+import socket
+import threading
+import time
 
 from sqlalchemy import create_engine, text
-from sqlalchemy.engine import Engine, Result
+from sqlalchemy.sql.elements import TextClause
+from sqlalchemy.engine import Connection, Engine, Result
 from sqlalchemy.exc import OperationalError, InterfaceError
 
 from .config import Config
 from . import db_connect
 
 log = logging.getLogger("autobot.db")
+slow_log = logging.getLogger("autobot.db.slow")
 
 _engine: Optional[Engine] = None
 
+# 顯式交易（tx=True）使用的隔離等級；引擎預設為 AUTOCOMMIT
+_TX_ISOLATION = "READ COMMITTED"
+
+# unit_of_work() 期間本執行緒 / context 共用的連線（None = 各語句自動提交）
+_uow_conn: ContextVar[Optional[Connection]] = ContextVar("autobot_uow_conn", default=None)
+uow_stats = {"units": 0, "commits": 0, "rollbacks": 0, "statements": 0}
+
 
 def _make_url(cfg: Config) -> str:
     """
@@ -44,10 +64,13 @@ def _make_url(cfg: Config) -> str:
 
 def _build_engine() -> Engine:
     cfg = Config()
+    if backend() == "sqlite":
+        from . import db_sqlite
+        return db_sqlite.build_engine(cfg.DB_SQLITE_PATH, cfg.DB_SQLITE_SCHEMA or None)
     # 先確保 SSH 隧道已啟動（與舊介面相容）
     db_connect.get_connection().close()
     # ★ 等 0.3s，給隧道一個穩定時間窗（避免剛起來就握手失敗）
-    import time; time.sleep(0.3)
+    time.sleep(0.3)
 
     # 建 Engine：開啟 pre_ping + 較短 recycle + 連線逾時
     return create_engine(
@@ -70,6 +93,19 @@ def _build_engine() -> Engine:
 
 
 
+def backend() -> str:
+    """DB_BACKEND：mysql（預設，走 SSH 隧道）或 sqlite（本機，見 db_sqlite.py）。"""
+    b = (Config.DB_BACKEND or "mysql").strip().lower()
+    if b not in ("mysql", "sqlite"):
+        raise RuntimeError(f"不支援的 DB_BACKEND：{Config.DB_BACKEND}（可用 mysql / sqlite）")
+    return b
+
+
+def _tx_isolation(conn: Connection) -> str:
+    # SQLite 只有 SERIALIZABLE / READ UNCOMMITTED
+    return "SERIALIZABLE" if conn.dialect.name == "sqlite" else _TX_ISOLATION
+
+
 def engine() -> Engine:
     """
     Lazy 單例 Engine；隧道確保後建立 Engine
@@ -80,14 +116,27 @@ def engine() -> Engine:
     return _engine
 
 
-def _retryable_exec(sql: str, params, *, max_retries: int = 2) -> Result:
+def _retryable_run(fn: Callable[[Connection], Any], *, max_retries: int = 2, tx: bool = False) -> Any:
+    """
+    取一條連線執行 fn(conn)；連線中斷時重建隧道與連線池後整段重試。
+    tx=True 時改用 READ COMMITTED 交易包住整段（全部成功才 COMMIT，失敗整段 ROLLBACK）。
+    """
     global _engine
+    uow = _uow_conn.get()
+    if uow is not None:
+        # 在 unit_of_work 內：共用同一條連線與交易，不個別 COMMIT、不重試（整組由外層決定成敗）
+        uow_stats["statements"] += 1
+        return fn(uow)
     delay = 0.8
     attempt = 0
     while True:
         try:
             with engine().connect() as conn:
-                res: Result = conn.execute(text(sql), params)
+                if tx:
+                    conn = conn.execution_options(isolation_level=_tx_isolation(conn))
+                    with conn.begin():
+                        return fn(conn)
+                res = fn(conn)
                 conn.commit()
                 return res
         except (OperationalError, InterfaceError) as e:
@@ -98,7 +147,7 @@ def _retryable_exec(sql: str, params, *, max_retries: int = 2) -> Result:
                 raise
             log.warning("DB 連線問題，%.1fs 後重試（%d/%d）: %s", delay, attempt+1, max_retries, e)
 
-            # 先確保隧道
+            # 先確保隧道（sqlite 時為空操作）
             try:
                 db_connect.get_connection().close()
             except Exception as ee:
@@ -112,12 +161,332 @@ def _retryable_exec(sql: str, params, *, max_retries: int = 2) -> Result:
                 pass
             _engine = _build_engine()
 
-            import time
             time.sleep(delay)
             delay = min(delay * 1.8, 5.0)
             attempt += 1
 
 
+# -------------------------------------------------
+# 查詢統計：以正規化後的 SQL 指紋彙總次數、延遲分位數、列數、重試；超過 DB_SLOW_MS 記慢查詢
+# -------------------------------------------------
+# 字串與註解一起掃：字串內的 -- / /* 不當註解，註解內的引號也不當字串；字串支援 \' 與 '' 兩種跳脫
+_FP_STR_OR_COMMENT = re.compile(r"'(?:[^'\\]|\\.|'')*'|--[^\n]*|/\*.*?\*/", re.S)
+_FP_NUM = re.compile(r"(?<![\w:`.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+_FP_BULK_BIND = re.compile(r"(:[A-Za-z_]\w*?)_\d+\b")
+_FP_GROUPS = re.compile(r"\([^()]*\)(?:\s*,\s*\([^()]*\))+")
+# IN 清單的項目：綁定參數或（已被換成 ? 的）字面值、NULL
+_FP_IN_ITEM = r"(?::\w+|\?|NULL|TRUE|FALSE)"
+_FP_IN = re.compile(rf"\bIN\s*\(\s*{_FP_IN_ITEM}(?:\s*,\s*{_FP_IN_ITEM})*\s*\)", re.I)
+_FP_WS = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql: str) -> str:
+    """去掉註解 / 字面值、合併多列 VALUES 與 IN 清單後的 SQL（同一類查詢歸為同一指紋）。"""
+    s = _FP_STR_OR_COMMENT.sub(lambda m: "?" if m.group(0)[0] == "'" else " ", sql)
+    s = _FP_NUM.sub("?", s)
+    s = _FP_IN.sub("IN (...)", s)
+    s = _FP_BULK_BIND.sub(r"\1", s)
+    s = _FP_GROUPS.sub(lambda m: m.group(0)[:m.group(0).index(")") + 1] + ", ...", s)
+    return _FP_WS.sub(" ", s).strip()
+
+
+class _QStat:
+    __slots__ = ("fp", "calls", "errors", "retries", "rows", "total_ms", "max_ms", "slow", "lat")
+
+    def __init__(self, fp: str, window: int) -> None:
+        self.fp = fp
+        self.calls = self.errors = self.retries = self.rows = self.slow = 0
+        self.total_ms = self.max_ms = 0.0
+        self.lat: deque = deque(maxlen=max(16, window))
+
+
+_qstats: Dict[str, _QStat] = {}
+_qstats_lock = threading.Lock()
+_last_dump = time.monotonic()
+
+
+def _pct(sorted_vals: List[float], q: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    k = min(len(sorted_vals) - 1, max(0, math.ceil(q * len(sorted_vals)) - 1))   # nearest-rank
+    return float(sorted_vals[k])
+
+
+def _record(sql: str, ms: float, rows: int, retries: int, *, error: bool = False, params=None) -> None:
+    if not Config.DB_STATS_ENABLED:
+        return
+    fp = fingerprint(sql)
+    with _qstats_lock:
+        st = _qstats.get(fp)
+        if st is None:
+            st = _qstats[fp] = _QStat(fp, Config.DB_STATS_WINDOW)
+        st.calls += 1
+        st.errors += int(error)
+        st.retries += retries
+        st.rows += max(0, rows)
+        st.total_ms += ms
+        st.max_ms = max(st.max_ms, ms)
+        st.lat.append(ms)
+        slow = Config.DB_SLOW_MS > 0 and ms >= Config.DB_SLOW_MS
+        st.slow += int(slow)
+    if slow:
+        p = repr(params)
+        slow_log.warning("慢查詢 %.1f ms（rows=%d retries=%d%s）：%s | params=%s",
+                         ms, rows, retries, " ERROR" if error else "", fp[:300],
+                         p if len(p) <= 200 else p[:200] + "…")
+
+
+def query_stats(top: Optional[int] = None, order_by: str = "total_ms") -> List[Dict[str, Any]]:
+    """
+    各 SQL 指紋的統計（依 order_by 由大到小）：
+    calls / errors / retries / rows / slow / total_ms / avg_ms / max_ms / p50_ms / p95_ms / p99_ms。
+    分位數取最近 DB_STATS_WINDOW 筆。
+    """
+    with _qstats_lock:
+        snap = [(st.fp, st.calls, st.errors, st.retries, st.rows, st.slow, st.total_ms, st.max_ms, sorted(st.lat))
+                for st in _qstats.values()]
+    out: List[Dict[str, Any]] = []
+    for fp, calls, errors, retries, rows, slow, total, mx, lat in snap:
+        out.append({
+            "fingerprint": fp, "calls": calls, "errors": errors, "retries": retries, "rows": rows, "slow": slow,
+            "total_ms": round(total, 3), "avg_ms": round(total / calls, 3) if calls else 0.0, "max_ms": round(mx, 3),
+            "p50_ms": round(_pct(lat, 0.50), 3), "p95_ms": round(_pct(lat, 0.95), 3), "p99_ms": round(_pct(lat, 0.99), 3),
+        })
+    out.sort(key=lambda d: d.get(order_by, 0), reverse=True)
+    return out[:top] if top else out
+
+
+def reset_query_stats() -> None:
+    with _qstats_lock:
+        _qstats.clear()
+
+
+_DUMP_COLS = ("proc", "fp_hash", "fingerprint", "calls", "errors", "retries", "rows_total", "slow_calls",
+              "total_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms")
+
+
+def dump_query_stats() -> int:
+    """把目前統計（本行程累計）UPSERT 進 db_query_stats；回傳寫入指紋數。"""
+    stats = query_stats()
+    if not stats:
+        return 0
+    proc = f"{socket.gethostname()}:{os.getpid()}"[:64]
+    rows = [(proc, hashlib.sha1(d["fingerprint"].encode("utf-8")).hexdigest(), d["fingerprint"][:4000],
+             d["calls"], d["errors"], d["retries"], d["rows"], d["slow"],
+             d["total_ms"], d["p50_ms"], d["p95_ms"], d["p99_ms"], d["max_ms"]) for d in stats]
+    bulk_upsert("db_query_stats", _DUMP_COLS, rows, update_columns=_DUMP_COLS[2:])
+    return len(rows)
+
+
+def maybe_dump_query_stats() -> int:
+    """距上次寫入超過 DB_STATS_DUMP_S 才寫；給主迴圈每輪呼叫。"""
+    global _last_dump
+    every = int(Config.DB_STATS_DUMP_S or 0)
+    if every <= 0 or not Config.DB_STATS_ENABLED or time.monotonic() - _last_dump < every:
+        return 0
+    _last_dump = time.monotonic()
+    return dump_query_stats()
+
+
+# -------------------------------------------------
+# 語句快取：text() 的解析結果（TextClause）以 SQL 字串為鍵做 LRU，相同 SQL 不再重複解析 bind 參數
+# -------------------------------------------------
+_stmt_cache: "OrderedDict[str, TextClause]" = OrderedDict()
+_stmt_lock = threading.Lock()
+stmt_cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def _clause(sql: str) -> TextClause:
+    cap = int(Config.DB_STMT_CACHE or 0)
+    if cap <= 0:
+        return text(sql)
+    with _stmt_lock:
+        c = _stmt_cache.get(sql)
+        if c is not None:
+            _stmt_cache.move_to_end(sql)
+            stmt_cache_stats["hits"] += 1
+            return c
+    c = text(sql)
+    with _stmt_lock:
+        stmt_cache_stats["misses"] += 1
+        _stmt_cache[sql] = c
+        while len(_stmt_cache) > cap:
+            _stmt_cache.popitem(last=False)
+            stmt_cache_stats["evictions"] += 1
+    return c
+
+
+def _run_recorded(sql: str, params, run: Callable[[Connection], Result], *, max_retries: int = 2) -> Result:
+    """以 _retryable_run 執行並記錄查詢統計（含重試次數）。"""
+    tries = 0
+
+    def _run(conn: Connection) -> Result:
+        nonlocal tries
+        tries += 1
+        return run(conn)
+
+    t0 = time.perf_counter()
+    try:
+        res = _retryable_run(_run, max_retries=max_retries)
+    except Exception:
+        _record(sql, (time.perf_counter() - t0) * 1000.0, 0, max(0, tries - 1), error=True, params=params)
+        raise
+    rc = res.rowcount
+    _record(sql, (time.perf_counter() - t0) * 1000.0, rc if rc and rc > 0 else 0, max(0, tries - 1), params=params)
+    return res
+
+
+def _retryable_exec(sql: str, params, *, max_retries: int = 2) -> Result:
+    clause = _clause(sql)
+    return _run_recorded(sql, params, lambda conn: conn.execute(clause, params), max_retries=max_retries)
+
+
+class PreparedStatement:
+    """
+    熱門讀取用的預編譯語句：每個 dialect 只編譯一次成驅動端 SQL（如 pymysql 的 %(name)s），
+    之後直接 exec_driver_sql，略過 SQLAlchemy 的編譯快取查找與參數處理。
+    PyMySQL 不支援伺服器端 prepared statement，因此這是用戶端預編譯；DB_PREPARED=0 時退回一般 exec。
+    參數需為驅動可直接處理的型別（int / float / str / None）。
+    """
+    __slots__ = ("sql", "_clause", "_compiled")
+
+    def __init__(self, sql: str) -> None:
+        self.sql = sql
+        self._clause = text(sql)
+        self._compiled: Dict[str, Any] = {}
+
+    def _compile(self, dialect) -> Any:
+        c = self._compiled.get(dialect.name)
+        if c is None:
+            comp = self._clause.compile(dialect=dialect)
+            names = tuple(comp.positiontup) if comp.positional else None
+            c = self._compiled[dialect.name] = (comp.string, names)
+        return c
+
+    def __call__(self, /, **params) -> Result:
+        if not Config.DB_PREPARED:
+            return _retryable_exec(self.sql, params)
+
+        def _run(conn: Connection) -> Result:
+            sql, names = self._compile(conn.dialect)
+            args = tuple(params[n] for n in names) if names is not None else params
+            return conn.exec_driver_sql(sql, args)
+        return _run_recorded(self.sql, params, _run)
+
+
+def prepare(sql: str) -> PreparedStatement:
+    """建立預編譯語句（不連 DB；第一次執行時才依 dialect 編譯）。用法：q = prepare(sql); q(s=..., i=...).first()"""
+    return PreparedStatement(sql)
+
 
 def exec(sql: str, /, **params) -> Result:
     return _retryable_exec(sql, params, max_retries=2)
+
+
+@contextmanager
+def unit_of_work() -> Iterator[Connection]:
+    """
+    把區塊內所有 exec / bulk_upsert 收進同一條連線、同一個交易（_TX_ISOLATION）：
+    正常離開時一次 COMMIT，例外時整組 ROLLBACK 後往外拋。可巢狀，內層直接併入外層。
+    注意：區塊內的語句不會各自斷線重試；失敗的整組由呼叫端下一輪重跑。
+    """
+    cur = _uow_conn.get()
+    if cur is not None:
+        yield cur
+        return
+    uow_stats["units"] += 1
+    with engine().connect() as raw:
+        conn = raw.execution_options(isolation_level=_tx_isolation(raw))
+        token = _uow_conn.set(conn)
+        try:
+            with conn.begin():
+                yield conn
+            uow_stats["commits"] += 1
+        except BaseException:
+            uow_stats["rollbacks"] += 1
+            raise
+        finally:
+            _uow_conn.reset(token)
+
+
+# -------------------------------------------------
+# 批次寫入：多列 VALUES 的 INSERT ... ON DUPLICATE KEY UPDATE
+# -------------------------------------------------
+def _estimate_row_bytes(row) -> int:
+    """粗估單列在 SQL 文字中的長度（含參數佔位、逗號與括號）。"""
+    n = 4
+    for v in row:
+        n += (len(v) if isinstance(v, str) else 24) + 12
+    return n
+
+
+def chunk_rows(rows: Sequence[Sequence[Any]], *, max_bytes: Optional[int] = None,
+               max_rows: Optional[int] = None, head_bytes: int = 512) -> Iterator[List[Sequence[Any]]]:
+    """
+    依封包大小與列數上限切塊，確保單句 SQL 不超過 max_allowed_packet。
+    預設取 Config.DB_MAX_PACKET 的 80% 當安全邊界。
+    """
+    cfg = Config()
+    limit = int(max_bytes if max_bytes is not None else cfg.DB_MAX_PACKET * 0.8)
+    cap = max(1, int(max_rows if max_rows is not None else cfg.DB_BULK_MAX_ROWS))
+    buf: List[Sequence[Any]] = []
+    size = head_bytes
+    for r in rows:
+        rb = _estimate_row_bytes(r)
+        if buf and (len(buf) >= cap or size + rb > limit):
+            yield buf
+            buf, size = [], head_bytes
+        buf.append(r)
+        size += rb
+    if buf:
+        yield buf
+
+
+def build_bulk_upsert(table: str, columns: Sequence[str], n_rows: int,
+                      update_columns: Optional[Sequence[str]] = None) -> str:
+    """產生 n_rows 列的多列 INSERT；參數名為 :<欄位>_<列號>。"""
+    cols = ", ".join(f"`{c}`" for c in columns)
+    values = ",\n".join(
+        "(" + ", ".join(f":{c}_{i}" for c in columns) + ")" for i in range(n_rows)
+    )
+    sql = f"INSERT INTO {table}({cols}) VALUES\n{values}"
+    if update_columns:
+        upd = ",\n  ".join(f"`{c}`=VALUES(`{c}`)" for c in update_columns)
+        sql += f"\nON DUPLICATE KEY UPDATE\n  {upd}"
+    return sql
+
+
+def bulk_upsert(table: str, columns: Sequence[str], rows: Sequence[Sequence[Any]], *,
+                update_columns: Optional[Sequence[str]] = None,
+                max_rows: Optional[int] = None, single_tx: bool = False) -> int:
+    """
+    以多列 VALUES 分塊寫入（每塊一次 round trip）。
+    rows 的欄位順序需與 columns 一致；update_columns 為 None 時為純 INSERT。
+    single_tx=True 時所有分塊走同一條連線、同一個交易（一次 COMMIT，失敗整批重試）。
+    回傳 MySQL affected rows 總和（新插入算 1、內容有變的覆寫算 2）。
+    """
+    def _stmts():
+        for chunk in chunk_rows(rows, max_rows=max_rows):
+            params: Dict[str, Any] = {}
+            for i, r in enumerate(chunk):
+                for c, v in zip(columns, r):
+                    params[f"{c}_{i}"] = v
+            yield build_bulk_upsert(table, columns, len(chunk), update_columns), params
+
+    if single_tx:
+        def _run(conn: Connection) -> int:
+            n = 0
+            for sql, params in _stmts():
+                t0 = time.perf_counter()
+                rc = int(conn.execute(_clause(sql), params).rowcount or 0)
+                _record(sql, (time.perf_counter() - t0) * 1000.0, rc, 0)
+                n += rc
+            return n
+        return int(_retryable_run(_run, max_retries=2, tx=True))
+
+    affected = 0
+    for sql, params in _stmts():
+        res = _retryable_exec(sql, params, max_retries=2)
+        affected += int(res.rowcount or 0)
+    return affected
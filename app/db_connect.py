@@ -1,7 +1,7 @@
 # app/db_connect.py
 from __future__ import annotations
 import socket
-import select
+import selectors
 import threading
 import time
 import logging
@@ -17,124 +17,355 @@ _tunnel = None
 _tunnel_lock = threading.Lock()
 
 
+class _Pipe:
+    """一組 client socket ↔ paramiko channel 的轉發狀態與流量計數。"""
+    __slots__ = ("sock", "chan", "name", "to_chan", "to_sock", "bytes_up", "bytes_down", "opened_at")
+
+    def __init__(self, sock: socket.socket, chan: paramiko.Channel, name: str):
+        self.sock = sock
+        self.chan = chan
+        self.name = name
+        self.to_chan = bytearray()   # client → DB，channel 視窗滿時暫存
+        self.to_sock = bytearray()   # DB → client，socket 送不出時暫存
+        self.bytes_up = 0
+        self.bytes_down = 0
+        self.opened_at = time.time()
+
+
 class _ForwardServer:
-    """在 127.0.0.1:<local_port> 接受連線，通過 Paramiko Transport 開 direct-tcpip 到遠端 DB。"""
+    """
+    在 127.0.0.1:<local_port> 接受連線，通過 Paramiko Transport 開 direct-tcpip 到遠端 DB。
+    所有 client socket 與 channel 由單一執行緒（pf-loop）以 selectors 多工轉發：
+    - socket 端以預先配置的緩衝 recv_into；channel 端 paramiko 沒有 recv_into，直接 recv 後轉送
+    - 對端送不出時暫存並暫停讀取來源（背壓），不會無限堆積
+    - channel 沒有「可寫」事件可等，有暫存時改以短 timeout 輪詢 send_ready()
+    - 開 direct-tcpip 要等一個 SSH 往返：交給短命的 pf-open 執行緒做，完成的 pipe 放進 _opened
+      再寫 wake socket 通知 pf-loop 接手；開通期間其他連線照常轉發
+    """
+    BUF_SIZE = 65536
+    POLL_S = 1.0          # 無事時的 select timeout
+    BUSY_POLL_S = 0.005   # 有資料等 channel 視窗時的 select timeout
+
     def __init__(self, transport: paramiko.Transport, local_port: int, remote_host: str, remote_port: int):
         self.transport = transport
         self.local_port = local_port
         self.remote_host = remote_host
         self.remote_port = remote_port
         self._listen_sock: socket.socket | None = None
-        self._accept_thread: threading.Thread | None = None
+        self._accept_thread: threading.Thread | None = None   # 即 pf-loop（沿用舊屬性名）
         self._stopping = threading.Event()
-
+        self._sel: selectors.BaseSelector | None = None
+        self._pipes: dict[int, _Pipe] = {}
+        self._seq = 0
+        self._buf = bytearray(self.BUF_SIZE)
+        self._view = memoryview(self._buf)
+        self._wake_r: socket.socket | None = None
+        self._wake_w: socket.socket | None = None
+        self._opened: list[_Pipe] = []           # pf-open 開好、待 pf-loop 註冊的 pipe
+        self._open_lock = threading.Lock()
+        self._shut = False                        # pf-loop 已收尾：之後開好的 pipe 由 pf-open 自己關
+        self.opening = 0
+        self.accepted = 0
+        self.closed = 0
+        self.bytes_up = 0      # 已關閉 channel 的累計
+        self.bytes_down = 0
+
+    # ---------- 生命週期 ----------
     def start(self):
         s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         s.bind(("127.0.0.1", self.local_port))
         s.listen(100)
+        s.setblocking(False)
         self._listen_sock = s
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._sel = selectors.DefaultSelector()
+        self._sel.register(s, selectors.EVENT_READ, ("accept", None))
+        self._sel.register(self._wake_r, selectors.EVENT_READ, ("wake", None))
+        self._accept_thread = threading.Thread(target=self._loop, daemon=True, name="pf-loop")
+        self._accept_thread.start()
 
-        def _pipe(src, dst, name: str):
-            """雙向資料管線；任一端關閉就安靜結束。"""
+    def stop(self):
+        self._stopping.set()
+        try:
+            if self._wake_w:
+                self._wake_w.send(b"x")
+        except Exception:
+            pass
+        t = self._accept_thread
+        if t is not None and t.is_alive() and t is not threading.current_thread():
+            t.join(2.0)
+
+    def stats(self) -> dict:
+        pipes = list(self._pipes.values())
+        return {
+            "active": len(pipes),
+            "opening": self.opening,
+            "accepted": self.accepted,
+            "closed": self.closed,
+            "bytes_up": self.bytes_up + sum(p.bytes_up for p in pipes),
+            "bytes_down": self.bytes_down + sum(p.bytes_down for p in pipes),
+            "channels": [{"name": p.name, "up": p.bytes_up, "down": p.bytes_down,
+                          "age_s": round(time.time() - p.opened_at, 1)} for p in pipes],
+        }
+
+    # ---------- selector 輔助 ----------
+    def _want(self, obj, events: int, data) -> None:
+        sel = self._sel
+        try:
+            key = sel.get_key(obj)
+        except KeyError:
+            key = None
+        except (ValueError, OSError):
+            return
+        if events == 0:
+            if key is not None:
+                sel.unregister(obj)
+        elif key is None:
+            sel.register(obj, events, data)
+        elif key.events != events:
+            sel.modify(obj, events, data)
+
+    def _rearm(self, p: _Pipe) -> None:
+        """依暫存狀態調整兩端關注的事件（有暫存就先不讀來源）。"""
+        sock_ev = (0 if p.to_chan else selectors.EVENT_READ) | (selectors.EVENT_WRITE if p.to_sock else 0)
+        self._want(p.sock, sock_ev, ("sock", p))
+        self._want(p.chan, 0 if p.to_sock else selectors.EVENT_READ, ("chan", p))
+
+    # ---------- 事件處理 ----------
+    def _accept(self) -> None:
+        while True:
             try:
-                while not self._stopping.is_set():
-                    try:
-                        r, _, _ = select.select([src], [], [], 60)
-                    except Exception:
-                        # src 端已經被系統關閉或 select 出錯
-                        break
-                    if src not in r:
-                        continue
-                    try:
-                        data = src.recv(65536)
-                    except OSError as e:
-                        # 來源端不是 socket / 已關閉（WinError 10038 等）
-                        log.debug("轉發[%s] recv 結束：%s", name, e)
-                        break
-                    if not data:
-                        # 正常關閉
-                        break
-                    try:
-                        # paramiko.Channel 只有 send；socket 有 send/sendall
-                        if hasattr(dst, "sendall"):
-                            dst.sendall(data)  # socket path
-                        else:
-                            # channel path：確保送完
-                            sent = 0
-                            while sent < len(data):
-                                n = dst.send(data[sent:])  # type: ignore[attr-defined]
-                                if n is None or n <= 0:
-                                    raise OSError("channel send returned 0")
-                                sent += n
-                    except Exception as e:
-                        log.debug("轉發[%s] send 結束：%s", name, e)
-                        break
-            finally:
-                # 優雅雙向關閉；避免再拋例外
-                for side in (dst, src):
-                    try:
-                        try:
-                            side.shutdown(socket.SHUT_RDWR)  # socket 有；channel 沒有會丟例外
-                        except Exception:
-                            pass
-                        side.close()
-                    except Exception:
-                        pass
+                client_sock, _ = self._listen_sock.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            # Windows 上降低延遲
+            try:
+                client_sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            except Exception:
+                pass
 
-        def _accept_loop():
-            while not self._stopping.is_set():
-                try:
-                    client_sock, _ = s.accept()
-                except OSError:
-                    break
-                # Windows 上降低延遲
+            # 若 transport 已失效就丟棄本次
+            try:
+                alive = bool(self.transport and self.transport.is_active())
+            except Exception:
+                alive = False
+            if not alive:
+                client_sock.close()
+                continue
+
+            # 開通道要等一個 SSH 往返，不在 pf-loop 裡等
+            self._seq += 1
+            with self._open_lock:
+                self.opening += 1
+            threading.Thread(target=self._open_channel, args=(client_sock, f"pf-{self._seq}"),
+                             daemon=True, name="pf-open").start()
+
+    def _open_channel(self, client_sock: socket.socket, name: str) -> None:
+        """pf-open：開 paramiko direct-tcpip 通道（逾時視為失敗），完成後交回 pf-loop。"""
+        p = None
+        try:
+            chan = self.transport.open_channel(
+                kind="direct-tcpip",
+                dest_addr=(self.remote_host, self.remote_port),
+                src_addr=client_sock.getsockname(),
+                timeout=10,
+            )
+            client_sock.setblocking(False)
+            chan.setblocking(False)
+            p = _Pipe(client_sock, chan, name)
+        except Exception as e:
+            try:
+                client_sock.close()
+            finally:
+                log.warning("轉發開通遠端通道失敗：%s", e)
+        with self._open_lock:
+            self.opening -= 1
+            late = self._shut
+            if p is not None and not late:
+                self._opened.append(p)
+        if p is None:
+            return
+        if late:
+            for side in (p.sock, p.chan):
                 try:
-                    client_sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                    side.close()
                 except Exception:
                     pass
+            return
+        try:
+            self._wake_w.send(b"o")
+        except Exception:
+            pass   # forwarder 已停止：由 _loop 收尾時關閉
+
+    def _adopt_opened(self) -> None:
+        with self._open_lock:
+            ready, self._opened = self._opened, []
+        for p in ready:
+            self._pipes[id(p)] = p
+            self.accepted += 1
+            self._rearm(p)
+
+    def _close(self, p: _Pipe, why: str = "") -> None:
+        if self._pipes.pop(id(p), None) is None:
+            return
+        for obj in (p.sock, p.chan):
+            try:
+                self._sel.unregister(obj)
+            except Exception:
+                pass
+        # 優雅雙向關閉；避免再拋例外
+        try:
+            p.sock.shutdown(socket.SHUT_RDWR)
+        except Exception:
+            pass
+        for side in (p.sock, p.chan):
+            try:
+                side.close()
+            except Exception:
+                pass
+        self.closed += 1
+        self.bytes_up += p.bytes_up
+        self.bytes_down += p.bytes_down
+        if why:
+            log.debug("轉發[%s] 結束：%s", p.name, why)
+
+    def _flush_to_chan(self, p: _Pipe) -> bool:
+        """送出 client → DB 的暫存；回傳 False 表示 channel 已斷。"""
+        while p.to_chan and p.chan.send_ready():
+            try:
+                n = p.chan.send(p.to_chan)
+            except socket.timeout:
+                break
+            except Exception as e:
+                self._close(p, f"channel send：{e}")
+                return False
+            if not n:
+                self._close(p, "channel send returned 0")
+                return False
+            del p.to_chan[:n]
+            p.bytes_up += n
+        return True
+
+    def _on_sock_read(self, p: _Pipe) -> None:
+        try:
+            n = p.sock.recv_into(self._buf)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            self._close(p, f"client recv：{e}")
+            return
+        if n == 0:
+            self._close(p, "client 關閉")
+            return
+        view = self._view[:n]
+        if not p.to_chan and p.chan.send_ready():
+            # 常見路徑：直接從預配緩衝送出，只有送不完的尾巴才複製進暫存
+            try:
+                sent = p.chan.send(view)
+            except socket.timeout:
+                sent = 0
+            except Exception as e:
+                self._close(p, f"channel send：{e}")
+                return
+            p.bytes_up += sent
+            view = view[sent:]
+        if view:
+            p.to_chan += view
+        if self._flush_to_chan(p):
+            self._rearm(p)
+
+    def _on_sock_write(self, p: _Pipe) -> None:
+        try:
+            n = p.sock.send(p.to_sock)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            self._close(p, f"client send：{e}")
+            return
+        del p.to_sock[:n]
+        p.bytes_down += n
+        self._rearm(p)
 
-                # 若 transport 已失效就丟棄本次
-                try:
-                    if not (self.transport and self.transport.is_active()):
-                        client_sock.close()
-                        time.sleep(0.1)
-                        continue
-                except Exception:
-                    try:
-                        client_sock.close()
-                    finally:
-                        continue
+    def _on_chan_read(self, p: _Pipe) -> None:
+        try:
+            data = p.chan.recv(self.BUF_SIZE)
+        except socket.timeout:
+            return
+        except Exception as e:
+            self._close(p, f"channel recv：{e}")
+            return
+        if not data:
+            self._close(p, "channel 關閉")
+            return
+        try:
+            n = p.sock.send(data)
+        except (BlockingIOError, InterruptedError):
+            n = 0
+        except OSError as e:
+            self._close(p, f"client send：{e}")
+            return
+        p.bytes_down += n
+        if n < len(data):
+            p.to_sock += memoryview(data)[n:]
+        self._rearm(p)
 
-                # 開 paramiko direct-tcpip 通道
+    def _loop(self) -> None:
+        sel = self._sel
+        try:
+            while not self._stopping.is_set():
+                waiting = [p for p in self._pipes.values() if p.to_chan]
+                timeout = self.BUSY_POLL_S if waiting else self.POLL_S
                 try:
-                    chan = self.transport.open_channel(
-                        kind="direct-tcpip",
-                        dest_addr=(self.remote_host, self.remote_port),
-                        src_addr=client_sock.getsockname()
-                    )
-                except Exception as e:
-                    try:
-                        client_sock.close()
-                    finally:
-                        log.warning("轉發開通遠端通道失敗：%s", e)
+                    events = sel.select(timeout)
+                except OSError as e:
+                    log.warning("轉發 select 失敗：%s", e)
+                    time.sleep(0.05)
                     continue
-
-                # 兩邊各跑一條線把資料互相轉
-                t1 = threading.Thread(target=_pipe, args=(client_sock, chan, "c2s"), daemon=True, name="pf-c2s")
-                t2 = threading.Thread(target=_pipe, args=(chan, client_sock, "s2c"), daemon=True, name="pf-s2c")
-                t1.start(); t2.start()
-
-        self._accept_thread = threading.Thread(target=_accept_loop, daemon=True, name="pf-accept")
-        self._accept_thread.start()
-
-    def stop(self):
-        self._stopping.set()
-        try:
-            if self._listen_sock:
-                self._listen_sock.close()
-        except Exception:
-            pass
+                for key, mask in events:
+                    kind, p = key.data
+                    if kind == "accept":
+                        self._accept()
+                    elif kind == "wake":
+                        try:
+                            self._wake_r.recv(64)
+                        except OSError:
+                            pass
+                        self._adopt_opened()
+                    elif id(p) not in self._pipes:
+                        continue
+                    elif kind == "sock":
+                        if mask & selectors.EVENT_WRITE:
+                            self._on_sock_write(p)
+                        if mask & selectors.EVENT_READ and id(p) in self._pipes:
+                            self._on_sock_read(p)
+                    else:
+                        self._on_chan_read(p)
+                # channel 視窗可能已打開：補送暫存
+                for p in waiting:
+                    if id(p) in self._pipes and self._flush_to_chan(p):
+                        self._rearm(p)
+        finally:
+            with self._open_lock:
+                late, self._opened = self._opened, []
+                self._shut = True
+            for p in late:
+                self._pipes[id(p)] = p
+            for p in list(self._pipes.values()):
+                self._close(p, "forwarder 停止")
+            for obj in (self._listen_sock, self._wake_r, self._wake_w):
+                try:
+                    if obj:
+                        obj.close()
+                except Exception:
+                    pass
+            try:
+                sel.close()
+            except Exception:
+                pass
 
 
 class _ParamikoTunnel:
@@ -266,11 +497,17 @@ class _DummyConn:
         pass
 
 
+def _no_tunnel() -> bool:
+    return (Config.DB_BACKEND or "mysql").strip().lower() == "sqlite"
+
+
 def get_connection():
     """
     與舊版介面相容：呼叫時啟動/確保隧道，回傳一個帶有 close() 的假物件。
-    main.py 會立刻 close()，不影響隧道存活。
+    main.py 會立刻 close()，不影響隧道存活。DB_BACKEND=sqlite 時不開隧道。
     """
+    if _no_tunnel():
+        return _DummyConn()
     try:
         _ensure_tunnel()
     except Exception as e:
@@ -290,11 +527,21 @@ def ssh_mysql_tunnel():
         # 常駐模式：不自動 stop；若要離開即關閉可改成 _tunnel.stop()
         pass
 
+def stats() -> dict:
+    """隧道轉發統計（活躍 channel 數、累計/各 channel 上下行位元組）；隧道未建立時回空 dict。"""
+    t = _tunnel
+    if t is None or t.forwarder is None:
+        return {}
+    return t.forwarder.stats()
+
+
 def ensure_tunnel_alive() -> None:
     """
     提供外部週期呼叫：若隧道/transport 不活躍就重建。
     """
     global _tunnel
+    if _no_tunnel():
+        return
     with _tunnel_lock:
         need_reopen = True
         try:
@@ -0,0 +1,335 @@
+# app/db_sqlite.py
+"""
+DB_BACKEND=sqlite：不走 SSH 隧道、不需遠端 MySQL，給本機測試 / profiling / 壓測用。
+
+- DB_SQLITE_PATH=":memory:"（預設）或檔案路徑
+  * :memory: 只有一條連線（pool_size=1），各執行緒輪流借用，行為等同單連線的 MySQL
+  * 檔案：一般連線池 + WAL + busy_timeout
+- 建 Engine 時載入翻譯後的 schema_mysql.sql（DB_SQLITE_SCHEMA；皆為 IF NOT EXISTS，可重複執行），
+  並補一列預設 settings(id=1)；之後 migrate.run() 照常套用 app/migrations/
+- 所有語句在送進 sqlite3 前經 translate() 轉成 SQLite 方言（結果依 SQL 字串快取）：
+  * INSERT ... ON DUPLICATE KEY UPDATE c=VALUES(c) → INSERT ... ON CONFLICT DO UPDATE SET c=excluded.c
+  * DATE_SUB(x, INTERVAL n DAY) / CURRENT_DATE - INTERVAL n DAY → DATE_SUB(x, n, 'DAY')；LAST_INSERT_ID() → last_insert_rowid()
+  * INSERT IGNORE → INSERT OR IGNORE
+  * CREATE TABLE：enum → TEXT、AUTO_INCREMENT → INTEGER PRIMARY KEY AUTOINCREMENT、
+    KEY / UNIQUE KEY → 另建索引、ON UPDATE CURRENT_TIMESTAMP → AFTER UPDATE trigger、去掉表選項與 COLLATE
+  * ALTER TABLE ... ADD COLUMN IF NOT EXISTS：欄位已存在時略過
+- UNIX_TIMESTAMP / NOW / CURDATE / FROM_UNIXTIME / DATE_SUB / DATE_ADD / GET_LOCK / RELEASE_LOCK 以 Python 函式註冊；
+  日期時間一律用本機時區（同 MySQL session time_zone=SYSTEM）。
+  注意：欄位預設值 / trigger 用的 CURRENT_TIMESTAMP 是 SQLite 內建的 UTC，只拿來判斷「有沒有變」。
+"""
+from __future__ import annotations
+import re
+import time
+import logging
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+log = logging.getLogger("autobot.db")
+
+DEFAULT_SCHEMA = Path(__file__).resolve().parent.parent / "schema_mysql.sql"
+
+# 沒有 settings(id=1) 時補的預設列（其餘欄位走表定義的 DEFAULT）
+_SEED_SETTINGS = ("INSERT OR IGNORE INTO settings(id, symbols_json, intervals_json, leverage_json, invest_usdt_json) "
+                  "VALUES (1, '[\"BTCUSDT\"]', '[\"1m\"]', '{}', '{}')")
+
+
+# -------------------------------------------------
+# MySQL 函式（sqlite3 create_function）
+# -------------------------------------------------
+def _parse_dt(v: Any) -> Optional[datetime]:
+    if v is None:
+        return None
+    if isinstance(v, datetime):
+        return v
+    if isinstance(v, date):
+        return datetime(v.year, v.month, v.day)
+    try:
+        return datetime.fromisoformat(str(v).strip())
+    except ValueError:
+        return None
+
+
+def _unix_timestamp(*args: Any) -> Optional[int]:
+    if not args:
+        return int(time.time())
+    dt = _parse_dt(args[0])
+    return int(dt.timestamp()) if dt is not None else None
+
+
+def _now() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _curdate() -> str:
+    return date.today().isoformat()
+
+
+_UNITS = {"SECOND": "seconds", "MINUTE": "minutes", "HOUR": "hours", "DAY": "days", "WEEK": "weeks"}
+
+
+def _date_shift(v: Any, n: Any, unit: Any, sign: int) -> Optional[str]:
+    dt = _parse_dt(v)
+    if dt is None or n is None:
+        return None
+    u = str(unit).upper()
+    if u not in _UNITS:
+        raise ValueError(f"不支援的 INTERVAL 單位：{unit}")
+    out = dt + sign * timedelta(**{_UNITS[u]: float(n)})
+    # 輸入是純日期且位移以天 / 週計 → 仍回純日期（同 MySQL）
+    if len(str(v).strip()) == 10 and u in ("DAY", "WEEK"):
+        return out.date().isoformat()
+    return out.strftime("%Y-%m-%d %H:%M:%S")
+
+
+# MySQL DATE_FORMAT 與 strftime 不同的格式碼
+_FMT_MAP = {"%i": "%M", "%s": "%S", "%k": "%H", "%l": "%I", "%T": "%H:%M:%S"}
+
+
+def _from_unixtime(ts: Any, fmt: Optional[str] = None) -> Optional[str]:
+    if ts is None:
+        return None
+    dt = datetime.fromtimestamp(float(ts))
+    if fmt is None:
+        return dt.strftime("%Y-%m-%d %H:%M:%S")
+    return dt.strftime(re.sub(r"%[iskIT]", lambda m: _FMT_MAP.get(m.group(0), m.group(0)), fmt))
+
+
+def register_functions(dbapi_conn) -> None:
+    f = dbapi_conn.create_function
+    f("UNIX_TIMESTAMP", 0, _unix_timestamp)
+    f("UNIX_TIMESTAMP", 1, _unix_timestamp)
+    f("NOW", 0, _now)
+    f("CURDATE", 0, _curdate)
+    f("DATE_SUB", 3, lambda v, n, u: _date_shift(v, n, u, -1))
+    f("DATE_ADD", 3, lambda v, n, u: _date_shift(v, n, u, +1))
+    f("FROM_UNIXTIME", 1, _from_unixtime)
+    f("FROM_UNIXTIME", 2, _from_unixtime)
+    f("GET_LOCK", 2, lambda name, timeout: 1)      # 單機：沒有其他行程搶遷移鎖
+    f("RELEASE_LOCK", 1, lambda name: 1)
+
+
+# -------------------------------------------------
+# 語句翻譯
+# -------------------------------------------------
+class Plan(NamedTuple):
+    sql: str                                   # 實際送出的語句
+    after: Tuple[str, ...] = ()                # 之後要補跑的語句（索引、trigger）
+    add_column: Optional[Tuple[str, str]] = None   # (table, column)：ADD COLUMN IF NOT EXISTS 的檢查對象
+
+
+_ODKU = re.compile(r"\bON\s+DUPLICATE\s+KEY\s+UPDATE\b", re.I)
+_VALUES_REF = re.compile(r"\bVALUES\s*\(\s*(`?\w+`?)\s*\)", re.I)
+_DATE_SUB = re.compile(r"\b(DATE_SUB|DATE_ADD)\s*\(\s*((?:[^(),]|\([^()]*\))+?)\s*,\s*INTERVAL\s+(\S+?)\s+(\w+)\s*\)", re.I)
+_MINUS_INTERVAL = re.compile(r"(CURRENT_DATE|CURDATE\(\)|NOW\(\))\s*([-+])\s*INTERVAL\s+(\S+?)\s+(\w+)\b", re.I)
+_CURRENT_DATE = re.compile(r"\bCURRENT_DATE\b(?!\s*\()", re.I)
+_LAST_INSERT_ID = re.compile(r"\bLAST_INSERT_ID\s*\(\s*\)", re.I)
+_INSERT_IGNORE = re.compile(r"^\s*INSERT\s+IGNORE\b", re.I)
+
+_CREATE = re.compile(r"^\s*CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(`?\w+`?)\s*\(", re.I)
+_ALTER_ADD = re.compile(r"^\s*ALTER\s+TABLE\s+(`?\w+`?)\s+ADD\s+COLUMN\s+IF\s+NOT\s+EXISTS\s+(`?\w+`?)\s+(.*)$", re.I | re.S)
+
+
+def _unq(name: str) -> str:
+    return name.strip().strip("`")
+
+
+def _split_top(body: str) -> List[str]:
+    """以最外層逗號切欄位定義（略過括號與字串內的逗號）。"""
+    out, buf, depth, quote = [], [], 0, ""
+    for ch in body:
+        if quote:
+            buf.append(ch)
+            if ch == quote:
+                quote = ""
+            continue
+        if ch in "'\"":
+            quote = ch
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "," and depth == 0:
+            out.append("".join(buf).strip())
+            buf = []
+            continue
+        buf.append(ch)
+    tail = "".join(buf).strip()
+    if tail:
+        out.append(tail)
+    return out
+
+
+def _strip_comments(sql: str) -> str:
+    return "\n".join(re.sub(r"--.*$", "", ln) for ln in sql.splitlines())
+
+
+_ENUM = re.compile(r"\b(?:enum|set)\s*\((?:[^()']|'[^']*')*\)", re.I)
+_ON_UPDATE = re.compile(r"\s+ON\s+UPDATE\s+current_timestamp(?:\(\))?", re.I)
+_CUR_TS = re.compile(r"\bcurrent_timestamp\(\)", re.I)
+_COLLATE = re.compile(r"\s+(?:CHARACTER\s+SET|CHARSET|COLLATE)\s+\w+", re.I)
+_COMMENT = re.compile(r"\s+COMMENT\s+'(?:[^'\\]|\\.)*'", re.I)
+_AUTO_INC = re.compile(r"\s+AUTO_INCREMENT\b", re.I)
+_JSON_VALID = re.compile(r"\bjson_valid\((`?\w+`?)\)", re.I)
+
+
+def _column_def(item: str) -> Tuple[str, bool, bool]:
+    """回傳 (SQLite 欄位定義, 是否 AUTO_INCREMENT, 是否 ON UPDATE CURRENT_TIMESTAMP)。"""
+    on_update = bool(_ON_UPDATE.search(item))
+    s = _ON_UPDATE.sub("", item)
+    s = _ENUM.sub("TEXT", s)
+    s = _CUR_TS.sub("CURRENT_TIMESTAMP", s)
+    s = _COLLATE.sub("", s)
+    s = _COMMENT.sub("", s)
+    # MySQL 的 json_valid(NULL) 為 NULL（CHECK 通過），SQLite 回 0
+    s = _JSON_VALID.sub(lambda m: f"({m.group(1)} IS NULL OR json_valid({m.group(1)}))", s)
+    auto = bool(_AUTO_INC.search(s))
+    if auto:
+        name = s.split(None, 1)[0]
+        s = f"{name} INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL"
+    return s, auto, on_update
+
+
+def _create_table(sql: str, m: "re.Match[str]") -> Plan:
+    table = _unq(m.group(1))
+    body = sql[m.end():sql.rfind(")")]
+    cols: List[str] = []
+    pk: Optional[str] = None
+    after: List[str] = []
+    has_auto = False
+    for item in _split_top(_strip_comments(body)):
+        if not item:
+            continue
+        head = item.split(None, 2)
+        kw = head[0].upper()
+        if kw == "PRIMARY":
+            pk = item
+        elif kw in ("KEY", "INDEX") or (kw == "UNIQUE" and len(head) > 1):
+            uniq = kw == "UNIQUE"
+            rest = item.split(None, 2)[2] if uniq and head[1].upper() in ("KEY", "INDEX") else item.split(None, 1)[1]
+            name, _, cols_part = rest.partition("(")
+            if not name.strip():   # UNIQUE (a, b) 沒有名字
+                name = "uq_" + "_".join(_unq(c) for c in cols_part.rstrip(")").split(","))
+            after.append(f"CREATE {'UNIQUE ' if uniq else ''}INDEX IF NOT EXISTS "
+                         f"`{table}__{_unq(name)}` ON `{table}` ({cols_part.rstrip().rstrip(')')})")
+        elif kw in ("CONSTRAINT", "CHECK", "FOREIGN"):
+            cols.append(item)
+        else:
+            d, auto, on_update = _column_def(item)
+            has_auto = has_auto or auto
+            cols.append(d)
+            if on_update:
+                c = _unq(item.split(None, 1)[0])
+                after.append(
+                    f"CREATE TRIGGER IF NOT EXISTS `{table}__{c}_on_update` AFTER UPDATE ON `{table}` "
+                    f"FOR EACH ROW WHEN NEW.`{c}` IS OLD.`{c}` "
+                    f"BEGIN UPDATE `{table}` SET `{c}`=CURRENT_TIMESTAMP WHERE rowid=NEW.rowid; END"
+                )
+    if pk and not has_auto:
+        cols.append(pk)
+    return Plan(f"CREATE TABLE IF NOT EXISTS `{table}` (\n  " + ",\n  ".join(cols) + "\n)", tuple(after))
+
+
+@lru_cache(maxsize=4096)
+def translate(sql: str) -> Plan:
+    """MySQL 語句 → SQLite；不需改寫的語句原樣回傳。"""
+    m = _CREATE.match(sql)
+    if m:
+        return _create_table(sql, m)
+    m = _ALTER_ADD.match(sql)
+    if m:
+        d, _, _ = _column_def(f"{m.group(2)} {m.group(3).strip()}")
+        return Plan(f"ALTER TABLE {m.group(1)} ADD COLUMN {d}", (), (_unq(m.group(1)), _unq(m.group(2))))
+
+    s = sql
+    m = _ODKU.search(s)
+    if m:
+        tail = _VALUES_REF.sub(lambda v: f"excluded.{v.group(1)}", s[m.end():])
+        s = s[:m.start()] + "ON CONFLICT DO UPDATE SET" + tail
+    if "INTERVAL" in s.upper():
+        s = _DATE_SUB.sub(lambda x: f"{x.group(1).upper()}({x.group(2)}, {x.group(3)}, '{x.group(4).upper()}')", s)
+        s = _MINUS_INTERVAL.sub(
+            lambda x: f"{'DATE_SUB' if x.group(2) == '-' else 'DATE_ADD'}({x.group(1)}, {x.group(3)}, '{x.group(4).upper()}')", s)
+    s = _CURRENT_DATE.sub("CURDATE()", s)
+    s = _LAST_INSERT_ID.sub("last_insert_rowid()", s)
+    s = _INSERT_IGNORE.sub("INSERT OR IGNORE", s)
+    return Plan(s)
+
+
+# -------------------------------------------------
+# Engine
+# -------------------------------------------------
+def _install_hooks(eng: Engine, *, wal: bool) -> None:
+    @event.listens_for(eng, "connect")
+    def _on_connect(dbapi_conn, _rec):
+        register_functions(dbapi_conn)
+        cur = dbapi_conn.cursor()
+        cur.execute("PRAGMA busy_timeout=5000")
+        if wal:
+            cur.execute("PRAGMA journal_mode=WAL")
+            cur.execute("PRAGMA synchronous=NORMAL")
+        cur.close()
+
+    @event.listens_for(eng, "before_cursor_execute", retval=True)
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        plan = translate(statement)
+        sql = plan.sql
+        if plan.add_column is not None:
+            t, c = plan.add_column
+            have = {r[1] for r in cursor.connection.execute(f"PRAGMA table_info(`{t}`)")}
+            if c in have:
+                sql = "SELECT 1"
+        if plan.after:
+            conn.info["sqlite_after"] = plan.after
+        return sql, parameters
+
+    @event.listens_for(eng, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        for stmt in conn.info.pop("sqlite_after", ()):
+            cursor.connection.execute(stmt)
+
+
+def schema_statements(script: str) -> List[str]:
+    """mysqldump 檔 → 可執行的建表語句（略過 /*! */ 區塊、SET、DROP 與 VIEW；VIEW 只給 web 後台用）。"""
+    from .migrate import split_sql
+    s = re.sub(r"/\*.*?\*/\s*;?", "", script, flags=re.S)
+    out: List[str] = []
+    for stmt in split_sql(s):
+        head = stmt.lstrip().upper()
+        if head.startswith("CREATE TABLE") or head.startswith("INSERT"):
+            out.append(stmt)
+    return out
+
+
+def load_schema(eng: Engine, path: Optional[str] = None) -> int:
+    """載入翻譯後的 schema_mysql.sql 並補預設 settings；回傳執行的建表數。"""
+    p = Path(path) if path else DEFAULT_SCHEMA
+    stmts = schema_statements(p.read_text(encoding="utf-8"))
+    with eng.connect() as conn:
+        for stmt in stmts:
+            conn.exec_driver_sql(stmt)
+        conn.exec_driver_sql(_SEED_SETTINGS)
+        conn.commit()
+    log.info("SQLite schema 已載入：%s（%d 個語句）", p.name, len(stmts))
+    return len(stmts)
+
+
+def build_engine(path: str = ":memory:", schema: Optional[str] = None) -> Engine:
+    memory = path in ("", ":memory:")
+    if memory:
+        # 同一個記憶體庫只能有一條連線：pool_size=1 讓各執行緒輪流借用
+        eng = create_engine("sqlite://", poolclass=QueuePool, pool_size=1, max_overflow=0, pool_timeout=30,
+                            connect_args={"check_same_thread": False}, isolation_level="AUTOCOMMIT")
+    else:
+        eng = create_engine(f"sqlite:///{path}", pool_size=5, max_overflow=10, pool_timeout=30,
+                            connect_args={"check_same_thread": False, "timeout": 5.0},
+                            isolation_level="AUTOCOMMIT")
+    _install_hooks(eng, wal=not memory)
+    load_schema(eng, schema)
+    return eng
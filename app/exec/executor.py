@@ -4,12 +4,17 @@ from typing import Optional, Dict, Any, Tuple
 from time import time
 import json
 
-from ..db import exec  # 若你改成 q，請改成：from ..db import q as exec
+from ..db import exec, prepare, unit_of_work  # 若你改成 q，請改成：from ..db import q as exec
 from ..learner.rewards import book_trade
+from ..policy import linucb
 from ..risk.sizing import size_by_atr
 from ..risk.guards import should_block_entry, should_exit, journal
 from ..binance.fut_client import FutClient
 from ..learner.horizon import get_overrides
+from ..data import candle_store
+from ..reporter import writebehind
+from .. import settings_snapshot
+from . import position_book
 
 
 # -------------------------------------------------
@@ -18,67 +23,6 @@ from ..learner.horizon import get_overrides
 BAR_MS = {"1m": 60_000, "15m": 900_000,
           "30m": 1_800_000, "1h": 3_600_000, "4h": 14_400_000}
 
-# -------------------------------------------------
-# 表結構自檢（不破壞既有資料）
-# -------------------------------------------------
-exec("""
-CREATE TABLE IF NOT EXISTS positions (
-  pos_id BIGINT NOT NULL AUTO_INCREMENT,
-  symbol VARCHAR(16) NOT NULL,
-  direction ENUM('LONG','SHORT') NOT NULL,
-  entry_price DOUBLE NOT NULL,
-  qty DOUBLE NOT NULL,
-  margin_type VARCHAR(16) DEFAULT 'ISOLATED',
-  leverage INT DEFAULT 1,
-  status ENUM('OPEN','CLOSED') NOT NULL DEFAULT 'OPEN',
-  opened_at BIGINT NOT NULL,
-  closed_at BIGINT NULL,
-  pnl_after_cost DOUBLE DEFAULT 0,
-  PRIMARY KEY (pos_id),
-  KEY idx_positions_s (symbol),
-  KEY idx_positions_o (status, opened_at)
-) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
-""")
-exec("ALTER TABLE positions ADD COLUMN IF NOT EXISTS `interval` VARCHAR(8) NULL")
-exec("ALTER TABLE positions ADD COLUMN IF NOT EXISTS `template_id` BIGINT NULL")
-exec("ALTER TABLE positions ADD COLUMN IF NOT EXISTS `regime_entry` TINYINT NULL")
-exec("ALTER TABLE positions ADD COLUMN IF NOT EXISTS `opened_bar_ms` INT NULL")
-exec("ALTER TABLE positions ADD COLUMN IF NOT EXISTS `peak_price` DOUBLE NULL")
-exec("ALTER TABLE settings ADD COLUMN IF NOT EXISTS `exit_horizon_auto` TINYINT(1) NOT NULL DEFAULT 0")
-
-
-exec("""
-CREATE TABLE IF NOT EXISTS run_sessions (
-  session_id BIGINT NOT NULL AUTO_INCREMENT,
-  started_at BIGINT NOT NULL,
-  stopped_at BIGINT DEFAULT NULL,
-  is_active TINYINT(1) NOT NULL DEFAULT 1,
-  trade_mode ENUM('SIM','LIVE') NOT NULL DEFAULT 'SIM',
-  PRIMARY KEY (session_id),
-  KEY idx_active (is_active),
-  KEY idx_started (started_at)
-) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
-""")
-
-exec("""
-CREATE TABLE IF NOT EXISTS decisions_log (
-  id BIGINT NOT NULL AUTO_INCREMENT,
-  session_id BIGINT DEFAULT NULL,
-  ts BIGINT NOT NULL,
-  symbol VARCHAR(16) NOT NULL,
-  `interval` VARCHAR(8) NOT NULL,
-  action ENUM('LONG','SHORT','HOLD') NOT NULL,
-  is_flat TINYINT(1) NOT NULL DEFAULT 1,
-  E_long DOUBLE DEFAULT NULL,
-  E_short DOUBLE DEFAULT NULL,
-  template_id BIGINT DEFAULT NULL,
-  PRIMARY KEY (id),
-  KEY idx_sess (session_id),
-  KEY idx_time (ts),
-  KEY idx_sym_iv (symbol, `interval`)
-) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
-""")
-
 # -------------------------------------------------
 # 小工具
 # -------------------------------------------------
@@ -97,21 +41,23 @@ def _safe_load_json(s: Optional[str], fallback):
         return fallback
 
 
+_Q_LATEST_PX = prepare(
+    "SELECT close_time, close FROM candles WHERE symbol=:s AND `interval`=:i ORDER BY close_time DESC LIMIT 1")
+_Q_LATEST_REGIME = prepare(
+    "SELECT regime FROM features WHERE symbol=:s AND `interval`=:i ORDER BY close_time DESC LIMIT 1")
+
+
 def _latest_px(symbol: str, interval: str) -> Optional[Tuple[int, float]]:
-    r = exec(
-        "SELECT close_time, close FROM candles WHERE symbol=:s AND `interval`=:i ORDER BY close_time DESC LIMIT 1",
-        s=symbol, i=interval
-    ).mappings().first()
+    if candle_store.enabled():
+        return candle_store.store().last(symbol, interval)
+    r = _Q_LATEST_PX(s=symbol, i=interval).mappings().first()
     if not r:
         return None
     return int(r["close_time"]), float(r["close"])
 
 
 def _latest_regime(symbol: str, interval: str) -> int:
-    r = exec(
-        "SELECT regime FROM features WHERE symbol=:s AND `interval`=:i ORDER BY close_time DESC LIMIT 1",
-        s=symbol, i=interval
-    ).mappings().first()
+    r = _Q_LATEST_REGIME(s=symbol, i=interval).mappings().first()
     return int(r["regime"]) if r and r["regime"] is not None else 1
 
 
@@ -169,59 +115,38 @@ def _auto_exit_horizon(symbol: str, interval: str, bar_ms: int,
 
 
 def _settings_for(symbol: str) -> Dict[str, Any]:
-    r = exec("SELECT leverage_json, invest_usdt_json, max_risk_pct FROM settings WHERE id=1").mappings().first()
-    if not r:
-        return {"invest_usdt": 100.0, "leverage": 1, "max_risk_pct": 0.01}
-    lev_map = _safe_load_json(r.get("leverage_json"), {})
-    inv_map = _safe_load_json(r.get("invest_usdt_json"), {})
-    leverage = int(lev_map.get(symbol) or next(iter(lev_map.values()), 1) or 1)
-    invest_usdt = float(inv_map.get(symbol) or next(
-        iter(inv_map.values()), 100.0) or 100.0)
-    return {"invest_usdt": invest_usdt, "leverage": leverage, "max_risk_pct": float(r.get("max_risk_pct") or 0.01)}
+    st = settings_snapshot.get()
+    return {"invest_usdt": st.invest_for(symbol), "leverage": st.leverage_for(symbol), "max_risk_pct": st.max_risk_pct}
 
 
 def _exit_settings() -> Dict[str, Any]:
-    r = exec("""
-        SELECT hard_sl_pct, trail_backoff_pct, trail_trigger_pct, max_hold_bars
-        FROM settings WHERE id=1
-    """).mappings().first()
+    st = settings_snapshot.get()
     return {
-        "hard_sl_pct":   (float(r.get("hard_sl_pct")) if r and r.get("hard_sl_pct") is not None else None),
-        "trail_backoff": (float(r.get("trail_backoff_pct")) if r and r.get("trail_backoff_pct") is not None else None),
-        "trail_trigger": (float(r.get("trail_trigger_pct")) if r and r.get("trail_trigger_pct") is not None else 0.0),
-        "max_hold_bars": (int(r.get("max_hold_bars")) if r and r.get("max_hold_bars") is not None else None),
+        "hard_sl_pct":   st.hard_sl_pct,
+        "trail_backoff": st.trail_backoff_pct,
+        "trail_trigger": st.trail_trigger_pct if st.trail_trigger_pct is not None else 0.0,
+        "max_hold_bars": st.max_hold_bars,
     }
 
 
 def _settings_mode_and_costs() -> Dict[str, Any]:
-    
-    r = exec("SELECT trade_mode, live_armed, fee_rate, slip_rate FROM settings WHERE id=1").mappings().first()
-    if not r:
-        return {"trade_mode": "SIM", "live_armed": 0, "fee_rate": 0.0004, "slip_rate": 0.0002}
+    st = settings_snapshot.get()
     return {
-        "trade_mode": str(r.get("trade_mode") or "SIM").upper(),
-        "live_armed": int(r.get("live_armed") or 0),
-        "fee_rate": float(r.get("fee_rate") or 0.0004),
-        "slip_rate": float(r.get("slip_rate") or 0.0002),
+        "trade_mode": st.trade_mode,
+        "live_armed": int(st.live_armed),
+        "fee_rate": float(st.fee_rate or 0.0004),
+        "slip_rate": float(st.slip_rate or 0.0002),
     }
 
 def _exit_horizon_auto_enabled() -> bool:
-    v = exec("SELECT exit_horizon_auto FROM settings WHERE id=1").scalar()
-    try:
-        return int(v or 0) == 1
-    except Exception:
-        return False
+    return int(settings_snapshot.get().exit_horizon_auto) == 1
 
 
 def _settings_risk(symbol: str) -> Dict[str, Any]:
-    r = exec("""
-        SELECT adv_enabled, max_daily_dd_pct, max_consec_losses, cooldown_bars, min_hold_bars,
-               leverage_json, invest_usdt_json
-          FROM settings WHERE id=1
-    """).mappings().first() or {}
+    st = settings_snapshot.get()
 
     # adv_enabled 控制「是否啟用進階進場風控 + 最小持有棒數」
-    adv = int(r.get("adv_enabled") or 0) == 1
+    adv = int(st.adv_enabled) == 1
 
     if not adv:
         # 關閉：全部條件視為不啟用
@@ -234,40 +159,28 @@ def _settings_risk(symbol: str) -> Dict[str, Any]:
         }
 
     # 開啟：照數值計算
-    md   = r.get("max_daily_dd_pct")
-    mcl  = r.get("max_consec_losses")
-    cd   = r.get("cooldown_bars")
-    mh   = r.get("min_hold_bars")
-
-    def _load(s, fb="{}"):
-        try: return json.loads(s or fb)
-        except Exception: return json.loads(fb)
-    inv_map = _load(r.get("invest_usdt_json"))
-    invest_usdt = float(inv_map.get(symbol) or next(iter(inv_map.values()), 100.0) or 100.0)
+    md = st.max_daily_dd_pct
+    invest_usdt = st.invest_for(symbol)
     max_dd_usdt = (invest_usdt * float(md)) if md not in (None, 0, 0.0) else None
 
     return {
         "enabled": True,
         "max_daily_dd_usdt": max_dd_usdt,      # None 表示不啟用此條件
-        "max_consec_losses": int(mcl or 0),
-        "cooldown_bars":     int(cd  or 0),
-        "min_hold_bars":     int(mh  or 0),
+        "max_consec_losses": int(st.max_consec_losses or 0),
+        "cooldown_bars":     int(st.cooldown_bars or 0),
+        "min_hold_bars":     int(st.min_hold_bars or 0),
 
     }
 
 
 
-def _update_peak(pos_id: int, new_peak: float) -> None:
-    exec("UPDATE positions SET peak_price=:pp WHERE pos_id=:id",
-         pp=float(new_peak), id=int(pos_id))
+def _update_peak(symbol: str, interval: str, new_peak: float) -> None:
+    position_book.book().update(symbol, interval, peak_price=float(new_peak))
 
 
 def _get_open_pos(symbol: str, interval: str) -> Optional[Dict[str, Any]]:
-    r = exec(
-        "SELECT * FROM positions WHERE symbol=:s AND `interval`=:i AND status='OPEN' ORDER BY opened_at DESC LIMIT 1",
-        s=symbol, i=interval
-    ).mappings().first()
-    return dict(r) if r else None
+    """持倉由 position_book 提供（行程內，寫入時 write-through 到 positions）。"""
+    return position_book.get(symbol, interval)
 
 
 def _active_session_id() -> Optional[int]:
@@ -295,14 +208,9 @@ def _log_decision(session_id: Optional[int], symbol: str, interval: str, decisio
     E_short = float(decision.get("E_short", 0.0) or 0.0)
     tid = decision.get("template_id")
     is_flat = 1 if (_get_open_pos(symbol, interval) is None) else 0
-    exec(
-        """
-        INSERT INTO decisions_log(session_id, ts, symbol, `interval`, action, is_flat, E_long, E_short, template_id)
-        VALUES(:sid, :ts, :s, :i, :a, :flat, :el, :es, :tid)
-        """,
-        sid=session_id, ts=ts, s=symbol, i=interval, a=action, flat=is_flat,
-        el=E_long, es=E_short, tid=int(tid) if tid is not None else None
-    )
+    # decisions_log 為遙測：經 write-behind 批次寫入（欄位順序見 writebehind._DECISION_COLS）
+    writebehind.put_decision((session_id, ts, symbol, interval, action, is_flat,
+                              E_long, E_short, int(tid) if tid is not None else None))
 
 # -------------------------------------------------
 # 成本模型（模擬 / 真實覆蓋）
@@ -373,6 +281,7 @@ def open_position(symbol: str, direction: str, price: float, qty: float, leverag
         """,
         s=symbol, d=direction, p=price, q=qty, lev=int(leverage), ts=ts, sid=sid
     )
+    position_book.invalidate(symbol)
     pos_id = exec(
         "SELECT pos_id FROM positions WHERE symbol=:s AND status='OPEN' ORDER BY opened_at DESC LIMIT 1",
         s=symbol
@@ -392,6 +301,7 @@ def close_position(symbol: str, price: float) -> Optional[float]:
     ts = int(time() * 1000)
     exec("UPDATE positions SET status='CLOSED', closed_at=:ts, pnl_after_cost=:pnl WHERE pos_id=:id",
          ts=ts, pnl=pnl, id=pos["pos_id"])
+    position_book.invalidate(symbol)
     return pnl
 
 
@@ -416,22 +326,14 @@ def open_position_v2(symbol: str, interval: str, direction: str, price: float, q
     sid = _active_session_id()
 
     ts = int(time() * 1000)
-    exec(
-        """
-                INSERT INTO positions(symbol, `interval`, direction, entry_price, qty, margin_type, leverage,
-                              status, opened_at, template_id, regime_entry, opened_bar_ms, peak_price, session_id)
-        VALUES(:s, :i, :d, :p, :q, 'ISOLATED', :lev, 'OPEN', :ts, :tid, :reg, :bar, :pp, :sid)
-
-        """,
-        s=symbol, i=interval, d=direction, p=price, q=qty, lev=int(leverage),
-        ts=ts, tid=int(template_id) if template_id is not None else None,
-        reg=int(regime_entry), bar=_bar_ms_of(interval), pp=float(price), sid=sid
-
-    )
-    pos_id = exec(
-        "SELECT pos_id FROM positions WHERE symbol=:s AND `interval`=:i AND status='OPEN' ORDER BY opened_at DESC LIMIT 1",
-        s=symbol, i=interval
-    ).scalar()
+    # INSERT 後直接用 lastrowid，不再回查 pos_id
+    pos_id = position_book.book().open(symbol, interval, {
+        "direction": direction, "entry_price": price, "qty": qty, "margin_type": "ISOLATED",
+        "leverage": int(leverage), "opened_at": ts,
+        "template_id": int(template_id) if template_id is not None else None,
+        "regime_entry": int(regime_entry), "opened_bar_ms": _bar_ms_of(interval),
+        "peak_price": float(price), "session_id": sid,
+    })
     # 模擬委託紀錄（orders）
     exec("""
         INSERT INTO orders(symbol, side, type, qty, price, status, placed_at, reason, session_id)
@@ -441,7 +343,12 @@ def open_position_v2(symbol: str, interval: str, direction: str, price: float, q
     return int(pos_id) if pos_id is not None else None
 
 
-def close_position_v2(symbol: str, interval: str, last_price: float) -> Optional[float]:
+def close_position_v2(symbol: str, interval: str, last_price: float, *,
+                      cost_cover: Optional[Dict[str, float]] = None) -> Optional[float]:
+    """
+    cost_cover：呼叫端在交易外預先取好的幣安實際成本（_close_costs；{} 表示取不到）。
+    None 才在這裡現取；apply_decision 只在本根確定平倉時預取，交易內不打交易所 API。
+    """
     pos = _get_open_pos(symbol, interval)
     if not pos:
         return None
@@ -465,7 +372,7 @@ def close_position_v2(symbol: str, interval: str, last_price: float) -> Optional
 
     # 若 LIVE 且已 armed → 用幣安覆蓋實值（取不到則沿用模擬值；並可記一條 risk_journal）
     if mode["trade_mode"] == "LIVE" and mode["live_armed"] == 1:
-        cover = _binance_costs_cover(symbol, entry_ts, ts)
+        cover = cost_cover if cost_cover is not None else _binance_costs_cover(symbol, entry_ts, ts)
         if cover:
             fee = float(cover.get("commission", fee))
             funding_fee = float(cover.get("funding_fee", 0.0))
@@ -504,10 +411,7 @@ def close_position_v2(symbol: str, interval: str, last_price: float) -> Optional
         """, sid=sid, s=symbol, i=interval, ent=entry_ts, ext=ts)
 
 
-    exec(
-        "UPDATE positions SET status='CLOSED', closed_at=:ts, pnl_after_cost=:p WHERE pos_id=:id",
-        ts=ts, p=float(pnl_after_db), id=pos["pos_id"]
-    )
+    position_book.book().close(symbol, interval, closed_at=ts, pnl_after_cost=float(pnl_after_db))
     return float(pnl_after_db)
 
 # -------------------------------------------------
@@ -516,99 +420,154 @@ def close_position_v2(symbol: str, interval: str, last_price: float) -> Optional
 
 
 def apply_decision(symbol: str, interval: str, decision: Dict[str, Any]) -> None:
+    """
+    一根 bar 的交易寫入（positions、orders、trades_log、template_stats…）包在同一個 unit_of_work：
+    一次 COMMIT，失敗整組 ROLLBACK。decisions_log / risk_journal 走 write-behind，不在此交易內。
+    ROLLBACK 時 position_book 該 key 與 LinUCB 的行程內狀態（book_trade 已做的更新）可能比 DB 新，
+    兩者都標記過期，下次由 DB 重讀，避免同一筆 reward 重做時被算兩次。
+    出場判斷（_plan_exit）在進交易前先做：本根確定要平倉且 LIVE 已 armed 時，才在交易外取幣安實際成本，
+    交易期間不做對外 HTTP，沒有要平倉的 bar 也不打交易所 API。
+    """
     _log_decision(_active_session_id(), symbol, interval, decision)
 
     px = _latest_px(symbol, interval)
     if not px:
         return
-    _close_time, last_price = px
-
     cur_pos = _get_open_pos(symbol, interval)
+    plan = _plan_exit(symbol, interval, cur_pos, float(px[1]), decision) if cur_pos else None
+    cover = _close_costs(symbol, cur_pos) if plan and plan["exit"] else None
+    try:
+        with unit_of_work():
+            _apply_decision(symbol, interval, decision, px, cur_pos, plan, cost_cover=cover)
+    except BaseException:
+        position_book.invalidate(symbol, interval)
+        linucb.invalidate()
+        raise
+
+
+def _close_costs(symbol: str, pos: Dict[str, Any]) -> Optional[Dict[str, float]]:
+    """
+    LIVE 且已 armed 時取本次平倉的幣安實際成本（{} 表示取不到）；其餘情況回 None（用模擬成本）。
+    查詢視窗前後各留 1 小時，與實際平倉時間差幾毫秒不影響結果。
+    """
+    mode = _settings_mode_and_costs()
+    if mode["trade_mode"] != "LIVE" or mode["live_armed"] != 1:
+        return None
+    return _binance_costs_cover(symbol, int(pos["opened_at"]), int(time() * 1000))
+
+
+def _plan_exit(symbol: str, interval: str, cur_pos: Dict[str, Any], last_price: float,
+               decision: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    有持倉時本根的出場判斷（只讀，不寫 DB；journal 走 write-behind）：
+      new_peak：要同步的峰值（沒變為 None）
+      exit    ：None / "RISK"（should_exit 觸發，reason 為原因）/ "FLIP"（反向或無訊號）
+      hold    ：True 表示被最小持有棒數擋下（不平倉也不反向）
+    """
     action = decision.get("action", "HOLD")
     new_side = action if action in ("LONG", "SHORT") else None
+    cur_side = cur_pos["direction"]
+    entry_px = float(cur_pos["entry_price"])
+    opened_ms = int(cur_pos["opened_at"])
+    bar_ms = int(cur_pos.get("opened_bar_ms") or _bar_ms_of(interval))
+    prev_peak = float(cur_pos.get("peak_price") or entry_px)
+
+    es = _exit_settings()
+    # 先吃 policy_overrides（若有） → 讓「學到的 k」生效
+    tpl_id = int(cur_pos.get("template_id") or 0)
+    regime = int(cur_pos.get("regime_entry") or _latest_regime(symbol, interval))
+    ovr = get_overrides(symbol, interval, tpl_id, regime)
+    if ovr and ovr.get("max_hold_bars") is not None:
+        es["max_hold_bars"] = int(ovr["max_hold_bars"])
+        journal("POLICY_OVERRIDE",
+                f"apply max_hold_bars={es['max_hold_bars']} (tid={tpl_id}, regime={regime})",
+                "INFO")
+
+    # —— 動態學習 k_max（= max_hold_bars），完全獨立於 adv_enabled ——
+    risk = _settings_risk(symbol)  # 只為了拿 min_hold_bars 下界，不管開關
+    if _exit_horizon_auto_enabled():
+        old_static = es["max_hold_bars"]  # 先存起來，日誌要顯示正確的「靜態上限」
+        hard_caps = {"1m": 240, "15m": 96, "30m": 96, "1h": 96, "4h": 90}
+        dyn_k = _auto_exit_horizon(
+            symbol=symbol,
+            interval=interval,
+            bar_ms=bar_ms,
+            static_max_hold=old_static,
+            min_hold_bars=int(risk.get("min_hold_bars") or 0),
+            lookback_trades=100,
+            pctl=0.9,
+            hard_cap=hard_caps.get(interval, 240),
+        )
 
-    # 有持倉且訊號反向/無訊號 → 先平倉（但先尊重最小持有棒數）
-    # === 有持倉 → 先跑風控出場 should_exit（硬停損 / 移動停損 / 時間停損） ===
-    if cur_pos:
-        cur_side = cur_pos["direction"]
-        entry_px = float(cur_pos["entry_price"])
-        opened_ms = int(cur_pos["opened_at"])
-        bar_ms = int(cur_pos.get("opened_bar_ms") or _bar_ms_of(interval))
-        prev_peak = float(cur_pos.get("peak_price") or entry_px)
-
-        es = _exit_settings()
-        # 先吃 policy_overrides（若有） → 讓「學到的 k」生效
-        tpl_id = int(cur_pos.get("template_id") or 0)
-        regime = int(cur_pos.get("regime_entry") or _latest_regime(symbol, interval))
-        ovr = get_overrides(symbol, interval, tpl_id, regime)
-        if ovr and ovr.get("max_hold_bars") is not None:
-            es["max_hold_bars"] = int(ovr["max_hold_bars"])
-            journal("POLICY_OVERRIDE",
-                    f"apply max_hold_bars={es['max_hold_bars']} (tid={tpl_id}, regime={regime})",
+        if dyn_k is not None:
+            if es["max_hold_bars"] is not None:
+                es["max_hold_bars"] = min(int(es["max_hold_bars"]), int(dyn_k))
+            else:
+                es["max_hold_bars"] = int(dyn_k)
+            journal("AUTO_KMAX",
+                    f"dyn_k={dyn_k} (override_applied={ovr.get('max_hold_bars') if ovr else None})",
                     "INFO")
 
-        # —— 動態學習 k_max（= max_hold_bars），完全獨立於 adv_enabled ——
-        risk = _settings_risk(symbol)  # 只為了拿 min_hold_bars 下界，不管開關
-        if _exit_horizon_auto_enabled():
-            old_static = es["max_hold_bars"]  # 先存起來，日誌要顯示正確的「靜態上限」
-            hard_caps = {"1m": 240, "15m": 96, "30m": 96, "1h": 96, "4h": 90}
-            dyn_k = _auto_exit_horizon(
-                symbol=symbol,
-                interval=interval,
-                bar_ms=bar_ms,
-                static_max_hold=old_static,
-                min_hold_bars=int(risk.get("min_hold_bars") or 0),
-                lookback_trades=100,
-                pctl=0.9,
-                hard_cap=hard_caps.get(interval, 240),
-            )
-
-            if dyn_k is not None:
-                if es["max_hold_bars"] is not None:
-                    es["max_hold_bars"] = min(int(es["max_hold_bars"]), int(dyn_k))
-                else:
-                    es["max_hold_bars"] = int(dyn_k)
-                journal("AUTO_KMAX",
-                        f"dyn_k={dyn_k} (override_applied={ovr.get('max_hold_bars') if ovr else None})",
-                        "INFO")
-
-
-        hit, rsn, new_peak = should_exit(
-            direction=cur_side,
-            entry_price=entry_px,
-            last_price=float(last_price),
-            opened_at_ms=opened_ms,
-            bar_ms=bar_ms,
-            hard_sl_pct=es["hard_sl_pct"],
-            trail_backoff_pct=es["trail_backoff"],
-            trail_trigger_pct=es["trail_trigger"],
-            peak_price=prev_peak,
-            max_hold_bars=es["max_hold_bars"],
-        )
 
-        # 同步峰值（即使沒出場也要更新）
-        if new_peak is not None and abs(new_peak - prev_peak) > 1e-12:
-            _update_peak(int(cur_pos["pos_id"]), float(new_peak))
+    hit, rsn, new_peak = should_exit(
+        direction=cur_side,
+        entry_price=entry_px,
+        last_price=float(last_price),
+        opened_at_ms=opened_ms,
+        bar_ms=bar_ms,
+        hard_sl_pct=es["hard_sl_pct"],
+        trail_backoff_pct=es["trail_backoff"],
+        trail_trigger_pct=es["trail_trigger"],
+        peak_price=prev_peak,
+        max_hold_bars=es["max_hold_bars"],
+    )
 
-        # 若觸發任何出場條件 → 直接平倉並結束本根
-        if hit:
-            pnl = close_position_v2(symbol, interval, float(last_price))
+    plan: Dict[str, Any] = {"new_peak": None, "exit": None, "reason": rsn, "hold": False}
+    # 同步峰值（即使沒出場也要更新）
+    if new_peak is not None and abs(new_peak - prev_peak) > 1e-12:
+        plan["new_peak"] = float(new_peak)
+
+    # 若觸發任何出場條件 → 直接平倉並結束本根
+    if hit:
+        plan["exit"] = "RISK"
+        return plan
+
+    # === 未觸發風控出場 → 才評估反向/無訊號平倉（保留你的最小持有棒數保護） ===
+    if (new_side is None) or (new_side != cur_side):
+        risk = _settings_risk(symbol)
+        min_hold = int(risk["min_hold_bars"] or 0) if risk.get("enabled") else 0
+        if min_hold > 0:
+            held_bars = max(
+                (int(time()*1000) - int(cur_pos["opened_at"])) // int(bar_ms), 0)
+            if held_bars < min_hold:
+                journal(
+                    "MIN_HOLD_BLOCK", f"held={held_bars} < min_hold_bars={min_hold}", "INFO")
+                plan["hold"] = True  # 不平倉也不反向
+                return plan
+        plan["exit"] = "FLIP"
+    return plan
+
+
+def _apply_decision(symbol: str, interval: str, decision: Dict[str, Any], px: Tuple[int, float],
+                    cur_pos: Optional[Dict[str, Any]], plan: Optional[Dict[str, Any]], *,
+                    cost_cover: Optional[Dict[str, float]] = None) -> None:
+    _close_time, last_price = px
+    action = decision.get("action", "HOLD")
+    new_side = action if action in ("LONG", "SHORT") else None
+
+    if cur_pos and plan:
+        if plan["new_peak"] is not None:
+            _update_peak(symbol, interval, plan["new_peak"])
+        if plan["exit"] == "RISK":
+            rsn = plan["reason"]
+            pnl = close_position_v2(symbol, interval, float(last_price), cost_cover=cost_cover)
             journal(
                 "AUTO_EXIT", f"{rsn}; pnl={pnl:.6f}" if pnl is not None else rsn, "INFO")
             return
-
-        # === 未觸發風控出場 → 才評估反向/無訊號平倉（保留你的最小持有棒數保護） ===
-        if (new_side is None) or (new_side != cur_side):
-            risk = _settings_risk(symbol)
-            min_hold = int(risk["min_hold_bars"] or 0) if risk.get("enabled") else 0
-            if min_hold > 0:
-                held_bars = max(
-                    (int(time()*1000) - int(cur_pos["opened_at"])) // int(bar_ms), 0)
-                if held_bars < min_hold:
-                    journal(
-                        "MIN_HOLD_BLOCK", f"held={held_bars} < min_hold_bars={min_hold}", "INFO")
-                    return  # 不平倉也不反向
-            pnl = close_position_v2(symbol, interval, float(last_price))
+        if plan["hold"]:
+            return
+        if plan["exit"] == "FLIP":
+            pnl = close_position_v2(symbol, interval, float(last_price), cost_cover=cost_cover)
             journal(
                 "AUTO_EXIT", f"pnl={pnl:.6f}" if pnl is not None else "flip/hold exit", "INFO")
 
@@ -0,0 +1,228 @@
+# app/exec/position_book.py
+"""
+行程內持倉簿：每個 (symbol, interval) 的 OPEN 持倉放在記憶體，executor 讀持倉不再查 positions。
+
+- 第一次使用（或 main 啟動時 reconcile()）一次讀入全部 OPEN 持倉；同一 key 有多筆 OPEN 時取 opened_at 最新的，
+  與舊版 ORDER BY opened_at DESC LIMIT 1 相同
+- 寫入一律 write-through：open() INSERT 後直接用 lastrowid 當 pos_id（不再回查）；
+  update() / close() 以 UPDATE ... SET version=version+1 WHERE pos_id=:id AND version=:v AND status='OPEN' 寫回
+- 影響 0 列表示該列被別的行程或手動改過（版本不符，或沒動版本就平掉）：重讀該 key，持倉仍在就以新版本再寫一次
+- verify()：主迴圈每輪一次，只比對 OPEN 列的 (pos_id, version)，有差異的 key 才重讀
+- 交易 ROLLBACK 後記憶體可能比 DB 新：呼叫端 invalidate() 該 key，下次 get() 由 DB 重讀
+- 尚未套用 0008 遷移（沒有 version 欄）時照樣 write-through，只是不做版本檢查
+"""
+from __future__ import annotations
+import logging
+import threading
+from typing import Any, Dict, Mapping, Optional, Set, Tuple
+
+from ..db import exec, prepare
+
+log = logging.getLogger("autobot.executor")
+
+Key = Tuple[str, str]
+
+# update() 可寫回的欄位（SQL 由程式組，欄名不接受外部輸入）
+_WRITABLE = ("entry_price", "qty", "leverage", "peak_price", "status", "closed_at", "pnl_after_cost",
+             "template_id", "regime_entry", "opened_bar_ms", "session_id")
+_INSERT_COLS = ("symbol", "interval", "direction", "entry_price", "qty", "margin_type", "leverage", "status",
+                "opened_at", "template_id", "regime_entry", "opened_bar_ms", "peak_price", "session_id")
+
+_Q_OPEN_ALL = prepare("SELECT * FROM positions WHERE status='OPEN' ORDER BY opened_at, pos_id")
+_Q_OPEN_ONE = prepare(
+    "SELECT * FROM positions WHERE symbol=:s AND `interval`=:i AND status='OPEN' ORDER BY opened_at DESC LIMIT 1")
+_Q_OPEN_VERSIONS = prepare(
+    "SELECT pos_id, symbol, `interval`, version FROM positions WHERE status='OPEN' ORDER BY opened_at, pos_id")
+
+
+class PositionBook:
+    """
+    book = PositionBook()
+    pos = book.get("BTCUSDT", "1m")                       # dict（同 SELECT * 的欄位）或 None
+    pid = book.open("BTCUSDT", "1m", {...})               # INSERT + lastrowid
+    book.update("BTCUSDT", "1m", peak_price=101.0)        # write-through，版本檢查
+    book.close("BTCUSDT", "1m", closed_at=ts, pnl_after_cost=p)
+    """
+
+    def __init__(self) -> None:
+        self._rows: Dict[Key, Dict[str, Any]] = {}
+        self._stale: Set[Key] = set()
+        self._complete = False          # True：不在 _rows 的 key 即無持倉
+        self._versioned = True          # positions 有 version 欄
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "loads": 0, "reconciles": 0, "writes": 0, "conflicts": 0, "verifies": 0}
+
+    # ---- 讀 ----
+    def reconcile(self) -> int:
+        """以 DB 為準重建整本；回傳 OPEN 持倉的 key 數。"""
+        res = _Q_OPEN_ALL()
+        versioned = "version" in res.keys()
+        rows = [dict(r) for r in res.mappings().all()]
+        with self._lock:
+            self._rows = {(r["symbol"], r["interval"]): r for r in rows}   # opened_at 最新的蓋掉舊的
+            self._stale.clear()
+            self._complete = True
+            self._versioned = versioned
+            self.stats["reconciles"] += 1
+            return len(self._rows)
+
+    def _load(self, key: Key) -> Optional[Dict[str, Any]]:
+        r = _Q_OPEN_ONE(s=key[0], i=key[1]).mappings().first()
+        row = dict(r) if r else None
+        with self._lock:
+            if row is None:
+                self._rows.pop(key, None)
+            else:
+                self._rows[key] = row
+                self._versioned = "version" in row
+            self._stale.discard(key)
+            self.stats["loads"] += 1
+        return row
+
+    def get(self, symbol: str, interval: str) -> Optional[Dict[str, Any]]:
+        """該 key 的 OPEN 持倉（副本）；沒有回 None。"""
+        if not self._complete:
+            self.reconcile()
+        key = (symbol, interval)
+        with self._lock:
+            if key not in self._stale:
+                self.stats["hits"] += 1
+                row = self._rows.get(key)
+                return dict(row) if row is not None else None
+        row = self._load(key)
+        return dict(row) if row is not None else None
+
+    def invalidate(self, symbol: Optional[str] = None, interval: Optional[str] = None) -> None:
+        """標記 key 過期（symbol 有給、interval 為 None：該 symbol 全部；都不給：整本）。"""
+        with self._lock:
+            if symbol is None:
+                self._rows.clear()
+                self._stale.clear()
+                self._complete = False
+            elif interval is None:
+                self._stale.update(k for k in self._rows if k[0] == symbol)
+                self._complete = False   # 沒在簿內的 interval 也可能有持倉
+            else:
+                self._stale.add((symbol, interval))
+
+    def verify(self) -> int:
+        """比對 DB 的 OPEN (pos_id, version)，不一致的 key 重讀；回傳重讀的 key 數。"""
+        if not self._complete or not self._versioned:
+            self.reconcile()
+            return 0
+        db_rows: Dict[Key, Tuple[int, int]] = {}
+        for pid, s, i, v in _Q_OPEN_VERSIONS().all():
+            db_rows[(s, i)] = (int(pid), int(v or 0))
+        with self._lock:
+            mem = {k: (int(r["pos_id"]), int(r.get("version") or 0)) for k, r in self._rows.items()}
+            diff = [k for k in set(db_rows) | set(mem) if db_rows.get(k) != mem.get(k) or k in self._stale]
+            self.stats["verifies"] += 1
+        for k in diff:
+            self._load(k)
+        if diff:
+            log.info("position_book：%d 組持倉與 DB 不一致，已重讀：%s", len(diff), sorted(diff)[:10])
+        return len(diff)
+
+    # ---- 寫 ----
+    def open(self, symbol: str, interval: str, fields: Mapping[str, Any]) -> Optional[int]:
+        """INSERT 一筆 OPEN 持倉，pos_id 取 lastrowid；fields 為 _INSERT_COLS 的子集。"""
+        row = {c: fields.get(c) for c in _INSERT_COLS}
+        row.update(symbol=symbol, interval=interval, status="OPEN")
+        row["margin_type"] = row["margin_type"] or "ISOLATED"
+        cols = [c for c in _INSERT_COLS if row[c] is not None]
+        res = exec(
+            f"INSERT INTO positions({', '.join(f'`{c}`' for c in cols)}) VALUES({', '.join(':' + c for c in cols)})",
+            **{c: row[c] for c in cols}
+        )
+        pos_id = res.lastrowid
+        if not pos_id:   # 驅動沒給 lastrowid：退回舊做法
+            self.invalidate(symbol, interval)
+            pos = self.get(symbol, interval)
+            return int(pos["pos_id"]) if pos else None
+        row.update(pos_id=int(pos_id), closed_at=None, pnl_after_cost=None)
+        if self._versioned:
+            row["version"] = 0
+        with self._lock:
+            self._rows[(symbol, interval)] = row
+            self._stale.discard((symbol, interval))
+            self.stats["writes"] += 1
+        return int(pos_id)
+
+    def _write(self, pos: Mapping[str, Any], changes: Mapping[str, Any]) -> bool:
+        sets = ", ".join(f"`{c}`=:{c}" for c in changes)
+        params = dict(changes, id=int(pos["pos_id"]))
+        if not self._versioned:
+            res = exec(f"UPDATE positions SET {sets} WHERE pos_id=:id AND status='OPEN'", **params)
+            return int(res.rowcount or 0) > 0
+        params["v"] = int(pos.get("version") or 0)
+        res = exec(f"UPDATE positions SET {sets}, version=version+1 "
+                   f"WHERE pos_id=:id AND version=:v AND status='OPEN'", **params)
+        return int(res.rowcount or 0) > 0
+
+    def update(self, symbol: str, interval: str, **changes: Any) -> bool:
+        """
+        寫回該 key 的 OPEN 持倉；回傳是否寫入。
+        影響 0 列（版本對不上或已非 OPEN）→ 重讀；同一筆持倉仍 OPEN 就以新版本重寫一次，已被平掉/換掉則放棄。
+        """
+        bad = [c for c in changes if c not in _WRITABLE]
+        if bad:
+            raise ValueError(f"position_book.update 不支援的欄位：{bad}")
+        key = (symbol, interval)
+        pos = self.get(symbol, interval)
+        if pos is None:
+            return False
+        if not self._write(pos, changes):
+            self.stats["conflicts"] += 1
+            log.warning("positions 版本不符（pos_id=%s v=%s），重讀 %s %s",
+                        pos["pos_id"], pos.get("version"), symbol, interval)
+            cur = self._load(key)
+            if cur is None or int(cur["pos_id"]) != int(pos["pos_id"]) or not self._write(cur, changes):
+                self.invalidate(symbol, interval)
+                return False
+            pos = cur
+        row = dict(pos, **changes)
+        if self._versioned:
+            row["version"] = int(pos.get("version") or 0) + 1
+        with self._lock:
+            self.stats["writes"] += 1
+            if row.get("status") == "OPEN":
+                self._rows[key] = row
+            else:
+                self._rows.pop(key, None)
+            self._stale.discard(key)
+        return True
+
+    def close(self, symbol: str, interval: str, *, closed_at: int, pnl_after_cost: Optional[float]) -> bool:
+        return self.update(symbol, interval, status="CLOSED", closed_at=int(closed_at),
+                           pnl_after_cost=float(pnl_after_cost) if pnl_after_cost is not None else None)
+
+
+_book: Optional[PositionBook] = None
+_book_lock = threading.Lock()
+
+
+def book() -> PositionBook:
+    global _book
+    b = _book
+    if b is not None:
+        return b
+    with _book_lock:
+        if _book is None:
+            _book = PositionBook()
+        return _book
+
+
+def reconcile() -> int:
+    return book().reconcile()
+
+
+def verify() -> int:
+    return book().verify()
+
+
+def get(symbol: str, interval: str) -> Optional[Dict[str, Any]]:
+    return book().get(symbol, interval)
+
+
+def invalidate(symbol: Optional[str] = None, interval: Optional[str] = None) -> None:
+    book().invalidate(symbol, interval)
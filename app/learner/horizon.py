@@ -1,6 +1,8 @@
 from __future__ import annotations
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
+import numpy as np
 from ..db import exec as q
+from ..data import candle_store
 
 # 讀當前覆蓋
 def get_overrides(symbol: str, interval: str, template_id: int, regime: int) -> Optional[Dict[str, Any]]:
@@ -14,6 +16,17 @@ def get_overrides(symbol: str, interval: str, template_id: int, regime: int) ->
     """, tid=int(template_id), iv=interval, rg=int(regime), s=symbol).mappings().first()
     return dict(r) if r else None
 
+def _load_closes(symbol: str, interval: str, lo_ct: int, hi_ct: int) -> Tuple[List[int], List[float]]:
+    rows = q("""
+        SELECT close_time, close
+          FROM candles
+         WHERE symbol=:s AND `interval`=:i
+           AND close_time >= :a
+           AND close_time <= :b
+         ORDER BY close_time ASC
+    """, s=symbol, i=interval, a=int(lo_ct), b=int(hi_ct)).mappings().all()
+    return [int(r["close_time"]) for r in rows or []], [float(r["close"]) for r in rows or []]
+
 # 學習最佳出場棒數（簡版：在 entry→exit 區間內，用「未來 k 根的 close」模擬提前/延後出場的 PnL，挑 PnL 最佳的 k）
 def learn_exit_horizon(
     *, symbol: str, interval: str, template_id: Optional[int], regime: int,
@@ -24,20 +37,18 @@ def learn_exit_horizon(
         return
 
     # 取 entry 之後到 exit 之後一點點的 K 線（確保能看到 exit 前後的數根）
-    rows = q("""
-        SELECT close_time, close
-          FROM candles
-         WHERE symbol=:s AND `interval`=:i
-           AND close_time >= :ent - 1*60*1000
-           AND close_time <= :ext + 60*60*1000
-         ORDER BY close_time ASC
-    """, s=symbol, i=interval, ent=int(entry_ts), ext=int(exit_ts)).mappings().all()
-    if not rows:
-        return
+    lo_ct, hi_ct = int(entry_ts) - 60 * 1000, int(exit_ts) + 60 * 60 * 1000
+    v = candle_store.store().since(symbol, interval, lo_ct, until=hi_ct) if candle_store.enabled() else None
+    if v is not None:
+        if v.n == 0:
+            return
+        times = v.close_time.astype(np.int64).tolist()
+        prices = v.close.tolist()
+    else:
+        times, prices = _load_closes(symbol, interval, lo_ct, hi_ct)
+        if not times:
+            return
 
-    # 找到 entry 所在或最近的 index
-    times  = [int(r["close_time"]) for r in rows]
-    prices = [float(r["close"]) for r in rows]
     # entry_idx：第一個 close_time >= entry_ts
     entry_idx = next((i for i, t in enumerate(times) if t >= entry_ts), None)
     if entry_idx is None:
@@ -2,58 +2,13 @@
 from __future__ import annotations
 from typing import Optional, Tuple
 import json
+import logging
 from ..db import exec as q
 from ..learner.horizon import learn_exit_horizon
+from ..policy import templates_repo, template_registry, linucb
+from .. import settings_snapshot
 
-# -----------------------------------------------
-# 防守性建表（不破壞既有；僅在缺表時建立正確版本）
-# -----------------------------------------------
-
-# trades_log：與現行 DB 相容（若已存在，這段不會動到現有結構）
-q("""
-CREATE TABLE IF NOT EXISTS trades_log (
-  trade_id BIGINT NOT NULL AUTO_INCREMENT,
-  symbol VARCHAR(16) NOT NULL,
-  template_id BIGINT NULL,
-  regime TINYINT NULL,
-  `interval` VARCHAR(8) NOT NULL,
-  entry_ts BIGINT NOT NULL,
-  exit_ts BIGINT NULL,
-  entry_price DOUBLE NOT NULL,
-  exit_price DOUBLE NULL,
-  qty DOUBLE NOT NULL DEFAULT 0,
-  fee DOUBLE DEFAULT 0,
-  slippage DOUBLE DEFAULT 0,
-  funding_fee DOUBLE DEFAULT 0,
-  pnl_after_cost DOUBLE DEFAULT NULL,
-  risk_used DOUBLE DEFAULT NULL,
-  reward DOUBLE DEFAULT NULL,
-  market_features_json LONGTEXT NULL,
-  PRIMARY KEY (trade_id),
-  KEY idx_tl_time (symbol, `interval`, entry_ts),
-  KEY idx_tl_exit_ts (exit_ts),
-  KEY idx_tl_siet (symbol, `interval`, exit_ts),
-  KEY idx_tpl (template_id)
-) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
-""")
-
-# template_stats：與你匯出的實際表一致（PRIMARY KEY=(template_id, regime)）
-q("""
-CREATE TABLE IF NOT EXISTS template_stats (
-  template_id BIGINT NOT NULL,
-  regime TINYINT NOT NULL,
-  n_trades INT DEFAULT 0,
-  reward_sum DOUBLE DEFAULT 0,
-  reward_mean DOUBLE DEFAULT 0,
-  reward_var DOUBLE DEFAULT 0,
-  last_used_at BIGINT DEFAULT NULL,
-  is_frozen TINYINT DEFAULT 0,
-  sum_reward DOUBLE NOT NULL DEFAULT 0,  -- 你的表目前就有，先保留作為過渡
-  last_pnl DOUBLE NOT NULL DEFAULT 0,
-  last_exit_ts BIGINT DEFAULT NULL,
-  PRIMARY KEY (template_id, regime)
-) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
-""")
+log = logging.getLogger("autobot")
 
 # -----------------------------------------------
 # 小工具
@@ -120,22 +75,35 @@ def book_trade(
     )
 
     # 更新 template_stats（以 (template_id, regime) 為鍵）
+    # reward_var 存 M2（Welford）：M2 += (x - s/n)² · n/(n+1)。reward_var / reward_mean 必須排在
+    # n_trades / reward_sum 之前：MySQL 由左到右套用，前面的式子才讀得到舊值（SQLite 一律讀舊值）
     if template_id is not None:
         q("""
-        INSERT INTO template_stats(template_id, regime, n_trades, reward_sum, last_pnl, last_exit_ts, sum_reward)
-        VALUES(:tid, :reg, 1, :rw, :pnl, :ext, :rw)
+        INSERT INTO template_stats(template_id, regime, n_trades, reward_sum, reward_mean, reward_var,
+                                   last_pnl, last_exit_ts, sum_reward)
+        VALUES(:tid, :reg, 1, :rw, :rw, 0, :pnl, :ext, :rw)
         ON DUPLICATE KEY UPDATE
+          reward_var   = COALESCE(reward_var, 0) + CASE WHEN COALESCE(n_trades, 0) > 0
+                           THEN (:rw - reward_sum / n_trades) * (:rw - reward_sum / n_trades) * n_trades / (n_trades + 1)
+                           ELSE 0 END,
+          reward_mean  = (COALESCE(reward_sum, 0) + :rw) / (COALESCE(n_trades, 0) + 1),
           n_trades     = n_trades + 1,
           reward_sum   = reward_sum + VALUES(reward_sum),
           sum_reward   = sum_reward + VALUES(sum_reward),  -- 過渡期雙寫；日後可移除此欄位與此行
           last_pnl     = VALUES(last_pnl),
           last_exit_ts = VALUES(last_exit_ts)
         """, tid=int(template_id), reg=int(regime), rw=float(reward), pnl=float(pnl_after), ext=int(exit_ts))
+        template_registry.record_reward(int(template_id), int(regime), float(reward),
+                                        templates_repo.bump_registry_version())
+        # LinUCB：以進場當下的特徵做 Sherman–Morrison 更新（不影響入帳結果）
+        try:
+            linucb.record_reward(int(template_id), symbol, interval, int(entry_ts), float(reward))
+        except Exception as e:
+            log.warning("linucb 更新失敗：tid=%s | %s", template_id, e)
 
     # === 自動學習最佳出場棒數（僅當 settings.exit_horizon_auto=1） ===
     try:
-        ena = q("SELECT exit_horizon_auto FROM settings WHERE id=1").scalar()
-        if int(ena or 0) == 1:
+        if int(settings_snapshot.get().exit_horizon_auto) == 1:
             # 推斷方向 & 絕對張數
             direction = "LONG" if float(qty) > 0 else "SHORT"
             learn_exit_horizon(
@@ -1,16 +1,21 @@
 # app/main.py
 from __future__ import annotations
-import json, time, logging, math
+import time, logging, math
 from typing import Any, Dict, List, Tuple
-from .db import exec
+from .db import exec, maybe_dump_query_stats, query_stats
 from .config import Config
 from . import db_connect  # 確保隧道
+from . import settings_snapshot
 from .exec.executor import apply_decision
+from .exec import position_book
 from .reporter.heartbeat import set_progress, push_error
 from .session import create_session_if_needed, close_session_if_needed
 from .scheduler import build_and_start_scheduler  # ← 新增：啟動 APScheduler（含 daily/weekly evolver）
+from .data.bar_gate import gate as bar_gate
+from .policy import gap_quantile
 
 _SCHED = None  # ← 新增：保存 scheduler 參考，避免被垃圾回收
+_STREAM = None  # WebSocket K 線串流（STREAM_ENABLED=1 且有 websocket-client 時才啟用）
 
 
 logging.basicConfig(
@@ -37,12 +42,8 @@ def _now_ms_floor(interval_ms: int) -> int:
 
 def _get_last_close_ms(symbol: str, interval: str) -> int | None:
     try:
-        r = exec(
-            "SELECT MAX(close_time) AS mx FROM candles WHERE symbol=:s AND `interval`=:i",
-            s=symbol, i=interval
-        ).mappings().first()
-        mx = r and r.get("mx")
-        return int(mx) if mx is not None else None
+        from .data.collector import _last_candle_close_ms
+        return _last_candle_close_ms(symbol, interval)
     except Exception as e:
         log.warning("讀取最後 close_time 失敗：%s %s | %s", symbol, interval, e)
         return None
@@ -120,30 +121,27 @@ def _cold_fill_if_needed(symbol: str, interval: str) -> int:
 
 # ---- 設定讀取（包含 is_enabled）----
 def read_settings() -> Dict[str, Any]:
+    """每輪開頭呼叫：檢查 settings.updated_at，有變才整列重讀（見 settings_snapshot）。"""
     try:
-        row = exec("SELECT symbols_json, intervals_json, is_enabled FROM settings WHERE id=1").mappings().first()
+        snap = settings_snapshot.refresh()
     except Exception as e:
         log.error("讀取 settings 失敗: %s", e)
-        return {"symbols": ["BTCUSDT"], "intervals": ["1m"], "is_enabled": 1}
-    symbols, intervals = [], []
-    # ★★ 修正：嚴格讀 is_enabled，避免 0 被 or 1 吃掉
-    if row is not None and "is_enabled" in row and row["is_enabled"] is not None:
-        try:
-            enabled = int(row["is_enabled"])
-        except Exception:
-            enabled = 1
-    else:
-        enabled = 1
-    if row:
-        try: symbols = list(json.loads(row["symbols_json"] or "[]"))
-        except Exception as e: log.warning("settings.symbols_json 解析失敗: %s", e)
-        try: intervals = list(json.loads(row["intervals_json"] or "[]"))
-        except Exception as e: log.warning("settings.intervals_json 解析失敗: %s", e)
-    if not symbols: symbols = ["BTCUSDT"]
-    if not intervals: intervals = ["1m"]
-    return {"symbols": symbols, "intervals": intervals, "is_enabled": enabled}
+        snap = settings_snapshot.get()
+    return {"symbols": list(snap.symbols), "intervals": list(snap.intervals), "is_enabled": int(snap.is_enabled)}
 
 # ---- 單步工作 ----
+def try_migrate() -> None:
+    if not Config.MIGRATE_ON_START:
+        return
+    from .migrate import run
+    try:
+        ok = run()
+        if ok:
+            log.info("schema 遷移：已套用 %s", ok)
+    except Exception as e:
+        push_error("migrate", f"{type(e).__name__}: {e}")
+        log.exception("schema 遷移失敗：%s", e)
+
 def try_collect(symbol: str, interval: str) -> int:
     from .data.collector import fetch_klines_to_db
     wrote = fetch_klines_to_db(symbol=symbol, interval=interval)
@@ -153,6 +151,54 @@ def try_collect(symbol: str, interval: str) -> int:
         log.info("collector wrote: %s %s = %d rows", symbol, interval, wrote)
     return wrote
 
+def try_collect_many(pairs: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Any]:
+    from .data.collector import fetch_klines_many
+    t0 = time.perf_counter()
+    res = fetch_klines_many(pairs)
+    wrote = sum(v for v in res.values() if not isinstance(v, Exception))
+    failed = sum(1 for v in res.values() if isinstance(v, Exception))
+    log.info("collector 並行完成：pairs=%d wrote=%d failed=%d | %.2fs",
+             len(pairs), wrote, failed, time.perf_counter() - t0)
+    return res
+
+def try_resample(symbols: List[str], intervals: List[str]) -> Dict[Tuple[str, str], Any]:
+    from .data.resample import derive_many
+    t0 = time.perf_counter()
+    res = derive_many(symbols, intervals)
+    wrote = sum(v for v in res.values() if not isinstance(v, Exception))
+    log.info("resample 完成：pairs=%d wrote=%d | %.2fs", len(res), wrote, time.perf_counter() - t0)
+    return res
+
+def _retain_candle_store(symbols: List[str]) -> None:
+    """K 線快取只保留 settings 內的幣（移除的幣釋放記憶體與 memmap 檔）。"""
+    try:
+        from .data import candle_store
+        if candle_store.enabled():
+            n = candle_store.store().retain(symbols)
+            if n:
+                log.info("candle_store 淘汰 %d 組（已不在 settings.symbols_json）", n)
+    except Exception as e:
+        log.warning("candle_store retain 失敗：%s", e)
+
+def _ensure_stream(pairs: List[Tuple[str, str]]):
+    """STREAM_ENABLED 時啟動/更新 WebSocket 串流；不可用時回 None（全走 REST）。"""
+    global _STREAM
+    if not getattr(Config, "STREAM_ENABLED", False):
+        return None
+    try:
+        from .data import stream as kstream
+    except Exception as e:
+        log.warning("載入 stream 失敗，改用 REST：%s", e)
+        return None
+    if not kstream.available():
+        log.warning("STREAM_ENABLED=1 但未安裝 websocket-client，改用 REST 輪詢")
+        return None
+    if _STREAM is None:
+        _STREAM = kstream.KlineStream(pairs).start()
+    else:
+        _STREAM.set_pairs(pairs)
+    return _STREAM
+
 def try_features(symbol: str, interval: str) -> int:
     from .data.features import compute_and_store_features
     wrote = compute_and_store_features(symbol=symbol, interval=interval)
@@ -160,14 +206,22 @@ def try_features(symbol: str, interval: str) -> int:
         log.debug("features wrote 0 rows: %s %s (candles 可能不足或 NaN 暖機丟棄)", symbol, interval)
     return wrote
 
-def try_policy(symbol: str, interval: str) -> Dict[str, Any]:
-    from .policy.policy import evaluate_symbol_interval
-    res = evaluate_symbol_interval(symbol=symbol, interval=interval) or {}
+def _normalize_decision(res: Dict[str, Any]) -> Dict[str, Any]:
     return {"action": str(res.get("action","HOLD")).upper(),
             "E_long": float(res.get("E_long",0.0)),
             "E_short": float(res.get("E_short",0.0)),
             "template_id": res.get("template_id")}
 
+def try_policy(symbol: str, interval: str) -> Dict[str, Any]:
+    from .policy.policy import evaluate_symbol_interval
+    return _normalize_decision(evaluate_symbol_interval(symbol=symbol, interval=interval) or {})
+
+def try_policy_many(pairs: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Any]:
+    """整批評估；回傳 {(symbol, interval): 決策 dict 或 Exception}。"""
+    from .policy.policy import evaluate_many
+    return {key: res if isinstance(res, Exception) else _normalize_decision(res)
+            for key, res in evaluate_many(pairs).items()}
+
 # ---- 主循環 ----
 def one_cycle() -> None:
     # ★ 每輪先確保隧道活著（輕量檢查）
@@ -193,66 +247,142 @@ def one_cycle() -> None:
         return
 
     symbols: List[str] = st["symbols"]; intervals: List[str] = st["intervals"]
-    for s in symbols:
-        for i in intervals:
-            job_base = f"{s}:{i}"
-            # 冷啟補資料（只有啟用時才會做）
-            try:
-                set_progress(f"coldfill:{job_base}", "RUN", symbol=s, interval=i, step=0, total=1)
-                cold_wrote = _cold_fill_if_needed(s, i)
-                set_progress(f"coldfill:{job_base}", "OK", symbol=s, interval=i, step=1, total=1, pct=100.0)
-                if cold_wrote:
-                    log.info("cold-fill 完成：%s %s 共寫入 %d 筆", s, i, cold_wrote)
-            except Exception as e:
-                push_error(f"coldfill:{job_base}", f"{type(e).__name__}: {e}")
-                set_progress(f"coldfill:{job_base}", "ERROR", symbol=s, interval=i, step=0, total=1, pct=0.0)
-
-            # collector
-            wc = 0
-            try:
-                set_progress(f"collector:{job_base}", "RUN", symbol=s, interval=i, step=0, total=1)
-                wc = try_collect(s, i)
-                set_progress(f"collector:{job_base}", "OK", symbol=s, interval=i, step=1, total=1, pct=100.0)
-            except Exception as e:
-                push_error(f"collector:{job_base}", f"{type(e).__name__}: {e}")
-                set_progress(f"collector:{job_base}", "ERROR", symbol=s, interval=i, step=0, total=1, pct=0.0)
-
-            # features
-            wf = 0
-            try:
-                set_progress(f"features:{job_base}", "RUN", symbol=s, interval=i, step=0, total=1)
-                wf = try_features(s, i)
-                set_progress(f"features:{job_base}", "OK", symbol=s, interval=i, step=1, total=1, pct=100.0)
-            except Exception as e:
-                push_error(f"features:{job_base}", f"{type(e).__name__}: {e}")
-                set_progress(f"features:{job_base}", "ERROR", symbol=s, interval=i, step=0, total=1, pct=0.0)
-
-            # policy
-            res = {"action":"HOLD","E_long":0.0,"E_short":0.0,"template_id":None}
-            try:
-                set_progress(f"policy:{job_base}", "RUN", symbol=s, interval=i, step=0, total=1)
-                res = try_policy(s, i)
-                set_progress(f"policy:{job_base}", "OK", symbol=s, interval=i, step=1, total=1, pct=100.0)
-            except Exception as e:
-                push_error(f"policy:{job_base}", f"{type(e).__name__}: {e}")
-                set_progress(f"policy:{job_base}", "ERROR", symbol=s, interval=i, step=0, total=1, pct=0.0)
-
-            log.info(
-                "decision %s %s | action=%s E_long=%.3f E_short=%.3f tmpl=%s | wrote(candles=%d,features=%d)",
-                s, i, res["action"], res["E_long"], res["E_short"], res.get("template_id"), wc, wf
-            )
-            # executor
-            try:
-                set_progress(f"executor:{job_base}", "RUN", symbol=s, interval=i, step=0, total=1)
-                apply_decision(s, i, res)
-                set_progress(f"executor:{job_base}", "OK", symbol=s, interval=i, step=1, total=1, pct=100.0)
-            except Exception as e:
-                push_error(f"executor:{job_base}", f"{type(e).__name__}: {e}")
-                set_progress(f"executor:{job_base}", "ERROR", symbol=s, interval=i, step=0, total=1, pct=0.0)
+    pairs = [(s, i) for s in symbols for i in intervals]
+    _retain_candle_store(symbols)
+    for s, i in pairs:
+        job_base = f"{s}:{i}"
+        # 冷啟補資料（只有啟用時才會做）
+        try:
+            set_progress(f"coldfill:{job_base}", "RUN", symbol=s, interval=i, step=0, total=1)
+            cold_wrote = _cold_fill_if_needed(s, i)
+            set_progress(f"coldfill:{job_base}", "OK", symbol=s, interval=i, step=1, total=1, pct=100.0)
+            if cold_wrote:
+                log.info("cold-fill 完成：%s %s 共寫入 %d 筆", s, i, cold_wrote)
+        except Exception as e:
+            push_error(f"coldfill:{job_base}", f"{type(e).__name__}: {e}")
+            set_progress(f"coldfill:{job_base}", "ERROR", symbol=s, interval=i, step=0, total=1, pct=0.0)
+
+    # collector：可由 1m 合成的週期不打 API；串流已涵蓋的 pair 不再輪詢；其餘並行抓取（共用連線池 + 權重限流）
+    resample = bool(getattr(Config, "RESAMPLE_FROM_1M", False)) and "1m" in intervals
+    if resample:
+        from .data.resample import DERIVABLE
+    fetch_pairs = [p for p in pairs if not (resample and p[1] in DERIVABLE)]
+    stream = _ensure_stream(fetch_pairs)
+    rest_pairs = [p for p in fetch_pairs if stream is None or not stream.covers(p)]
+    collected = try_collect_many(rest_pairs) if rest_pairs else {}
+    if resample:
+        collected.update(try_resample(symbols, intervals))
+
+    skipped = 0
+    ready: List[Tuple[str, str, Any, bool, int, int]] = []   # (symbol, interval, bar_ct, ok, wc, wf)
+    for s, i in pairs:
+        job_base = f"{s}:{i}"
+        wc = 0
+        got = collected.get((s, i), 0)
+        if isinstance(got, Exception):
+            push_error(f"collector:{job_base}", f"{type(got).__name__}: {got}")
+            set_progress(f"collector:{job_base}", "ERROR", symbol=s, interval=i, step=0, total=1, pct=0.0)
+        else:
+            wc = int(got)
+            set_progress(f"collector:{job_base}", "OK", symbol=s, interval=i, step=1, total=1, pct=100.0)
+
+        # 收線閘門：沒有新的已收線 bar 就不跑 features / policy / executor
+        try:
+            run, bar_ct = bar_gate.check(s, i)
+        except Exception as e:
+            log.warning("bar gate 檢查失敗（照常執行）：%s %s | %s", s, i, e)
+            run, bar_ct = True, None
+        if not run:
+            skipped += 1
+            continue
+        ok = True
+
+        # features
+        wf = 0
+        try:
+            set_progress(f"features:{job_base}", "RUN", symbol=s, interval=i, step=0, total=1)
+            wf = try_features(s, i)
+            set_progress(f"features:{job_base}", "OK", symbol=s, interval=i, step=1, total=1, pct=100.0)
+        except Exception as e:
+            ok = False
+            push_error(f"features:{job_base}", f"{type(e).__name__}: {e}")
+            set_progress(f"features:{job_base}", "ERROR", symbol=s, interval=i, step=0, total=1, pct=0.0)
+        ready.append((s, i, bar_ct, ok, wc, wf))
+
+    # policy：本輪要跑的 pair 一次評估（一次 features 查詢、共用模板索引）
+    try:
+        decisions = try_policy_many([(s, i) for s, i, *_ in ready])
+    except Exception as e:
+        decisions = {(s, i): e for s, i, *_ in ready}
+
+    # 持倉簿：比對 DB 的 OPEN (pos_id, version)，被別處改過的 key 才重讀
+    if ready:
+        try:
+            position_book.verify()
+        except Exception as e:
+            log.warning("position_book 比對失敗：%s", e)
+            position_book.invalidate()
+
+    for s, i, bar_ct, ok, wc, wf in ready:
+        job_base = f"{s}:{i}"
+        # policy
+        res = {"action":"HOLD","E_long":0.0,"E_short":0.0,"template_id":None}
+        got = decisions.get((s, i))
+        if isinstance(got, Exception):
+            ok = False
+            push_error(f"policy:{job_base}", f"{type(got).__name__}: {got}")
+            set_progress(f"policy:{job_base}", "ERROR", symbol=s, interval=i, step=0, total=1, pct=0.0)
+        elif got is not None:
+            res = got
+            set_progress(f"policy:{job_base}", "OK", symbol=s, interval=i, step=1, total=1, pct=100.0)
+
+        log.info(
+            "decision %s %s | action=%s E_long=%.3f E_short=%.3f tmpl=%s | wrote(candles=%d,features=%d)",
+            s, i, res["action"], res["E_long"], res["E_short"], res.get("template_id"), wc, wf
+        )
+        # executor
+        try:
+            set_progress(f"executor:{job_base}", "RUN", symbol=s, interval=i, step=0, total=1)
+            apply_decision(s, i, res)
+            set_progress(f"executor:{job_base}", "OK", symbol=s, interval=i, step=1, total=1, pct=100.0)
+        except Exception as e:
+            ok = False
+            push_error(f"executor:{job_base}", f"{type(e).__name__}: {e}")
+            set_progress(f"executor:{job_base}", "ERROR", symbol=s, interval=i, step=0, total=1, pct=0.0)
+        if ok:
+            bar_gate.mark_done(s, i, bar_ct)
+
+    # 閘門統計：本輪略過幾組（每組約省下 features/policy/executor 約 30 次 DB 往返與一筆 decisions_log）
+    ran = len(pairs) - skipped
+    set_progress("main:gate", "OK", step=ran, total=max(1, len(pairs)),
+                 pct=round(100.0 * skipped / max(1, len(pairs)), 1))
+    log.info("bar gate：本輪執行 %d 組、略過 %d 組（無新收線）| 累計 執行=%d 略過=%d",
+             ran, skipped, bar_gate.ran, bar_gate.skipped)
+
+    # 查詢統計：每 DB_STATS_DUMP_S 寫一次 db_query_stats，並在 log 列出累計耗時前 5 名
+    try:
+        if maybe_dump_query_stats():
+            for d in query_stats(top=5):
+                log.info("db top：%.0f ms / %d 次 | p50=%.1f p95=%.1f p99=%.1f ms | %s",
+                         d["total_ms"], d["calls"], d["p50_ms"], d["p95_ms"], d["p99_ms"], d["fingerprint"][:160])
+    except Exception as e:
+        log.warning("db_query_stats 寫入失敗：%s", e)
+
+    # 動態門檻的 gap 視窗：每 GAP_SNAPSHOT_S 把有變動的 (symbol, interval) 存一次快照
+    try:
+        gap_quantile.maybe_snapshot()
+    except Exception as e:
+        log.warning("gap_quantile_state 寫入失敗：%s", e)
 
 def main():
     log.info("Autobot shadow mode start. timezone=%s", getattr(Config, "TIMEZONE", "Asia/Taipei"))
     db_connect.get_connection().close()  # 啟隧道
+    try_migrate()
+    try:
+        n = position_book.reconcile()
+        log.info("position_book 載入 OPEN 持倉 %d 組", n)
+    except Exception as e:
+        log.warning("position_book 載入失敗（第一次使用時再讀）：%s", e)
     # === 新增：啟動 APScheduler（會自動掛載 bar 任務 + daily/weekly evolver）===
     global _SCHED
     if _SCHED is None:
@@ -266,7 +396,7 @@ def main():
 
     # ★ 啟動當下保險：先建/先收一次 session
     try:
-        en = int(exec("SELECT is_enabled FROM settings WHERE id=1").scalar() or 0)
+        en = int(settings_snapshot.refresh(force=True).is_enabled)
         if en == 1:
             create_session_if_needed()
         else:
@@ -292,6 +422,12 @@ def main():
         remain = max(0, PERIOD - int(elapsed))
         set_progress("main:loop", "OK", step=1, total=1, pct=100.0)
         log.info("一輪完成，耗時 %.1fs；休息 %ds 後下一輪", elapsed, remain)
+        if _STREAM is not None:
+            # 串流模式：新 bar 寫入即提早進下一輪（收線 → 決策為毫秒級）
+            if _STREAM.bar_event.wait(remain):
+                log.debug("stream 新 bar，提早進下一輪")
+            _STREAM.bar_event.clear()
+            continue
         for sec in range(remain, 0, -1):
             if sec % 10 == 0 or sec <= 5:
                 log.debug("下一輪倒數：%ds", sec)
@@ -0,0 +1,178 @@
+# app/migrate.py
+"""
+版本化 schema 遷移：取代各模組 import 時的 CREATE / ALTER。
+
+- 遷移檔：app/migrations/NNNN_名稱.sql，依編號遞增執行；一個檔內可有多個以「;」結尾的語句
+- 已套用的版本記在 schema_version（version、name、checksum、applied_at、duration_ms）
+- 同時只允許一個行程遷移（MySQL GET_LOCK）；已套用的檔內容被改動時只警告、不重跑
+- 遷移檔一律寫成可重複執行（IF NOT EXISTS），中途斷線重跑不會壞
+
+用法：
+  python -m app.migrate            # 套用所有未套用的遷移
+  python -m app.migrate --status   # 列出各版本狀態
+  python -m app.migrate --dry-run  # 只列出將執行的語句
+"""
+from __future__ import annotations
+import re
+import sys
+import time
+import hashlib
+import logging
+import argparse
+from pathlib import Path
+from typing import Dict, List, NamedTuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from .db import exec, _retryable_run
+
+log = logging.getLogger("autobot")
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent / "migrations"
+LOCK_NAME = "autobot_migrate"
+LOCK_WAIT_S = 60
+
+_FILE_RE = re.compile(r"^(\d{4})_([A-Za-z0-9_]+)\.sql$")
+
+_VERSION_DDL = """
+CREATE TABLE IF NOT EXISTS schema_version (
+  version INT NOT NULL,
+  name VARCHAR(128) NOT NULL,
+  checksum CHAR(40) NOT NULL,
+  applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  duration_ms INT NOT NULL DEFAULT 0,
+  PRIMARY KEY (version)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    path: Path
+    checksum: str
+
+    def statements(self) -> List[str]:
+        return split_sql(self.path.read_text(encoding="utf-8"))
+
+
+def split_sql(script: str) -> List[str]:
+    """去掉整行 -- 註解，以行尾的「;」切語句。"""
+    out: List[str] = []
+    buf: List[str] = []
+    for line in script.splitlines():
+        if line.strip().startswith("--"):
+            continue
+        buf.append(line)
+        if line.rstrip().endswith(";"):
+            stmt = "\n".join(buf).strip().rstrip(";").strip()
+            if stmt:
+                out.append(stmt)
+            buf = []
+    tail = "\n".join(buf).strip()
+    if tail:
+        out.append(tail)
+    return out
+
+
+def discover(directory: Path = MIGRATIONS_DIR) -> List[Migration]:
+    found: List[Migration] = []
+    seen: Dict[int, str] = {}
+    for p in sorted(directory.glob("*.sql")):
+        m = _FILE_RE.match(p.name)
+        if not m:
+            log.warning("略過命名不符的遷移檔：%s", p.name)
+            continue
+        v = int(m.group(1))
+        if v in seen:
+            raise RuntimeError(f"遷移版本重複：{seen[v]} / {p.name}")
+        seen[v] = p.name
+        found.append(Migration(v, m.group(2), p, hashlib.sha1(p.read_bytes()).hexdigest()))
+    return found
+
+
+def applied() -> Dict[int, str]:
+    """{version: checksum}；schema_version 不存在時回空 dict。"""
+    try:
+        rows = exec("SELECT version, checksum FROM schema_version").all()
+    except Exception:
+        return {}
+    return {int(v): str(c) for v, c in rows}
+
+
+def pending() -> List[Migration]:
+    done = applied()
+    return [m for m in discover() if m.version not in done]
+
+
+def _apply(conn: Connection, todo: List[Migration]) -> List[int]:
+    mysql = conn.dialect.name == "mysql"
+    if mysql and not conn.exec_driver_sql(f"SELECT GET_LOCK('{LOCK_NAME}', {LOCK_WAIT_S})").scalar():
+        raise RuntimeError(f"等待遷移鎖逾時（{LOCK_WAIT_S}s），可能有其他行程正在遷移")
+    try:
+        conn.exec_driver_sql(_VERSION_DDL.strip())
+        conn.commit()
+        done = {int(v) for (v,) in conn.exec_driver_sql("SELECT version FROM schema_version").all()}
+        ok: List[int] = []
+        for m in todo:
+            if m.version in done:  # 等鎖期間已被別的行程套用
+                continue
+            t0 = time.perf_counter()
+            for stmt in m.statements():
+                conn.exec_driver_sql(stmt)
+            ms = int((time.perf_counter() - t0) * 1000)
+            conn.execute(text(
+                "INSERT INTO schema_version(version, name, checksum, duration_ms) VALUES (:v, :n, :c, :ms)"
+            ), {"v": m.version, "n": m.name, "c": m.checksum, "ms": ms})
+            conn.commit()
+            log.info("schema 遷移完成：%04d_%s（%d ms）", m.version, m.name, ms)
+            ok.append(m.version)
+        return ok
+    finally:
+        if mysql:
+            conn.exec_driver_sql(f"SELECT RELEASE_LOCK('{LOCK_NAME}')")
+
+
+def run() -> List[int]:
+    """套用所有未套用的遷移；回傳本次套用的版本。已是最新時只需讀一次 schema_version。"""
+    done = applied()
+    todo: List[Migration] = []
+    for m in discover():
+        if m.version not in done:
+            todo.append(m)
+        elif done[m.version] != m.checksum:
+            log.warning("遷移 %04d_%s 套用後內容已變更（不會重跑；新的變更請另開遷移檔）", m.version, m.name)
+    if not todo:
+        return []
+    return _retryable_run(lambda conn: _apply(conn, todo))
+
+
+def main(argv: List[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m app.migrate", description="套用 app/migrations 內的 schema 遷移")
+    ap.add_argument("--status", action="store_true", help="列出各版本狀態")
+    ap.add_argument("--dry-run", action="store_true", help="只列出將執行的語句")
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
+
+    if args.status:
+        done = applied()
+        for m in discover():
+            st = "applied" if m.version in done else "pending"
+            if m.version in done and done[m.version] != m.checksum:
+                st = "applied (checksum changed)"
+            print(f"{m.version:04d}_{m.name:<32} {st}")
+        return 0
+    if args.dry_run:
+        for m in pending():
+            print(f"-- {m.version:04d}_{m.name}")
+            for stmt in m.statements():
+                print(stmt + ";\n")
+        return 0
+    ok = run()
+    print("已是最新版本" if not ok else "已套用：" + ", ".join(f"{v:04d}" for v in ok))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
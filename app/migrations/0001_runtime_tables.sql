@@ -0,0 +1,95 @@
+-- 0001：原本在 import 時執行的防守性建表（executor.py / rewards.py），皆為 IF NOT EXISTS，對既有 DB 無副作用
+
+-- executor：positions / run_sessions / decisions_log
+CREATE TABLE IF NOT EXISTS positions (
+  pos_id BIGINT NOT NULL AUTO_INCREMENT,
+  symbol VARCHAR(16) NOT NULL,
+  direction ENUM('LONG','SHORT') NOT NULL,
+  entry_price DOUBLE NOT NULL,
+  qty DOUBLE NOT NULL,
+  margin_type VARCHAR(16) DEFAULT 'ISOLATED',
+  leverage INT DEFAULT 1,
+  status ENUM('OPEN','CLOSED') NOT NULL DEFAULT 'OPEN',
+  opened_at BIGINT NOT NULL,
+  closed_at BIGINT NULL,
+  pnl_after_cost DOUBLE DEFAULT 0,
+  PRIMARY KEY (pos_id),
+  KEY idx_positions_s (symbol),
+  KEY idx_positions_o (status, opened_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+ALTER TABLE positions ADD COLUMN IF NOT EXISTS `interval` VARCHAR(8) NULL;
+ALTER TABLE positions ADD COLUMN IF NOT EXISTS `template_id` BIGINT NULL;
+ALTER TABLE positions ADD COLUMN IF NOT EXISTS `regime_entry` TINYINT NULL;
+ALTER TABLE positions ADD COLUMN IF NOT EXISTS `opened_bar_ms` INT NULL;
+ALTER TABLE positions ADD COLUMN IF NOT EXISTS `peak_price` DOUBLE NULL;
+ALTER TABLE settings ADD COLUMN IF NOT EXISTS `exit_horizon_auto` TINYINT(1) NOT NULL DEFAULT 0;
+
+CREATE TABLE IF NOT EXISTS run_sessions (
+  session_id BIGINT NOT NULL AUTO_INCREMENT,
+  started_at BIGINT NOT NULL,
+  stopped_at BIGINT DEFAULT NULL,
+  is_active TINYINT(1) NOT NULL DEFAULT 1,
+  trade_mode ENUM('SIM','LIVE') NOT NULL DEFAULT 'SIM',
+  PRIMARY KEY (session_id),
+  KEY idx_active (is_active),
+  KEY idx_started (started_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS decisions_log (
+  id BIGINT NOT NULL AUTO_INCREMENT,
+  session_id BIGINT DEFAULT NULL,
+  ts BIGINT NOT NULL,
+  symbol VARCHAR(16) NOT NULL,
+  `interval` VARCHAR(8) NOT NULL,
+  action ENUM('LONG','SHORT','HOLD') NOT NULL,
+  is_flat TINYINT(1) NOT NULL DEFAULT 1,
+  E_long DOUBLE DEFAULT NULL,
+  E_short DOUBLE DEFAULT NULL,
+  template_id BIGINT DEFAULT NULL,
+  PRIMARY KEY (id),
+  KEY idx_sess (session_id),
+  KEY idx_time (ts),
+  KEY idx_sym_iv (symbol, `interval`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- rewards：trades_log / template_stats（與現行 DB 相容）
+CREATE TABLE IF NOT EXISTS trades_log (
+  trade_id BIGINT NOT NULL AUTO_INCREMENT,
+  symbol VARCHAR(16) NOT NULL,
+  template_id BIGINT NULL,
+  regime TINYINT NULL,
+  `interval` VARCHAR(8) NOT NULL,
+  entry_ts BIGINT NOT NULL,
+  exit_ts BIGINT NULL,
+  entry_price DOUBLE NOT NULL,
+  exit_price DOUBLE NULL,
+  qty DOUBLE NOT NULL DEFAULT 0,
+  fee DOUBLE DEFAULT 0,
+  slippage DOUBLE DEFAULT 0,
+  funding_fee DOUBLE DEFAULT 0,
+  pnl_after_cost DOUBLE DEFAULT NULL,
+  risk_used DOUBLE DEFAULT NULL,
+  reward DOUBLE DEFAULT NULL,
+  market_features_json LONGTEXT NULL,
+  PRIMARY KEY (trade_id),
+  KEY idx_tl_time (symbol, `interval`, entry_ts),
+  KEY idx_tl_exit_ts (exit_ts),
+  KEY idx_tl_siet (symbol, `interval`, exit_ts),
+  KEY idx_tpl (template_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+CREATE TABLE IF NOT EXISTS template_stats (
+  template_id BIGINT NOT NULL,
+  regime TINYINT NOT NULL,
+  n_trades INT DEFAULT 0,
+  reward_sum DOUBLE DEFAULT 0,
+  reward_mean DOUBLE DEFAULT 0,
+  reward_var DOUBLE DEFAULT 0,
+  last_used_at BIGINT DEFAULT NULL,
+  is_frozen TINYINT DEFAULT 0,
+  sum_reward DOUBLE NOT NULL DEFAULT 0,  -- 你的表目前就有，先保留作為過渡
+  last_pnl DOUBLE NOT NULL DEFAULT 0,
+  last_exit_ts BIGINT DEFAULT NULL,
+  PRIMARY KEY (template_id, regime)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
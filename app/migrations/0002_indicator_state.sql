@@ -0,0 +1,11 @@
+-- 0002：增量指標狀態（app/data/indicator_state.py）
+CREATE TABLE IF NOT EXISTS indicator_state (
+  symbol VARCHAR(16) NOT NULL,
+  `interval` VARCHAR(8) NOT NULL,
+  close_time BIGINT NOT NULL,
+  version INT NOT NULL,
+  anchor_sum CHAR(40) NOT NULL,
+  state_json LONGTEXT NOT NULL,
+  updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (symbol, `interval`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
@@ -0,0 +1,19 @@
+-- 0003：查詢統計快照（db.dump_query_stats；每個行程 × SQL 指紋一列，存累計值與最近視窗分位數）
+CREATE TABLE IF NOT EXISTS db_query_stats (
+  proc VARCHAR(64) NOT NULL,
+  fp_hash CHAR(40) NOT NULL,
+  fingerprint TEXT NOT NULL,
+  calls BIGINT NOT NULL DEFAULT 0,
+  errors BIGINT NOT NULL DEFAULT 0,
+  retries BIGINT NOT NULL DEFAULT 0,
+  rows_total BIGINT NOT NULL DEFAULT 0,
+  slow_calls BIGINT NOT NULL DEFAULT 0,
+  total_ms DOUBLE NOT NULL DEFAULT 0,
+  p50_ms DOUBLE NOT NULL DEFAULT 0,
+  p95_ms DOUBLE NOT NULL DEFAULT 0,
+  p99_ms DOUBLE NOT NULL DEFAULT 0,
+  max_ms DOUBLE NOT NULL DEFAULT 0,
+  updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (proc, fp_hash),
+  KEY idx_dqs_updated (updated_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
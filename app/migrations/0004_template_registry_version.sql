@@ -0,0 +1,10 @@
+-- 0004：模板池版本號（app/policy/template_registry.py）；templates / template_stats 由本程式寫入時 +1，
+-- 其他行程比對版本即可知道行程內快取是否過期
+CREATE TABLE IF NOT EXISTS template_registry_version (
+  id TINYINT NOT NULL,
+  version BIGINT NOT NULL DEFAULT 0,
+  updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+INSERT IGNORE INTO template_registry_version(id, version) VALUES (1, 0);
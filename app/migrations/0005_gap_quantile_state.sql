@@ -0,0 +1,9 @@
+-- 0005：動態進場門檻的 gap 視窗快照（app/policy/gap_quantile.py）；每個 (symbol, interval) 最近 GAP_WINDOW 筆 |E_long - E_short|
+CREATE TABLE IF NOT EXISTS gap_quantile_state (
+  symbol VARCHAR(16) NOT NULL,
+  `interval` VARCHAR(8) NOT NULL,
+  n INT NOT NULL,
+  gaps_json LONGTEXT NOT NULL,
+  updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (symbol, `interval`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
@@ -0,0 +1,2 @@
+-- 0006：模板選擇的 bandit 模式（app/policy/bandit.py）：ucb1 / ucbv / thompson
+ALTER TABLE settings ADD COLUMN IF NOT EXISTS `bandit_mode` VARCHAR(16) NOT NULL DEFAULT 'ucb1';
@@ -0,0 +1,12 @@
+-- 0007：LinUCB 模板選擇的 ridge regression 狀態（app/policy/linucb.py）；
+-- a_inv / b 為 little-endian float64 陣列（d×d、d），version 為特徵定義版本，不符時視為沒有狀態
+CREATE TABLE IF NOT EXISTS linucb_state (
+  template_id BIGINT NOT NULL,
+  version INT NOT NULL,
+  d INT NOT NULL,
+  n_updates INT NOT NULL DEFAULT 0,
+  a_inv BLOB NOT NULL,
+  b BLOB NOT NULL,
+  updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (template_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
@@ -0,0 +1,3 @@
+-- 0008：持倉列的版本號（app/exec/position_book.py）；本程式每次改寫該列時 +1，
+-- 行程內的持倉簿以 WHERE version=:v 寫回，對不上即表示被別處改過，改從 DB 重讀
+ALTER TABLE positions ADD COLUMN IF NOT EXISTS `version` INT NOT NULL DEFAULT 0;
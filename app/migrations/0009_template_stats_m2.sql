@@ -0,0 +1,16 @@
+-- 0009：book_trade 先前只累加 n_trades / reward_sum，reward_var（M2）與 reward_mean 一直是 0；
+-- 由 trades_log 回填（筆數與 n_trades 對得上的列才回填；之後由 book_trade 以 Welford 累積）
+UPDATE template_stats
+   SET reward_var = (SELECT SUM(t.reward * t.reward) - SUM(t.reward) * SUM(t.reward) / COUNT(*)
+                       FROM trades_log t
+                      WHERE t.template_id = template_stats.template_id AND t.regime = template_stats.regime)
+ WHERE n_trades > 1
+   AND COALESCE(reward_var, 0) = 0
+   AND n_trades = (SELECT COUNT(*)
+                     FROM trades_log t
+                    WHERE t.template_id = template_stats.template_id AND t.regime = template_stats.regime
+                      AND t.reward IS NOT NULL);
+
+UPDATE template_stats SET reward_var = 0 WHERE reward_var < 0;
+
+UPDATE template_stats SET reward_mean = reward_sum / n_trades WHERE n_trades > 0;
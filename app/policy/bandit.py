@@ -1,57 +1,208 @@
 # app/policy/bandit.py
+"""
+模板選擇的 bandit 估計器（整批）：一次拿到所有候選模板的 (n, mean, var)，以 NumPy 一次算完分數。
+
+- 統計來源：
+  * arms_from_summaries()：template_registry 的彙總（決策熱路徑，0 次 DB 往返）
+  * load_arms()：直接查 template_stats，所有候選一次 GROUP BY（1 次往返，與候選數無關）
+- 模式（settings.bandit_mode；另有 linucb，見 app/policy/linucb.py）：
+  * ucb1     ：mean + c * sqrt(ln(total) / n)（同 templates_eval.bandit_score，結果逐位元相同）
+  * ucbv     ：UCB-V，mean + sqrt(2 * c * var * ln(total) / n) + 3 * c * b * ln(total) / n；
+               reward 沒有固定上下界，b 以候選池的合併標準差代替
+  * thompson ：常態近似的 Thompson sampling，整個候選池一次 standard_normal(k) 抽樣；
+               後驗 N(mean, max(var, 池變異) / n)
+  三種模式都再扣 risk_penalty * sqrt(var)；n=0 的模板分數為 +inf（優先探索）。
+"""
 from __future__ import annotations
-from typing import Tuple, Optional
 import math
+import logging
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
 from ..db import exec  # 若你改成 q，請用：from ..db import q as exec
 
+log = logging.getLogger("autobot.policy")
+
+MODES = ("ucb1", "ucbv", "thompson")
+DEFAULT_MODE = "ucb1"
+
 # UCB 探索係數（可依 regime/波動動態調整）
 ALPHA: float = 1.0
 
+
+class Arms:
+    """候選模板的統計陣列（順序即候選順序；分數相同時取前者）。"""
+    __slots__ = ("ids", "n", "mean", "var")
+
+    def __init__(self, ids: Sequence[int], n: Sequence[float], mean: Sequence[float], var: Sequence[float]) -> None:
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.n = np.asarray(n, dtype=float)
+        self.mean = np.asarray(mean, dtype=float)
+        self.var = np.asarray(var, dtype=float)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+def _fin(x: Any) -> float:
+    try:
+        v = float(x or 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+    return v if math.isfinite(v) else 0.0
+
+
+def arms_from_summaries(template_ids: Sequence[int], summaries: Dict[int, Dict[str, Any]]) -> Arms:
+    """由 repo.summarize_stats 格式的彙總組陣列（沒有統計的模板視為 n=0）。"""
+    ids = [int(t) for t in template_ids]
+    rows = [summaries.get(t) or {} for t in ids]
+    return Arms(ids,
+                [int(r.get("n_trades") or 0) for r in rows],
+                [_fin(r.get("reward_mean")) for r in rows],
+                [_fin(r.get("reward_var")) for r in rows])
+
+
+def load_arms(template_ids: Sequence[int], regime: Optional[int] = None) -> Arms:
+    """
+    一次查出所有候選的 n_trades / reward_sum / reward_var（M2），跨 regime 加總後同 summarize_stats 換算；
+    regime 有給時只看該 regime。
+    """
+    ids = [int(t) for t in template_ids]
+    if not ids:
+        return Arms([], [], [], [])
+    params: Dict[str, Any] = {f"t{j}": t for j, t in enumerate(ids)}
+    where = f"template_id IN ({', '.join(':' + k for k in params)})"
+    if regime is not None:
+        where += " AND regime=:r"
+        params["r"] = int(regime)
+    rows = exec(f"""
+        SELECT template_id, SUM(n_trades) AS n, SUM(reward_sum) AS s, SUM(reward_var) AS m2
+          FROM template_stats
+         WHERE {where}
+         GROUP BY template_id
+    """, **params).all()
+    got = {int(r[0]): (int(r[1] or 0), _fin(r[2]), _fin(r[3])) for r in rows}
+    n, mean, var = [], [], []
+    for t in ids:
+        k, s, m2 = got.get(t, (0, 0.0, 0.0))
+        n.append(k)
+        mean.append(s / k if k > 0 else 0.0)
+        var.append(m2 / k if k > 0 else 0.0)
+    return Arms(ids, n, mean, var)
+
+
+class BatchEstimator:
+    """
+    estimator = BatchEstimator("thompson", c=2.0, risk_penalty=0.05)
+    k = estimator.select(arms, total_plays)   # arms.ids[k] 即選中的 template_id
+    """
+
+    def __init__(self, mode: str = DEFAULT_MODE, c: float = 2.0, risk_penalty: float = 0.0,
+                 rng: Optional[np.random.Generator] = None) -> None:
+        mode = str(mode or DEFAULT_MODE).lower()
+        if mode not in MODES:
+            log.warning("未知的 bandit_mode=%r，改用 %s", mode, DEFAULT_MODE)
+            mode = DEFAULT_MODE
+        self.mode = mode
+        self.c = float(c)
+        self.risk_penalty = float(risk_penalty)
+        self.rng = rng if rng is not None else np.random.default_rng()
+
+    @property
+    def deterministic(self) -> bool:
+        """同一份統計是否必得同一結果（policy 以此決定能否記住選擇）。"""
+        return self.mode != "thompson"
+
+    def scores(self, arms: Arms, total_plays: int) -> np.ndarray:
+        n, mean, var = arms.n, arms.mean, np.maximum(arms.var, 0.0)
+        tried = n > 0
+        nn = np.where(tried, n, 1.0)
+        log_t = math.log(max(int(total_plays), 1))   # 用 math.log：ucb1 與 bandit_score 逐位元相同
+        with np.errstate(invalid="ignore", over="ignore"):
+            if self.mode == "ucb1":
+                score = mean + self.c * np.sqrt(log_t / nn)
+            elif self.mode == "ucbv":
+                b = _pooled_std(arms)
+                score = mean + np.sqrt(2.0 * self.c * var * log_t / nn) + 3.0 * self.c * b * log_t / nn
+            else:
+                prior = _pooled_std(arms) ** 2
+                sd = np.sqrt(np.maximum(var, prior) / nn)
+                score = mean + sd * self.rng.standard_normal(len(arms))
+            score = np.where(tried, score, np.inf)
+            score = score - self.risk_penalty * np.sqrt(var)
+        return np.where(np.isnan(score), -np.inf, score)
+
+    def select(self, arms: Arms, total_plays: int) -> Optional[int]:
+        """回傳最佳候選的位置（同分取前者）；沒有候選回 None。"""
+        if not len(arms):
+            return None
+        return int(np.argmax(self.scores(arms, total_plays)))
+
+
+def _pooled_std(arms: Arms) -> float:
+    """候選池的合併標準差 sqrt(ΣM2 / Σn)；沒有資料時回 1.0。"""
+    n = float(arms.n.sum())
+    if n <= 0:
+        return 1.0
+    sd = math.sqrt(max(float((arms.var * arms.n).sum()), 0.0) / n)
+    return sd if sd > 0 and math.isfinite(sd) else 1.0
+
+
+_estimators: Dict[Tuple[str, float, float], BatchEstimator] = {}
+
+
+def get_estimator(mode: str, c: float = 2.0, risk_penalty: float = 0.0) -> BatchEstimator:
+    """依參數共用同一個 estimator（thompson 共用同一個亂數產生器）。"""
+    key = (str(mode or DEFAULT_MODE).lower(), float(c), float(risk_penalty))
+    est = _estimators.get(key)
+    if est is None:
+        est = _estimators[key] = BatchEstimator(*key)
+    return est
+
+
 class Estimator:
     """
     以模板(template_id) × 情境(regime) 的歷史統計，估計其期望值與 UCB。
     - 資料來源：template_stats (n_trades, reward_mean, reward_var)
     - 回傳: (mean, ucb)，給 policy 選擇臂。
+    - estimate_many()：多個模板一次查詢
     """
 
     def __init__(self, alpha: float = ALPHA) -> None:
         self.alpha = float(alpha)
 
-    def _fetch_stats(self, template_id: int, regime: int) -> Optional[dict]:
-        row = exec(
-            "SELECT n_trades, reward_mean, reward_var "
-            "FROM template_stats WHERE template_id=:t AND regime=:r",
-            t=int(template_id), r=int(regime)
-        ).mappings().first()
-        return dict(row) if row else None
+    def estimate_many(self, template_ids: Sequence[int], regime: int) -> Dict[int, Tuple[float, float]]:
+        """
+        回傳 {template_id: (mean, ucb)}
+        若無資料 → mean=0, ucb=+inf（鼓勵探索）
+        """
+        ids = [int(t) for t in template_ids]
+        if not ids:
+            return {}
+        params: Dict[str, Any] = {f"t{j}": t for j, t in enumerate(ids)}
+        rows = exec(
+            "SELECT template_id, n_trades, reward_mean, reward_var "
+            f"FROM template_stats WHERE regime=:r AND template_id IN ({', '.join(':' + k for k in params)})",
+            r=int(regime), **params
+        ).mappings().all()
+        got = {int(r["template_id"]): r for r in rows}
+        out: Dict[int, Tuple[float, float]] = {}
+        for t in ids:
+            stats = got.get(t)
+            if not stats or not stats.get("n_trades"):
+                out[t] = (0.0, float("inf"))
+                continue
+            n = max(int(stats.get("n_trades") or 0), 1)
+            mean = float(stats.get("reward_mean") or 0.0)
+            var = float(stats.get("reward_var") or 0.0)
+            var = max(var, 1e-9)  # 避免 0 導致 ucb 無法探索
+            out[t] = (mean, mean + self.alpha * math.sqrt(var / n))
+        return out
 
     def estimate(self, template_id: int, regime: int) -> Tuple[float, float]:
         """
         回傳 (mean, ucb)
         若無資料 → mean=0, ucb=+inf（鼓勵探索）
         """
-        stats = self._fetch_stats(template_id, regime)
-        if not stats or not stats.get("n_trades"):
-            return 0.0, float("inf")
-
-        n = max(int(stats.get("n_trades") or 0), 1)
-        mean = float(stats.get("reward_mean") or 0.0)
-        var = float(stats.get("reward_var") or 0.0)
-        var = max(var, 1e-9)  # 避免 0 導致 ucb 無法探索
-
-        ucb = mean + self.alpha * math.sqrt(var / n)
-        return mean, ucb
-
-
-# ----（選用）Thompson Sampling 版本骨架，之後要切換可直接用 ----
-# import random
-# import numpy as np
-# class ThompsonEstimator(Estimator):
-#     def sample(self, template_id: int, regime: int) -> float:
-#         stats = self._fetch_stats(template_id, regime)
-#         if not stats or not stats.get("n_trades"):
-#             return float("+inf")  # 未知臂高探索
-#         mean = float(stats.get("reward_mean") or 0.0)
-#         var  = max(float(stats.get("reward_var") or 1.0), 1e-6)
-#         # 以正態近似的 TS（亦可改 Beta / Gaussian Process 等）
-#         return random.gauss(mean, math.sqrt(var))
+        return self.estimate_many([template_id], regime)[int(template_id)]
@@ -0,0 +1,163 @@
+# app/policy/gap_quantile.py
+"""
+動態進場門檻用的 gap 分位數：每個 (symbol, interval) 在記憶體保留最近 GAP_WINDOW 筆
+gap=|E_long - E_short| 的滑動視窗，決策時直接取分位數，不再每次讀 decisions_log。
+
+- 視窗只有數百筆，維持一份排序好的副本（bisect 插入 / 刪除），取分位數 O(1)、更新 O(n) 的記憶體搬移；
+  結果與舊版「取最近 n 筆排序後取第 int(n*q) 個」完全相同（不是近似）
+- 由 policy 每次決策餵入（observe），順序與 executor 寫入 decisions_log 的順序一致
+- 冷啟動：先讀 gap_quantile_state 快照，沒有快照才從 decisions_log 補最近 GAP_WINDOW 筆（每個 key 只做一次）
+- maybe_snapshot()：主迴圈每輪呼叫，距上次超過 GAP_SNAPSHOT_S 才把有變動的視窗 UPSERT 進快照表；行程結束時再寫一次
+"""
+from __future__ import annotations
+import json
+import time
+import atexit
+import bisect
+import logging
+import threading
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from ..db import exec, bulk_upsert
+from ..config import Config
+
+log = logging.getLogger("autobot.policy")
+
+Key = Tuple[str, str]
+
+
+class SlidingQuantile:
+    """固定長度滑動視窗的精確分位數。"""
+    __slots__ = ("size", "_fifo", "_sorted")
+
+    def __init__(self, size: int, values: Iterable[float] = ()) -> None:
+        self.size = max(1, int(size))
+        self._fifo: Deque[float] = deque()
+        self._sorted: List[float] = []
+        for v in values:
+            self.push(v)
+
+    def __len__(self) -> int:
+        return len(self._fifo)
+
+    def push(self, x: float) -> None:
+        x = float(x)
+        if len(self._fifo) >= self.size:
+            old = self._fifo.popleft()
+            del self._sorted[bisect.bisect_left(self._sorted, old)]
+        self._fifo.append(x)
+        bisect.insort(self._sorted, x)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """排序後取第 int(n*q) 個（夾在 0..n-1），同原本讀 decisions_log 的算法。"""
+        n = len(self._sorted)
+        if n == 0:
+            return None
+        k = max(0, min(int(n * float(q)), n - 1))
+        return self._sorted[k]
+
+    def values(self) -> List[float]:
+        """由舊到新。"""
+        return list(self._fifo)
+
+
+_windows: Dict[Key, SlidingQuantile] = {}
+_dirty: Set[Key] = set()
+_lock = threading.Lock()
+_last_snapshot = time.monotonic()
+stats = {"observed": 0, "seeded_snapshot": 0, "seeded_log": 0, "snapshots": 0}
+
+
+def _seed(symbol: str, interval: str, size: int) -> List[float]:
+    r = exec("SELECT gaps_json FROM gap_quantile_state WHERE symbol=:s AND `interval`=:i",
+             s=symbol, i=interval).first()
+    if r is not None:
+        try:
+            vals = [float(x) for x in json.loads(r[0] or "[]")]
+            stats["seeded_snapshot"] += 1
+            return vals[-size:]
+        except (TypeError, ValueError):
+            log.warning("gap_quantile_state 內容無法解析，改由 decisions_log 補：%s %s", symbol, interval)
+    rows = exec("""
+        SELECT ABS(COALESCE(E_long,0) - COALESCE(E_short,0)) AS gap
+          FROM decisions_log
+         WHERE symbol=:s AND `interval`=:i
+         ORDER BY id DESC
+         LIMIT :n
+    """, s=symbol, i=interval, n=int(size)).all()
+    stats["seeded_log"] += 1
+    return [float(g) for (g,) in reversed(rows) if g is not None]
+
+
+def window(symbol: str, interval: str) -> SlidingQuantile:
+    """取（必要時冷啟動建立）該 key 的視窗。"""
+    key = (symbol, interval)
+    w = _windows.get(key)
+    if w is not None:
+        return w
+    size = int(Config.GAP_WINDOW)
+    vals = _seed(symbol, interval, size)   # 不持鎖讀 DB
+    with _lock:
+        w = _windows.get(key)
+        if w is None:
+            w = _windows[key] = SlidingQuantile(size, vals)
+    return w
+
+
+def observe(symbol: str, interval: str, gap: float) -> None:
+    w = window(symbol, interval)
+    with _lock:
+        w.push(gap)
+        _dirty.add((symbol, interval))
+        stats["observed"] += 1
+
+
+def quantile(symbol: str, interval: str, q: float = 0.60, min_n: int = 50) -> Optional[float]:
+    """最近 GAP_WINDOW 筆 gap 的分位數 q；不足 min_n 筆回 None。"""
+    w = window(symbol, interval)
+    with _lock:
+        if len(w) < min_n:
+            return None
+        return w.quantile(q)
+
+
+def snapshot() -> int:
+    """把有變動的視窗寫進 gap_quantile_state；回傳寫入列數。"""
+    global _last_snapshot
+    with _lock:
+        rows = [(s, i, len(_windows[(s, i)]), json.dumps(_windows[(s, i)].values(), separators=(",", ":")))
+                for (s, i) in _dirty]
+        keys = set(_dirty)
+        _dirty.clear()
+        _last_snapshot = time.monotonic()
+    if not rows:
+        return 0
+    try:
+        bulk_upsert("gap_quantile_state", ("symbol", "interval", "n", "gaps_json"), rows,
+                    update_columns=("n", "gaps_json"))
+    except Exception:
+        with _lock:
+            _dirty.update(keys)   # 下次再寫
+        raise
+    stats["snapshots"] += 1
+    return len(rows)
+
+
+def maybe_snapshot() -> int:
+    every = int(Config.GAP_SNAPSHOT_S or 0)
+    if every <= 0 or time.monotonic() - _last_snapshot < every:
+        return 0
+    return snapshot()
+
+
+def _snapshot_at_exit() -> None:
+    if int(Config.GAP_SNAPSHOT_S or 0) <= 0:
+        return
+    try:
+        snapshot()
+    except Exception as e:
+        log.warning("gap 視窗快照寫入失敗（結束時）：%s", e)
+
+
+atexit.register(_snapshot_at_exit)
@@ -0,0 +1,222 @@
+# app/policy/linucb.py
+"""
+情境式（contextual）模板選擇：LinUCB（disjoint，每個模板一組 ridge regression 狀態）。
+
+- 情境向量 x：由最新一根 features 轉成 d=7 維、各維約落在 [-1, 1] 的無單位特徵（context()）；
+  價格單位的欄位（macd_hist / slope）一律換成比值或不用，不同幣種可共用同一組權重
+- 每個模板保存 A⁻¹（d×d）與 b（d）；θ = A⁻¹ b
+  分數 = θ·x + LINUCB_ALPHA * sqrt(xᵀ A⁻¹ x)；沒有狀態的模板 A⁻¹ = I / LINUCB_LAMBDA、b = 0
+- 全部模板的 A⁻¹ / θ 放在連續的 NumPy 陣列，候選池打分只需一次批次矩陣-向量乘法（score()）
+- book_trade 入帳時以進場當下的 features 為 x 做 Sherman–Morrison 更新（O(d²)，不做反矩陣），
+  並把該模板的 A⁻¹ / b 以 float64 bytes 寫回 linucb_state（每筆成交一次 UPSERT）
+- 行程內第一次使用時一次讀入全部狀態；FEATURE_VERSION 不符的列視為沒有狀態
+"""
+from __future__ import annotations
+import math
+import logging
+import threading
+from typing import Any, Mapping, Optional, Sequence
+
+import numpy as np
+
+from ..db import exec, prepare
+from ..config import Config
+
+log = logging.getLogger("autobot.policy")
+
+MODE = "linucb"          # settings.bandit_mode 的值
+FEATURE_VERSION = 1      # context() 的定義有變就 +1（舊狀態作廢）
+D = 7
+
+_DT = np.dtype("<f8")
+
+
+def _num(r: Mapping[str, Any], key: str, default: float) -> float:
+    v = r.get(key)
+    try:
+        v = float(v) if v is not None else default
+    except (TypeError, ValueError):
+        return default
+    return v if math.isfinite(v) else default
+
+
+def context(feat: Mapping[str, Any]) -> np.ndarray:
+    """features 一列 → 情境向量（偏置、RSI、KD、MACD 相對強弱、量比、波動、regime）；欄位同 policy 讀的 features。"""
+    dif, dea, hist = _num(feat, "macd_dif", 0.0), _num(feat, "macd_dea", 0.0), _num(feat, "macd_hist", 0.0)
+    volr = _num(feat, "vol_ratio", 1.0)
+    return np.array([
+        1.0,
+        max(-1.0, min(1.0, (_num(feat, "rsi", 50.0) - 50.0) / 50.0)),
+        math.tanh(_num(feat, "kd_diff", 0.0) / 20.0),
+        math.tanh(hist / (abs(dif) + abs(dea) + 1e-12)),
+        math.tanh(math.log(volr)) if volr > 0 else -1.0,
+        math.tanh(_num(feat, "atr_pct", 0.0) * 100.0),
+        1.0 if _num(feat, "regime", 0.0) >= 0 else -1.0,
+    ])
+
+
+class LinUCBStore:
+    """全部模板的 (A⁻¹, b, θ)；列號由 template_id 查表（_row），容量不足時倍增。"""
+
+    def __init__(self, d: int = D, lam: float = 1.0) -> None:
+        self.d = int(d)
+        self.lam = float(lam)
+        self.a_inv = np.zeros((0, d, d))
+        self.b = np.zeros((0, d))
+        self.theta = np.zeros((0, d))
+        self.n_updates = np.zeros(0, dtype=np.int64)
+        self.ids = np.zeros(0, dtype=np.int64)
+        self._row = np.full(1, -1, dtype=np.int64)   # template_id → 列號（-1 = 尚未配置）
+        self.size = 0
+
+    def rows(self, template_ids: Sequence[int]) -> np.ndarray:
+        """取列號；沒配置過的模板以先驗 (I/λ, 0) 配置。"""
+        tids = np.asarray(template_ids, dtype=np.int64)
+        if len(tids) and int(tids.max()) >= len(self._row):
+            grow = np.full(max(int(tids.max()) + 1, 2 * len(self._row)), -1, dtype=np.int64)
+            grow[:len(self._row)] = self._row
+            self._row = grow
+        rows = self._row[tids]
+        missing = tids[rows < 0]
+        if len(missing):
+            for t in dict.fromkeys(missing.tolist()):
+                self._alloc(int(t))
+            rows = self._row[tids]
+        return rows
+
+    def _alloc(self, tid: int) -> int:
+        if self.size == len(self.ids):
+            cap = max(16, 2 * len(self.ids))
+            for name in ("a_inv", "b", "theta", "n_updates", "ids"):
+                old = getattr(self, name)
+                new = np.zeros((cap,) + old.shape[1:], dtype=old.dtype)
+                new[:self.size] = old[:self.size]
+                setattr(self, name, new)
+        r = self.size
+        self.size += 1
+        self.a_inv[r] = np.eye(self.d) / self.lam
+        self.b[r] = 0.0
+        self.theta[r] = 0.0
+        self.n_updates[r] = 0
+        self.ids[r] = tid
+        self._row[tid] = r
+        return r
+
+    def set(self, tid: int, a_inv: np.ndarray, b: np.ndarray, n_updates: int) -> None:
+        r = int(self.rows([tid])[0])
+        self.a_inv[r] = a_inv
+        self.b[r] = b
+        self.theta[r] = a_inv @ b
+        self.n_updates[r] = int(n_updates)
+
+    def score(self, template_ids: Sequence[int], x: np.ndarray, alpha: float) -> np.ndarray:
+        """候選池一次打分：A⁻¹x 為一次批次矩陣-向量乘法 (k,d,d)@(d,) → (k,d)。"""
+        rows = self.rows(template_ids)
+        ax = self.a_inv[rows] @ x
+        width = np.sqrt(np.maximum(ax @ x, 0.0))
+        return self.theta[rows] @ x + alpha * width
+
+    def update(self, tid: int, x: np.ndarray, reward: float) -> int:
+        """Sherman–Morrison：A ← A + xxᵀ、b ← b + r·x；回傳列號。"""
+        r = int(self.rows([tid])[0])
+        a_inv = self.a_inv[r]
+        ax = a_inv @ x
+        a_inv = a_inv - np.outer(ax, ax) / (1.0 + float(x @ ax))
+        # 只靠秩一更新會慢慢失去對稱性，順手對稱化
+        a_inv = 0.5 * (a_inv + a_inv.T)
+        self.a_inv[r] = a_inv
+        self.b[r] += float(reward) * x
+        self.theta[r] = a_inv @ self.b[r]
+        self.n_updates[r] += 1
+        return r
+
+
+_store: Optional[LinUCBStore] = None
+_lock = threading.RLock()
+stats = {"loads": 0, "updates": 0, "saves": 0}
+
+
+def store() -> LinUCBStore:
+    """行程內狀態；第一次使用時一次讀入 linucb_state。"""
+    global _store
+    st = _store
+    if st is not None:
+        return st
+    with _lock:
+        if _store is None:
+            _store = _load()
+        return _store
+
+
+def _load() -> LinUCBStore:
+    st = LinUCBStore(D, float(Config.LINUCB_LAMBDA))
+    try:
+        rows = exec("SELECT template_id, version, d, n_updates, a_inv, b FROM linucb_state").all()
+    except Exception as e:   # 尚未套用 0007 遷移：從先驗開始
+        log.warning("讀取 linucb_state 失敗（從先驗開始）：%s", e)
+        rows = []
+    for tid, version, d, n, a_raw, b_raw in rows:
+        if int(version) != FEATURE_VERSION or int(d) != D:
+            continue
+        try:
+            a_inv = np.frombuffer(bytes(a_raw), dtype=_DT).reshape(D, D)
+            b = np.frombuffer(bytes(b_raw), dtype=_DT).reshape(D)
+        except ValueError as e:
+            log.warning("linucb_state 解析失敗（略過）：template_id=%s | %s", tid, e)
+            continue
+        st.set(int(tid), a_inv, b, int(n or 0))
+    stats["loads"] += 1
+    return st
+
+
+def invalidate() -> None:
+    """下次使用時重讀 linucb_state。"""
+    global _store
+    with _lock:
+        _store = None
+
+
+def select(template_ids: Sequence[int], feat: Mapping[str, Any]) -> Optional[int]:
+    """回傳分數最高的候選位置（同分取前者）；沒有候選回 None。"""
+    if not len(template_ids):
+        return None
+    with _lock:
+        sc = store().score(template_ids, context(feat), float(Config.LINUCB_ALPHA))
+    return int(np.argmax(np.where(np.isnan(sc), -np.inf, sc)))
+
+
+_Q_ENTRY_FEATURES = prepare("""
+        SELECT rsi, macd_dif, macd_dea, macd_hist, kd_diff, vol_ratio, atr_pct, regime
+          FROM features
+         WHERE symbol=:s AND `interval`=:i AND close_time <= :ts
+         ORDER BY close_time DESC
+         LIMIT 1
+""")
+
+
+def record_reward(template_id: int, symbol: str, interval: str, entry_ts: int, reward: float) -> bool:
+    """
+    book_trade 入帳：以進場當下（close_time <= entry_ts 的最新一根）的 features 為情境更新並寫回。
+    找不到進場時的特徵就不更新，回傳 False。
+    """
+    feat = _Q_ENTRY_FEATURES(s=symbol, i=interval, ts=int(entry_ts)).mappings().first()
+    if feat is None:
+        return False
+    x = context(feat)
+    st = store()
+    with _lock:
+        r = st.update(int(template_id), x, float(reward))
+        a_inv, b, n = st.a_inv[r].astype(_DT).tobytes(), st.b[r].astype(_DT).tobytes(), int(st.n_updates[r])
+    stats["updates"] += 1
+    exec("""
+        INSERT INTO linucb_state(template_id, version, d, n_updates, a_inv, b)
+        VALUES(:t, :v, :d, :n, :a, :b)
+        ON DUPLICATE KEY UPDATE
+          version=VALUES(version),
+          d=VALUES(d),
+          n_updates=VALUES(n_updates),
+          a_inv=VALUES(a_inv),
+          b=VALUES(b)
+    """, t=int(template_id), v=FEATURE_VERSION, d=D, n=n, a=a_inv, b=b)
+    stats["saves"] += 1
+    return True
@@ -1,12 +1,20 @@
 # app/policy/policy.py
 from __future__ import annotations
+import sys
 import math
 import logging
-from typing import Dict, Any, List, Optional, Tuple
+from typing import Callable, Dict, Any, List, Optional, Tuple
 
-from ..db import exec
+import numpy as np
+
+from ..db import exec, prepare
 from . import templates_eval as te
 from . import templates_repo as repo
+from . import template_registry
+from . import gap_quantile
+from . import bandit
+from . import linucb
+from .. import settings_snapshot
 
 log = logging.getLogger("autobot.policy")
 
@@ -42,18 +50,18 @@ def _clip_score(x: float) -> float:
     return x
 
 
-def _fetch_recent_features(symbol: str, interval: str, n: int = 50) -> List[Dict[str, Any]]:
-    rows = exec(
-        """
+_Q_RECENT_FEATURES = prepare("""
         SELECT close_time, rsi, macd_dif, macd_dea, macd_hist, kd_diff,
                slope, atr_pct, vol_ratio, regime
         FROM features
         WHERE symbol=:s AND `interval`=:i
         ORDER BY close_time DESC
         LIMIT :n
-        """,
-        s=symbol, i=interval, n=int(n)
-    ).mappings().all()
+""")
+
+
+def _fetch_recent_features(symbol: str, interval: str, n: int = 50) -> List[Dict[str, Any]]:
+    rows = _Q_RECENT_FEATURES(s=symbol, i=interval, n=int(n)).mappings().all()
     return list(rows or [])
 
 
@@ -64,32 +72,13 @@ def _avg(vals: List[float], default: float = 0.0) -> float:
 
 # === 新增：動態門檻工具 ===
 
-def _recent_gap_quantile(symbol: str, interval: str, n: int = 300, q: float = 0.60) -> Optional[float]:
-    """
-    從 decisions_log 取最近 n 筆的 gap=|E_long - E_short|，回傳分位數 q。
-    不足（<50 筆）則回 None。
-    """
-    rows = exec("""
-        SELECT ABS(COALESCE(E_long,0) - COALESCE(E_short,0)) AS gap
-          FROM decisions_log
-         WHERE symbol=:s AND `interval`=:i
-         ORDER BY id DESC
-         LIMIT :n
-    """, s=symbol, i=interval, n=int(n)).mappings().all()
-    vals = [float(r["gap"] or 0.0) for r in rows or [] if r and r.get("gap") is not None]
-    if len(vals) < 50:
-        return None
-    vals.sort()
-    k = max(0, min(int(len(vals) * float(q)), len(vals)-1))
-    return float(vals[k])
-
 def _dynamic_entry_threshold(symbol: str, interval: str, feats: List[Dict[str, Any]]) -> float:
     """
     動態門檻：
-    1) 先用 decisions_log 的 P60 無 alpha
+    1) 先用最近 GAP_WINDOW 筆決策 gap 的 P60 無 alpha（gap_quantile 記憶體視窗）
     2) 若樣本不足，用 ATR 尺度 fallback（對齊你目前 E 的量級）
     """
-    q = _recent_gap_quantile(symbol, interval, n=300, q=0.60)
+    q = gap_quantile.quantile(symbol, interval, q=0.60)
     if q is not None and q > 0:
         return float(q)
 
@@ -144,24 +133,47 @@ def _decide_direction(feats: List[Dict[str, Any]]) -> Tuple[str, float, float]:
     return (action, float(_finite(E_long, 0.0)), float(_finite(E_short, 0.0)))
 
 
-def _select_template(side: str, last_feat: Dict[str, Any]) -> int:
+def _select_template(side: str, last_feat: Dict[str, Any],
+                     reg: Optional["template_registry.TemplateRegistry"] = None) -> int:
     """
-    依照當下 bins 與 bandit 分數，從 ACTIVE templates 中挑一個 template_id。
+    依照當下 bins 與 bandit 分數（settings.bandit_mode），從 ACTIVE templates 中挑一個 template_id。
     若完全找不到匹配者，回傳 baseline。
+    確定性模式（ucb1 / ucbv）的結果依 (cell, side, mode) 記在 registry.picks；模板池版本（績效 / 凍結 / 新增）
+    一變就清空，因此同版本內每格只算一次分數。thompson 每次都重抽、linucb 依連續特徵打分，
+    兩者只重用 registry.arms 的候選陣列。evaluate_many 會傳入同一份 reg，整批共用。
     """
     # 1) 產生 bins
     bins = te.feature_bins(last_feat)
 
-    # 2) 拿 active 清單與績效彙總
-    actives = repo.get_active_templates()
-    summaries = repo.get_all_templates_summary(active_only=True)
-    total_plays = sum(int(summ.get("n_trades") or 0) for summ in summaries.values()) or 1
-
-    # 3) 先篩選出 side & 條件匹配的模板
-    matched = te.match_templates(actives, bins, side=side)
+    # 2) 拿 active 清單與績效彙總（行程內快取；版本號有變才重讀）
+    if reg is None:
+        reg = template_registry.get()
+    mode = settings_snapshot.get().bandit_mode
+    if mode == linucb.MODE:
+        return _pick_template(reg, side, bins, lambda arms: linucb.select(arms.ids, last_feat))
+    est = bandit.get_estimator(mode, c=_UCB_C, risk_penalty=_RISK_PENALTY)
+    key = (te.cell_id(bins), side, est.mode)
+    if key in reg.picks:
+        return reg.picks[key]
+    tid = _pick_template(reg, side, bins, lambda arms: est.select(arms, reg.total_plays or 1))
+    if est.deterministic:
+        reg.picks[key] = tid
+    return tid
+
+
+def _pick_template(reg: "template_registry.TemplateRegistry", side: str, bins: Dict[str, str],
+                   choose: Callable[["bandit.Arms"], Optional[int]]) -> Optional[int]:
+    actives = reg.actives
+
+    # 3) 先篩選出 side & 條件匹配的模板（bitmask 索引查表），連同績效組成陣列（同版本內每格只組一次）
+    akey = (te.cell_id(bins), side)
+    arms = reg.arms.get(akey)
+    if arms is None:
+        matched = reg.match(bins, side=side)
+        arms = reg.arms[akey] = bandit.arms_from_summaries([int(t["template_id"]) for t in matched], reg.summaries)
 
     # 4) 若無匹配，回 baseline
-    if not matched:
+    if not len(arms):
     # 優先找同 side 的 ACTIVE
         for t in actives:
             if t.get("side") == side:
@@ -172,24 +184,8 @@ def _select_template(side: str, last_feat: Dict[str, Any]) -> int:
     # 真的沒有可用模板 → 回 None 讓上層處理（不進場或記錄）
         return None
 
-
-    # 5) 用 bandit 分數選最佳
-    best_score = -float("inf")
-    best_tid = None
-    for t in matched:
-        tid = int(t["template_id"])
-        summ = summaries.get(tid, {}) or {}
-        score = te.bandit_score(summ, total_plays, method="ucb1",
-                                c=_UCB_C, risk_penalty=_RISK_PENALTY)
-        if score > best_score:
-            best_score = score
-            best_tid = tid
-
-    # 萬一全是空資料
-    if best_tid is None:
-        best_tid = int(matched[0]["template_id"])
-
-    return best_tid
+    # 5) 整個候選池一次打分，取最高者（同分 / 全是 -inf 時取第一個）
+    return int(arms.ids[choose(arms)])
 
 
 def evaluate_symbol_interval(symbol: str, interval: str) -> Dict[str, Any]:
@@ -202,12 +198,15 @@ def evaluate_symbol_interval(symbol: str, interval: str) -> Dict[str, Any]:
     """
     feats = _fetch_recent_features(symbol, interval, n=50)
     if not feats:
+        gap_quantile.observe(symbol, interval, 0.0)   # 同 decisions_log 會記下的 E=0 決策
         return {"action": "HOLD", "E_long": 0.0, "E_short": 0.0, "template_id": None}
 
     action, E_long, E_short = _decide_direction(feats)
     # === 新增：用動態門檻覆蓋 action（gap 不夠大 → HOLD） ===
     gap = abs(float(E_long) - float(E_short))
     th = _dynamic_entry_threshold(symbol, interval, feats)
+    # 門檻算完才把本次 gap 放進視窗（舊版讀 decisions_log 時本次決策尚未寫入）
+    gap_quantile.observe(symbol, interval, gap)
     if gap < th:
         action = "HOLD"
 
@@ -243,3 +242,167 @@ def evaluate_symbol_interval(symbol: str, interval: str) -> Dict[str, Any]:
         "E_short": E_short,
         "template_id": int(tpl_id),
     }
+
+
+# =========================================================
+# 批次評估：一次查詢載入所有 pair 的最近特徵，E_long / E_short 以 NumPy 整批計算
+# 結果與逐一呼叫 evaluate_symbol_interval 完全相同（含浮點位元）：
+# - 平均值沿用 _avg 的逐項加總順序（Python 3.12+ 的 sum() 為 Neumaier 補償加總，這裡照做）
+# - 門檻 / gap 視窗 / 模板選擇 / touch 的順序與逐一呼叫一致
+# =========================================================
+
+_FEAT_NUM_COLS = ("rsi", "macd_dif", "macd_dea", "macd_hist", "kd_diff",
+                  "slope", "atr_pct", "vol_ratio", "regime")
+_MANY_CHUNK = 256   # 每個 UNION ALL 查詢最多幾個 pair
+_NEUMAIER_SUM = sys.version_info >= (3, 12)
+
+
+def _fetch_recent_features_many(pairs: List[Tuple[str, str]], n: int = 50) -> List[Any]:
+    """
+    每個 pair 一個走主鍵索引的 ORDER BY close_time DESC LIMIT n 子查詢，以 UNION ALL 併成一次往返
+    （不用 ROW_NUMBER() OVER：視窗函式要把每個 pair 的整段歷史排序一次）。
+    回傳未排序的列：pair_ix（pairs 的索引）+ close_time + _FEAT_NUM_COLS。
+    """
+    cols = "close_time, " + ", ".join(_FEAT_NUM_COLS)
+    rows: List[Any] = []
+    for base in range(0, len(pairs), _MANY_CHUNK):
+        chunk = pairs[base:base + _MANY_CHUNK]
+        parts, params = [], {"n": int(n)}
+        for j, (s, i) in enumerate(chunk):
+            parts.append(f"SELECT * FROM (SELECT {base + j} AS pair_ix, {cols} FROM features "
+                         f"WHERE symbol=:s{j} AND `interval`=:i{j} ORDER BY close_time DESC LIMIT :n) AS t{j}")
+            params[f"s{j}"], params[f"i{j}"] = s, i
+        rows.extend(exec(" UNION ALL ".join(parts), **params).all())
+    return rows
+
+
+def _sum_many(x: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    """每列 valid 範圍內的逐項加總，與內建 sum() 的加總順序 / 補償方式相同。"""
+    f = np.zeros(x.shape[0])
+    if not _NEUMAIER_SUM:
+        for j in range(x.shape[1]):
+            f = np.where(valid[:, j], f + x[:, j], f)
+        return f
+    c = np.zeros(x.shape[0])
+    with np.errstate(invalid="ignore", over="ignore"):
+        for j in range(x.shape[1]):
+            xj = x[:, j]
+            t = f + xj
+            comp = np.where(np.abs(f) >= np.abs(xj), (f - t) + xj, (xj - t) + f)
+            c = np.where(valid[:, j], c + comp, c)
+            f = np.where(valid[:, j], t, f)
+        return np.where((c != 0) & np.isfinite(c), f + c, f)
+
+
+def _avg_many(x: np.ndarray, counts: np.ndarray, k: int, default: float) -> np.ndarray:
+    """同 _avg(前 min(k, 筆數) 列)；x 為 (pair, 列) 且非有限值已換成 0。"""
+    kk = np.minimum(counts, k)
+    valid = np.arange(min(k, x.shape[1]))[None, :] < kk[:, None]
+    with np.errstate(invalid="ignore", over="ignore", divide="ignore"):
+        avg = _sum_many(x[:, :valid.shape[1]], valid) / np.maximum(kk, 1)
+    return np.where(np.isfinite(avg), avg, default)
+
+
+def _clip_many(x: np.ndarray) -> np.ndarray:
+    return np.clip(np.where(np.isfinite(x), x, 0.0), -_MAX_SCORE, _MAX_SCORE)
+
+
+def _decide_direction_many(X: np.ndarray, counts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """_decide_direction 的整批版（X：(pair, 列, _FEAT_NUM_COLS)）；回傳 (E_long, E_short)。"""
+    col = {c: X[:, :, j] for j, c in enumerate(_FEAT_NUM_COLS)}
+    avg_macd = _avg_many(col["macd_hist"], counts, 20, 0.0)
+    avg_kd = _avg_many(col["kd_diff"], counts, 20, 0.0)
+    avg_rsi = _avg_many(col["rsi"], counts, 20, 50.0)
+    avg_slope = _avg_many(col["slope"], counts, 20, 0.0)
+    avg_atr = _avg_many(col["atr_pct"], counts, 20, 0.0)
+    avg_volr = _avg_many(col["vol_ratio"], counts, 20, 1.0)
+
+    with np.errstate(invalid="ignore", over="ignore"):
+        rsi_bias = (avg_rsi - 50.0) / 50.0
+        long_raw = + 1.0 * avg_macd + 0.8 * avg_kd + 0.6 * rsi_bias + 0.5 * avg_slope
+        short_raw = - 1.0 * avg_macd - 0.8 * avg_kd - 0.6 * rsi_bias - 0.5 * avg_slope
+
+        risk_scale = np.maximum(avg_atr, 1e-5)   # 恆大於 _EPS，_safe_div 即一般除法
+        E_long = _clip_many(long_raw / risk_scale)
+        E_short = _clip_many(short_raw / risk_scale)
+
+        compress = np.clip(avg_volr, 0.5, 2.0)
+        E_long = _clip_many(E_long / compress)
+        E_short = _clip_many(E_short / compress)
+    return E_long, E_short
+
+
+def evaluate_many(pairs: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Any]:
+    """
+    evaluate_symbol_interval 的批次版：回傳 {(symbol, interval): 決策 dict 或 Exception}。
+    單一 pair 的後段（門檻 / 選模板）出錯只影響該 pair；載入特徵失敗則整批丟出例外。
+    """
+    pairs = list(pairs)
+    out: Dict[Tuple[str, str], Any] = {}
+    if not pairs:
+        return out
+    rows = _fetch_recent_features_many(pairs, n=50)
+    P, N = len(pairs), 50
+    X = np.zeros((P, N, len(_FEAT_NUM_COLS)))
+    counts = np.zeros(P, dtype=np.int64)
+    starts = counts
+    order = np.zeros(0, dtype=np.int64)
+    if rows:
+        A = np.array([tuple(r) for r in rows], dtype=float)   # NULL → NaN
+        # UNION ALL / 衍生表不保證輸出順序：依 pair、close_time 由新到舊排
+        order = np.lexsort((-A[:, 1], A[:, 0]))
+        A = A[order]
+        pair_ix = A[:, 0].astype(np.int64)
+        counts = np.bincount(pair_ix, minlength=P)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        A = A[:, 2:]
+        A[~np.isfinite(A)] = 0.0   # 同 _finite(v, 0.0)：NULL / NaN / inf 一律當 0
+        X[pair_ix, np.arange(len(rows)) - starts[pair_ix]] = A
+    E_long, E_short = _decide_direction_many(X, counts)
+    atr50 = _avg_many(X[:, :, _FEAT_NUM_COLS.index("atr_pct")], counts, 50, 0.0)
+
+    reg = None
+    touches: List[Tuple[int, int]] = []
+    for j, (symbol, interval) in enumerate(pairs):
+        try:
+            if counts[j] == 0:
+                gap_quantile.observe(symbol, interval, 0.0)
+                out[(symbol, interval)] = {"action": "HOLD", "E_long": 0.0, "E_short": 0.0, "template_id": None}
+                continue
+            el, es = float(E_long[j]), float(E_short[j])
+            action = "HOLD"
+            if el > 0 and el >= abs(es):
+                action = "LONG"
+            elif es > 0 and es > el:
+                action = "SHORT"
+
+            gap = abs(el - es)
+            q = gap_quantile.quantile(symbol, interval, q=0.60)
+            th = float(q) if q is not None and q > 0 else max(1.0, float(atr50[j]) * 2_000_000.0)
+            gap_quantile.observe(symbol, interval, gap)
+            if gap < th:
+                action = "HOLD"
+            if action == "HOLD":
+                out[(symbol, interval)] = {"action": "HOLD", "E_long": el, "E_short": es, "template_id": None}
+                continue
+
+            last = dict(zip(("close_time",) + _FEAT_NUM_COLS, tuple(rows[int(order[starts[j]])])[1:]))
+            regime = int(_finite(last.get("regime"), 0))
+            if reg is None:
+                reg = template_registry.get()
+            tpl_id = _select_template(action, last, reg)
+            if tpl_id is None:
+                out[(symbol, interval)] = {"action": "HOLD", "E_long": el, "E_short": es, "template_id": None}
+                continue
+            touches.append((int(tpl_id), regime))
+            out[(symbol, interval)] = {"action": action, "E_long": el, "E_short": es, "template_id": int(tpl_id)}
+        except Exception as e:
+            out[(symbol, interval)] = e
+
+    # last_used_at 一次寫完（touch 不改版本號，不影響本批後面的模板選擇）
+    if touches:
+        try:
+            repo.touch_templates_last_used(touches)
+        except Exception as e:
+            log.warning(f"touch templates failed: n={len(touches)} err={e}")
+    return out
@@ -0,0 +1,206 @@
+# app/policy/template_registry.py
+"""
+模板池的行程內快取：ACTIVE 模板、bitmask 索引、各模板績效彙總（同 repo.get_all_templates_summary）。
+決策熱路徑只讀記憶體，不再每次 SELECT templates / JOIN template_stats，延遲與池大小無關。
+
+- get()：回傳目前快取；距上次檢查超過 TEMPLATE_REGISTRY_TTL_S 才讀一次 template_registry_version
+  * 版本號與本行程所知不同（其他行程寫過）→ 整池重讀
+  * RELOAD_EVERY_S 仍會定期整池重讀（保底：web 後台等不經 templates_repo 的修改不會 +1）
+- 本行程的寫入（templates_repo / rewards.book_trade）會把版本 +1，並就地更新快取：
+  * record_reward()：book_trade 入帳 → 該 (template_id, regime) 的 n / sum 累加，重算該模板彙總
+  * template_added() / template_frozen()：evolver 生成 / 凍結 → 增減 ACTIVE 清單並重建索引
+  * touch()：決策時更新 last_used_at（不 +1，只影響 evolver 的陳舊判斷，evolver 自己讀 DB）
+- picks：policy 依 (cell, side, bandit_mode) 記下的選擇結果（只記確定性的 ucb1 / ucbv）；
+  arms：各 (cell, side) 候選模板的統計陣列（thompson 每次抽樣直接用）；兩者只隨版本變動，版本一變就清空
+- 版本 +1 與讀回新值在同一交易內，讀回的一定是本次寫入的版本；外層交易回滾時 DB 版本不變，
+  下次檢查會發現不一致而整池重讀
+"""
+from __future__ import annotations
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..config import Config
+from . import templates_eval as te
+from . import templates_repo as repo
+
+log = logging.getLogger("autobot.policy")
+
+RELOAD_EVERY_S = 600.0
+
+_STAT_KEYS = ("n_trades", "reward_sum", "reward_var", "last_used_at", "is_frozen")
+
+
+class TemplateRegistry:
+    __slots__ = ("version", "actives", "active_ids", "index", "stats", "summaries", "total_plays", "picks", "arms")
+
+    def __init__(self, version: int, actives: List[Dict[str, Any]], stat_rows: List[Dict[str, Any]]) -> None:
+        self.version = version
+        self._set_actives(actives)
+        # template_id -> regime -> 原始列（reward_var 為 M2）
+        self.stats: Dict[int, Dict[int, Dict[str, Any]]] = {}
+        for r in stat_rows:
+            self.stats.setdefault(int(r["template_id"]), {})[int(r["regime"])] = {k: r.get(k) for k in _STAT_KEYS}
+        self.summaries: Dict[int, Dict[str, Any]] = {}
+        self.total_plays = 0
+        # policy._select_template 的結果：(cell_id, side, mode) -> template_id；
+        # 候選統計：(cell_id, side) -> bandit.Arms；版本一變就清空
+        self.picks: Dict[Tuple[int, str, str], Optional[int]] = {}
+        self.arms: Dict[Tuple[int, str], Any] = {}
+        self._resummarize()
+
+    def _resummarize(self) -> None:
+        self.summaries = {tid: repo.summarize_stats(list(rows.values()))
+                          for tid, rows in self.stats.items() if tid in self.active_ids}
+        self.total_plays = sum(int(s.get("n_trades") or 0) for s in self.summaries.values())
+
+    def _resummarize_one(self, tid: int) -> None:
+        old = int((self.summaries.get(tid) or {}).get("n_trades") or 0)
+        if tid in self.stats and tid in self.active_ids:
+            s = repo.summarize_stats(list(self.stats[tid].values()))
+            self.summaries[tid] = s
+            self.total_plays += int(s["n_trades"]) - old
+        elif tid in self.summaries:
+            del self.summaries[tid]
+            self.total_plays -= old
+
+    def _set_actives(self, actives: List[Dict[str, Any]]) -> None:
+        self.actives = actives
+        self.active_ids = {int(t["template_id"]) for t in actives}
+        self.index = te.TemplateIndex(actives)
+
+    def match(self, bins: Dict[str, str], side: str) -> List[Dict[str, Any]]:
+        return self.index.match(bins, side)
+
+
+_reg: Optional[TemplateRegistry] = None
+_checked_at = 0.0
+_loaded_at = 0.0
+_lock = threading.RLock()
+stats = {"checks": 0, "reloads": 0, "local_updates": 0}
+
+
+def _load() -> TemplateRegistry:
+    global _reg, _checked_at, _loaded_at
+    try:
+        version = repo.get_registry_version()
+    except Exception as e:   # 尚未套用 0004 遷移：照常載入，版本 -1 表示每次檢查都會失敗而沿用快取
+        log.warning("讀取 template_registry_version 失敗：%s", e)
+        version = -1
+    _reg = TemplateRegistry(version, repo.get_active_templates(), repo.get_all_stats_rows(active_only=False))
+    _checked_at = _loaded_at = time.monotonic()
+    stats["reloads"] += 1
+    return _reg
+
+
+def refresh(force: bool = False) -> TemplateRegistry:
+    """讀版本號；與快取不同（或 force / 超過保底週期）才整池重讀。"""
+    global _checked_at
+    with _lock:
+        now = time.monotonic()
+        if force or _reg is None or now - _loaded_at >= RELOAD_EVERY_S:
+            return _load()
+        stats["checks"] += 1
+        if repo.get_registry_version() != _reg.version:
+            return _load()
+        _checked_at = now
+        return _reg
+
+
+def get() -> TemplateRegistry:
+    """取目前快取；超過 TEMPLATE_REGISTRY_TTL_S 沒檢查過才會碰 DB。檢查失敗時沿用舊快取。"""
+    reg = _reg
+    if reg is not None and time.monotonic() - _checked_at < float(Config.TEMPLATE_REGISTRY_TTL_S):
+        return reg
+    try:
+        return refresh()
+    except Exception as e:
+        if reg is None:
+            raise
+        log.error("模板池版本檢查失敗（沿用舊快取）：%s", e)
+        return reg
+
+
+def invalidate() -> None:
+    """下次 get() 整池重讀。"""
+    global _reg
+    with _lock:
+        _reg = None
+
+
+# ---------- 本行程寫入後的就地更新（version = repo.bump_registry_version() 的回傳值）----------
+
+def _apply(version: Optional[int], fn) -> None:
+    with _lock:
+        reg = _reg
+        if reg is None:
+            return
+        if version is None or version != reg.version + 1:
+            # 版本跳號（其他行程也寫過）或 bump 失敗 → 不猜，整池重讀
+            invalidate()
+            return
+        fn(reg)
+        reg.version = version
+        reg.picks = {}
+        reg.arms = {}
+        stats["local_updates"] += 1
+
+
+def record_reward(template_id: int, regime: int, reward: float, version: Optional[int]) -> None:
+    """book_trade 入帳（同 rewards 的 UPSERT：Welford M2、n_trades+1、reward_sum+reward）。"""
+    tid, rg = int(template_id), int(regime)
+
+    def _fn(reg: TemplateRegistry) -> None:
+        row = reg.stats.setdefault(tid, {}).setdefault(rg, {k: 0 for k in _STAT_KEYS})
+        n, s, x = int(row.get("n_trades") or 0), float(row.get("reward_sum") or 0.0), float(reward)
+        m2 = float(row.get("reward_var") or 0.0)
+        if n > 0:
+            m2 += (x - s / n) * (x - s / n) * n / (n + 1)
+        row["reward_var"] = m2
+        row["n_trades"] = n + 1
+        row["reward_sum"] = s + x
+        reg._resummarize_one(tid)
+    _apply(version, _fn)
+
+
+def template_added(tpl: Optional[Dict[str, Any]], version: Optional[int]) -> None:
+    """evolver 生成 / 種子模板（tpl 為 templates 整列）。"""
+    if not tpl:
+        _apply(None, None)
+        return
+
+    def _fn(reg: TemplateRegistry) -> None:
+        tid = int(tpl["template_id"])
+        if (tpl.get("status") or "ACTIVE") == "ACTIVE":
+            rest = [t for t in reg.actives if int(t["template_id"]) != tid]
+            reg._set_actives(sorted(rest + [dict(tpl)], key=lambda t: int(t["template_id"])))
+        reg._resummarize_one(tid)
+    _apply(version, _fn)
+
+
+def template_frozen(template_id: int, version: Optional[int], *, frozen: bool = True) -> None:
+    """凍結（frozen=False 為解凍；解凍需要整列資料，直接整池重讀）。"""
+    tid = int(template_id)
+    if not frozen:
+        _apply(None, None)
+        return
+
+    def _fn(reg: TemplateRegistry) -> None:
+        reg._set_actives([t for t in reg.actives if int(t["template_id"]) != tid])
+        for row in reg.stats.get(tid, {}).values():
+            row["is_frozen"] = 1
+        reg._resummarize_one(tid)
+    _apply(version, _fn)
+
+
+def touch(template_id: int, regime: int) -> None:
+    """決策後更新 last_used_at（同 DB 端 UNIX_TIMESTAMP()*1000 的秒精度）；不改版本號。"""
+    with _lock:
+        reg = _reg
+        if reg is None:
+            return
+        tid, rg = int(template_id), int(regime)
+        row = reg.stats.setdefault(tid, {}).setdefault(rg, {k: 0 for k in _STAT_KEYS})
+        row["last_used_at"] = int(time.time()) * 1000
+        reg._resummarize_one(tid)
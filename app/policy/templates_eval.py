@@ -1,6 +1,6 @@
 # app/policy/templates_eval.py
 from __future__ import annotations
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Sequence, Tuple
 from typing import Optional
 import math
 
@@ -90,6 +90,82 @@ def match_templates(templates: List[Dict[str, Any]], bins: Dict[str, str], side:
     return out
 
 
+# -------------------------------------------------
+# 模板索引：bins 空間只有 3(RSI) × 2(MACD) × 2(KD) × 4(VOL) = 48 格
+#   每個模板預先編成 48 位元的 bitmask（允許的格子），再反查成「格子 → 模板清單」；
+#   一根 K 線的 bins 對應一個 cell id，比對 = 一次查表（結果與 match_templates 相同、順序相同）
+# -------------------------------------------------
+BIN_VALUES: Tuple[Tuple[str, Tuple[str, ...]], ...] = (
+    ("rsi_bin", ("L", "M", "H")),
+    ("macd_bin", ("P", "N")),
+    ("kd_bin", ("P", "N")),
+    ("vol_bin", ("L", "M", "H", "X")),
+)
+N_CELLS = 48
+_ALL_CELLS = (1 << N_CELLS) - 1
+
+
+def cell_id(bins: Dict[str, str]) -> int:
+    """bins → 0..47；任一欄位不在值域內回 -1（不會匹配任何模板）。"""
+    c = 0
+    for field, values in BIN_VALUES:
+        try:
+            c = c * len(values) + values.index(bins[field])
+        except (KeyError, ValueError):
+            return -1
+    return c
+
+
+def _allowed(tmpl_val: Any, values: Sequence[str]) -> List[int]:
+    """模板單一欄位允許的值域索引（規則同 _field_ok：空 / None / * 為萬用）。"""
+    if tmpl_val is None:
+        return list(range(len(values)))
+    s = str(tmpl_val).strip()
+    if not s or s == "*":
+        return list(range(len(values)))
+    allow = {x.strip() for x in s.split("|") if x.strip()}
+    return [i for i, v in enumerate(values) if v in allow]
+
+
+def template_mask(t: Dict[str, Any]) -> int:
+    """模板 → 48 位元 bitmask（第 cell_id 位為 1 表示該格匹配）。"""
+    cells = [0]
+    for field, values in BIN_VALUES:
+        idx = _allowed(t.get(field), values)
+        cells = [c * len(values) + i for c in cells for i in idx]
+    m = 0
+    for c in cells:
+        m |= 1 << c
+    return m
+
+
+class TemplateIndex:
+    """ACTIVE 模板的 cell → 模板清單索引；依 side 分開，side="" 為不分方向。"""
+    __slots__ = ("templates", "masks", "_by_side")
+
+    def __init__(self, templates: Sequence[Dict[str, Any]]) -> None:
+        self.templates = [t for t in templates if (t.get("status") or "ACTIVE") == "ACTIVE"]
+        self.masks = [template_mask(t) for t in self.templates]
+        self._by_side: Dict[str, List[List[Dict[str, Any]]]] = {}
+        for t, m in zip(self.templates, self.masks):
+            for side in ("", str(t.get("side"))):
+                cells = self._by_side.setdefault(side, [[] for _ in range(N_CELLS)])
+                mm = m
+                while mm:
+                    low = mm & -mm
+                    cells[low.bit_length() - 1].append(t)
+                    mm ^= low
+
+    def match(self, bins: Dict[str, str], side: str) -> List[Dict[str, Any]]:
+        return self.match_cell(cell_id(bins), side)
+
+    def match_cell(self, cell: int, side: str) -> List[Dict[str, Any]]:
+        cells = self._by_side.get(side or "")
+        if cells is None or not 0 <= cell < N_CELLS:
+            return []
+        return list(cells[cell])
+
+
 # -------------------------------------------------
 # ➕ 新增：Bandit / 風險調整 評分 與 凍結判斷
 # 期待輸入為 template_stats 的彙總：
@@ -3,7 +3,35 @@ from __future__ import annotations
 from typing import List, Dict, Optional, Any, Tuple
 import json
 import time
-from ..db import exec  # 若你原本是 q，請改：from ..db import q as exec
+import logging
+from ..db import exec, unit_of_work  # 若你原本是 q，請改：from ..db import q as exec
+
+log = logging.getLogger("autobot.policy")
+
+
+# ---------- 模板池版本號（template_registry 以此判斷行程內快取是否過期）----------
+
+def get_registry_version() -> int:
+    v = exec("SELECT version FROM template_registry_version WHERE id=1").scalar()
+    return int(v or 0)
+
+
+def bump_registry_version() -> Optional[int]:
+    """templates / template_stats 寫入後呼叫：版本 +1 並回傳新值（同一交易內讀回）；失敗時回 None。"""
+    try:
+        with unit_of_work():
+            exec("UPDATE template_registry_version SET version=version+1 WHERE id=1")
+            v = exec("SELECT version FROM template_registry_version WHERE id=1").scalar()
+        return int(v) if v is not None else None
+    except Exception as e:
+        log.warning("template_registry_version +1 失敗：%s", e)
+        return None
+
+
+def _registry():
+    from . import template_registry  # 延遲匯入：template_registry 依賴本模組
+    return template_registry
+
 
 # ---------- Templates 基本 CRUD ----------
 
@@ -31,6 +59,9 @@ def seed_templates(seed_rows: List[Dict]) -> int:
             r = {**r, "extra": json.dumps(extra, ensure_ascii=False)}
         exec(sql, **r)
         count += 1
+    if count:
+        bump_registry_version()
+        _registry().invalidate()   # 種子沒有回傳 id，直接整池重讀
     return count
 
 
@@ -48,7 +79,9 @@ def insert_template(version: int, side: str,
         """,
         v=version, s=side, rsi=rsi_bin, macd=macd_bin, kd=kd_bin, vol=vol_bin, e=extra, st=status
     )
-    return int(res.lastrowid)
+    new_id = int(res.lastrowid)
+    _registry().template_added(get_template(new_id), bump_registry_version())
+    return new_id
 
 
 def get_active_templates() -> List[Dict]:
@@ -69,11 +102,13 @@ def get_template(template_id: int) -> Optional[Dict]:
 def freeze_template(template_id: int) -> None:
     exec("UPDATE templates SET status='FROZEN' WHERE template_id=:t", t=template_id)
     exec("UPDATE template_stats SET is_frozen=1 WHERE template_id=:t", t=template_id)
+    _registry().template_frozen(template_id, bump_registry_version())
 
 
 def unfreeze_template(template_id: int) -> None:
     exec("UPDATE templates SET status='ACTIVE' WHERE template_id=:t", t=template_id)
     exec("UPDATE template_stats SET is_frozen=0 WHERE template_id=:t", t=template_id)
+    _registry().template_frozen(template_id, bump_registry_version(), frozen=False)
 
 
 def clone_template(template_id: int, patch: Optional[Dict[str, Any]] = None, note: str = "") -> int:
@@ -138,6 +173,8 @@ def upsert_template_stats(template_id: int, regime: int, reward: float) -> None:
             """,
             t=template_id, r=regime, rw=reward
         )
+        bump_registry_version()
+        _registry().invalidate()
         return
 
     n_prev = int(row["n_trades"] or 0)
@@ -159,6 +196,8 @@ def upsert_template_stats(template_id: int, regime: int, reward: float) -> None:
         """,
         n=n_new, s=s_new, m=mean_new, v=m2_new, t=template_id, r=regime
     )
+    bump_registry_version()
+    _registry().invalidate()
 
 
 def touch_template_last_used(template_id: int, regime: int) -> None:
@@ -171,6 +210,30 @@ def touch_template_last_used(template_id: int, regime: int) -> None:
         """,
         t=int(template_id), r=int(regime)
     )
+    _registry().touch(template_id, regime)
+
+
+def touch_templates_last_used(items: List[Tuple[int, int]]) -> None:
+    """touch_template_last_used 的批次版：[(template_id, regime), ...] 一次 UPSERT。"""
+    keys = list(dict.fromkeys((int(t), int(r)) for t, r in items))
+    if not keys:
+        return
+    values, params = [], {}
+    for j, (t, r) in enumerate(keys):
+        values.append(f"(:t{j}, :r{j}, UNIX_TIMESTAMP()*1000)")
+        params[f"t{j}"], params[f"r{j}"] = t, r
+    exec(
+        f"""
+        INSERT INTO template_stats (template_id, regime, last_used_at)
+        VALUES {", ".join(values)}
+        ON DUPLICATE KEY UPDATE
+          last_used_at = VALUES(last_used_at)
+        """,
+        **params
+    )
+    reg = _registry()
+    for t, r in keys:
+        reg.touch(t, r)
 
 
 
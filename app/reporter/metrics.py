@@ -1,8 +1,8 @@
 # app/reporter/metrics.py
 from __future__ import annotations
 from typing import Any, Dict, List, Optional, Tuple
-import json
 from ..db import exec  # 若你改成 q，請用：from ..db import q as exec
+from .. import settings_snapshot
 
 def _rows(sql: str, **params):
     return exec(sql, **params).mappings().all()
@@ -11,13 +11,8 @@ def _scalar(sql: str, **params):
     return exec(sql, **params).scalar()
 
 def _get_symbols() -> List[str]:
-    r = _rows("SELECT symbols_json FROM settings WHERE id=1")
-    if not r:
-        return []
-    try:
-        return list(json.loads(r[0]["symbols_json"] or "[]"))
-    except Exception:
-        return []
+    st = settings_snapshot.get()
+    return list(st.symbols) if st.loaded else []
 
 def _now_ms() -> int:
     return int(_scalar("SELECT UNIX_TIMESTAMP()*1000") or 0)
@@ -0,0 +1,267 @@
+# app/reporter/writebehind.py
+"""
+遙測表的非同步 write-behind：job_progress / risk_journal / decisions_log 不再在交易路徑上同步寫 DB。
+
+- put_*() 只把資料放進行程內緩衝，背景執行緒每 WRITEBEHIND_FLUSH_MS 批次寫入
+  * job_progress：同一 job_id 只保留最後一筆（合併），一次多列 UPSERT
+  * risk_journal / decisions_log：多列 INSERT（db.bulk_upsert，single_tx：分塊同一交易，失敗不會留下半批）
+- 容量上限 WRITEBEHIND_MAX（兩張 INSERT 表合計；job_progress 以 job 數計）
+  * 背壓：decisions_log 與 WARN/CRIT 記事最多等 WRITEBEHIND_BLOCK_MS 空位
+  * 丟棄：仍滿時丟棄新進資料並計數（INFO 記事、進度心跳不等待，直接丟）
+- 寫入失敗時整批放回緩衝（超出容量的部分丟棄），下次再送
+- 行程結束（atexit）與 stop() 會把剩餘資料寫完
+- 時間戳在 put 當下以本機時鐘取（毫秒），不再用 DB 端 UNIX_TIMESTAMP()
+- WRITEBEHIND_ENABLED=0 時退回同步寫入（腳本 / 除錯用）
+"""
+from __future__ import annotations
+import time
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from ..db import exec, bulk_upsert, build_bulk_upsert
+from ..config import Config
+
+log = logging.getLogger("autobot.heartbeat")
+
+_PROGRESS_COLS = ("job_id", "phase", "symbol", "interval", "step", "total", "pct")
+_JOURNAL_COLS = ("ts", "rule", "detail", "level", "session_id")
+_DECISION_COLS = ("session_id", "ts", "symbol", "interval", "action", "is_flat", "E_long", "E_short", "template_id")
+
+Row = Tuple[Any, ...]
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+# ---------- 實際寫入（flusher 與同步模式共用）----------
+
+def write_progress(rows: Sequence[Row]) -> None:
+    if not rows:
+        return
+    sql = build_bulk_upsert("job_progress", _PROGRESS_COLS, len(rows), _PROGRESS_COLS[1:])
+    sql += ",\n  `updated_at`=CURRENT_TIMESTAMP"   # 內容沒變也要刷新心跳時間
+    params: Dict[str, Any] = {}
+    for i, r in enumerate(rows):
+        for c, v in zip(_PROGRESS_COLS, r):
+            params[f"{c}_{i}"] = v
+    exec(sql, **params)
+
+
+def write_journal(rows: Sequence[Row]) -> None:
+    if rows:
+        bulk_upsert("risk_journal", _JOURNAL_COLS, rows, single_tx=True)
+
+
+def write_decisions(rows: Sequence[Row]) -> None:
+    if rows:
+        bulk_upsert("decisions_log", _DECISION_COLS, rows, single_tx=True)
+
+
+class WriteBehind:
+    def __init__(self, *, flush_ms: int = 500, max_items: int = 5000, block_ms: int = 200) -> None:
+        self.flush_s = max(0.01, flush_ms / 1000.0)
+        self.max_items = max(1, int(max_items))
+        self.block_s = max(0.0, block_ms / 1000.0)
+        self._progress: "OrderedDict[str, Row]" = OrderedDict()
+        self._journal: List[Row] = []
+        self._decisions: List[Row] = []
+        self._cv = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self._flush_lock = threading.Lock()   # 同時只有一個 flush 在寫
+        self.dropped = {"job_progress": 0, "risk_journal": 0, "decisions_log": 0}
+        self.written = {"job_progress": 0, "risk_journal": 0, "decisions_log": 0}
+        self.batches = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self._last_drop_log = 0.0
+
+    # ---------- 生產端 ----------
+    def _pending(self) -> int:
+        return len(self._journal) + len(self._decisions)
+
+    def _drop(self, table: str) -> None:
+        self.dropped[table] += 1
+        now = time.monotonic()
+        if now - self._last_drop_log >= 10.0:
+            self._last_drop_log = now
+            log.warning("write-behind 緩衝已滿，丟棄 %s 資料（累計 %s）", table, self.dropped)
+
+    def _append(self, table: str, row: Row, block: bool) -> None:
+        self._ensure_thread()
+        with self._cv:
+            if self._pending() >= self.max_items and block and self.block_s > 0:
+                self._cv.notify_all()   # 叫 flusher 提早寫
+                deadline = time.monotonic() + self.block_s
+                while self._pending() >= self.max_items and not self._stopping:
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        break
+                    self._cv.wait(left)
+            if self._pending() >= self.max_items:
+                self._drop(table)
+                return
+            # 緩衝在 _take() 會被整個換掉，必須在鎖內才取
+            (self._decisions if table == "decisions_log" else self._journal).append(row)
+            if self._pending() >= self.max_items // 2:
+                self._cv.notify_all()
+
+    def put_progress(self, job_id: str, phase: str, symbol: str, interval: str,
+                     step: int, total: int, pct: float) -> None:
+        self._ensure_thread()
+        with self._cv:
+            if job_id not in self._progress and len(self._progress) >= self.max_items:
+                self._drop("job_progress")
+                return
+            self._progress[job_id] = (job_id, phase, symbol, interval, step, total, pct)
+            self._progress.move_to_end(job_id)
+
+    def put_journal(self, rule: str, detail: str, level: str, session_id: Optional[int] = None,
+                    ts: Optional[int] = None) -> None:
+        row = (int(ts if ts is not None else now_ms()), rule, detail, level, session_id)
+        self._append("risk_journal", row, block=level in ("WARN", "CRIT"))
+
+    def put_decision(self, row: Row) -> None:
+        self._append("decisions_log", tuple(row), block=True)
+
+    # ---------- 消費端 ----------
+    def _ensure_thread(self) -> None:
+        t = self._thread
+        if t is not None and t.is_alive():
+            return
+        with self._cv:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._loop, name="writebehind", daemon=True)
+            self._thread.start()
+
+    def _loop(self) -> None:
+        while True:
+            with self._cv:
+                if not self._stopping:
+                    self._cv.wait(self.flush_s)
+                stopping = self._stopping
+            self.flush()
+            if stopping:
+                return
+
+    def _take(self) -> Tuple[List[Row], List[Row], List[Row]]:
+        with self._cv:
+            prog = list(self._progress.values())
+            jour, dec = self._journal, self._decisions
+            self._progress = OrderedDict()
+            self._journal, self._decisions = [], []
+            self._cv.notify_all()   # 釋放等待空位的生產端
+            return prog, jour, dec
+
+    def _requeue(self, prog: List[Row], jour: List[Row], dec: List[Row]) -> None:
+        """寫入失敗：舊資料放回前面；新 put 的 job_progress 優先（比較新）。"""
+        with self._cv:
+            for r in prog:
+                if r[0] not in self._progress and len(self._progress) < self.max_items:
+                    self._progress[r[0]] = r
+                    self._progress.move_to_end(r[0], last=False)
+            room = max(0, self.max_items - self._pending())
+            keep_d = dec[-room:] if room else []
+            room -= len(keep_d)
+            keep_j = jour[-room:] if room else []
+            self.dropped["decisions_log"] += len(dec) - len(keep_d)
+            self.dropped["risk_journal"] += len(jour) - len(keep_j)
+            self._decisions[:0] = keep_d
+            self._journal[:0] = keep_j
+
+    def flush(self) -> int:
+        """把目前緩衝全部寫出；回傳寫入筆數。失敗時整批放回、等下次。"""
+        with self._flush_lock:
+            prog, jour, dec = self._take()
+            if not (prog or jour or dec):
+                return 0
+            done: List[str] = []
+            try:
+                write_decisions(dec); done.append("decisions_log")
+                write_journal(jour); done.append("risk_journal")
+                write_progress(prog); done.append("job_progress")
+            except Exception as e:
+                self.errors += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+                log.warning("write-behind 寫入失敗（下次重送）：%s", e)
+                self._requeue(prog if "job_progress" not in done else [],
+                              jour if "risk_journal" not in done else [],
+                              dec if "decisions_log" not in done else [])
+            n = 0
+            for table, rows in (("decisions_log", dec), ("risk_journal", jour), ("job_progress", prog)):
+                if table in done:
+                    self.written[table] += len(rows)
+                    n += len(rows)
+            self.batches += 1
+            return n
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """停止背景執行緒並寫完剩餘資料。"""
+        with self._cv:
+            self._stopping = True
+            self._cv.notify_all()
+            t = self._thread
+        if t is not None and t.is_alive():
+            t.join(timeout)
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cv:
+            queued = {"job_progress": len(self._progress), "risk_journal": len(self._journal),
+                      "decisions_log": len(self._decisions)}
+        return {"queued": queued, "dropped": dict(self.dropped), "written": dict(self.written),
+                "batches": self.batches, "errors": self.errors, "last_error": self.last_error}
+
+
+_wb: Optional[WriteBehind] = None
+_wb_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return bool(Config.WRITEBEHIND_ENABLED)
+
+
+def writer() -> WriteBehind:
+    global _wb
+    if _wb is None:
+        with _wb_lock:
+            if _wb is None:
+                _wb = WriteBehind(flush_ms=Config.WRITEBEHIND_FLUSH_MS, max_items=Config.WRITEBEHIND_MAX,
+                                  block_ms=Config.WRITEBEHIND_BLOCK_MS)
+                atexit.register(_wb.stop)
+    return _wb
+
+
+def put_progress(job_id: str, phase: str, symbol: str, interval: str, step: int, total: int, pct: float) -> None:
+    if enabled():
+        writer().put_progress(job_id, phase, symbol, interval, step, total, pct)
+    else:
+        write_progress([(job_id, phase, symbol, interval, step, total, pct)])
+
+
+def put_journal(rule: str, detail: str, level: str, session_id: Optional[int] = None) -> None:
+    if enabled():
+        writer().put_journal(rule, detail, level, session_id)
+    else:
+        write_journal([(now_ms(), rule, detail, level, session_id)])
+
+
+def put_decision(row: Row) -> None:
+    if enabled():
+        writer().put_decision(row)
+    else:
+        write_decisions([tuple(row)])
+
+
+def flush() -> int:
+    return writer().flush() if _wb is not None else 0
+
+
+def stats() -> Dict[str, Any]:
+    return writer().stats() if _wb is not None else {}
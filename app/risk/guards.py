@@ -3,6 +3,7 @@ from __future__ import annotations
 from typing import Optional, Tuple, Iterable
 from time import time
 from ..db import exec  # 若你改成 q，請用：from ..db import q as exec
+from ..reporter import writebehind
 
 # -------------------------------------------------
 # 風控記事
@@ -18,12 +19,8 @@ def _active_session_id():
     return int(sid) if sid is not None else None
 
 def journal(rule: str, detail: str, level: str = "INFO") -> None:
-    sid = _active_session_id()
-    exec(
-        "INSERT INTO risk_journal(ts, rule, detail, level, session_id) "
-        "VALUES(UNIX_TIMESTAMP()*1000, :r, :d, :l, :sid)",
-        r=rule[:64], d=detail[:255], l=level, sid=sid
-    )
+    # 經 write-behind 批次寫入，不在交易路徑上等 DB
+    writebehind.put_journal(rule[:64], detail[:255], level, _active_session_id())
 
 
 # -------------------------------------------------
@@ -3,8 +3,7 @@ from __future__ import annotations
 from typing import Dict, Any, Optional, Tuple
 import math
 
-# 若你把 db.exec 取名為 q，請改成：from ..db import q as exec
-from ..db import exec
+from .. import settings_snapshot
 from ..exec.filters import round_price, round_qty
 
 
@@ -25,13 +24,9 @@ def _get_max_risk_pct() -> float:
     """
     從 settings 取 max_risk_pct；取不到就給預設 1%
     """
-    try:
-        r = exec("SELECT max_risk_pct FROM settings WHERE id=1").scalar()
-        v = _safe_float(r, 0.01)
-        return v if v > 0 else 0.01
-    except Exception:
-        # DB 取值失敗時保底 1%
-        return 0.01
+    # 快照讀取失敗時本身就回預設值（1%）
+    v = _safe_float(settings_snapshot.get().max_risk_pct, 0.01)
+    return v if v > 0 else 0.01
 
 
 # -------------------------------
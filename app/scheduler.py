@@ -1,6 +1,5 @@
 # app/scheduler.py
 from __future__ import annotations
-import json
 import logging
 from typing import Tuple, List, Dict
 from apscheduler.schedulers.background import BackgroundScheduler
@@ -13,7 +12,9 @@ except Exception:
     TZ = None
 
 from .db import exec
+from .config import Config
 from . import db_connect
+from . import settings_snapshot
 from .reporter.heartbeat import set_progress, push_error
 
 from .session import create_session_if_needed, close_session_if_needed
@@ -29,40 +30,8 @@ if not log.handlers:
 # 讀取當前設定
 # -----------------------------
 def _read_settings() -> Tuple[List[str], List[str], int]:
-    try:
-        row = exec(
-            "SELECT symbols_json, intervals_json, is_enabled FROM settings WHERE id=1").mappings().first()
-    except Exception as e:
-        log.error("讀取 settings 失敗: %s", e)
-        return (["BTCUSDT"], ["1m"], 1)
-
-    symbols: List[str] = []
-    intervals: List[str] = []
-
-    if row is not None and "is_enabled" in row and row["is_enabled"] is not None:
-        try:
-            enabled = int(row["is_enabled"])
-        except Exception:
-            enabled = 1
-    else:
-        enabled = 1
-
-    if row:
-        try:
-            symbols = list(json.loads(row["symbols_json"] or "[]"))
-        except Exception as e:
-            log.warning("settings.symbols_json 解析失敗：%s", e)
-        try:
-            intervals = list(json.loads(row["intervals_json"] or "[]"))
-        except Exception as e:
-            log.warning("settings.intervals_json 解析失敗：%s", e)
-
-    if not symbols:
-        symbols = ["BTCUSDT"]
-    if not intervals:
-        intervals = ["1m"]
-
-    return symbols, intervals, enabled
+    st = settings_snapshot.get()
+    return list(st.symbols), list(st.intervals), int(st.is_enabled)
 
 
 # -----------------------------
@@ -141,6 +110,13 @@ def _job_one(symbol: str, interval: str) -> None:
                      interval=interval, step=0, total=1, pct=0.0)
         return
 
+    # 收線閘門：沒有新的已收線 bar 就不往下跑
+    from .data.bar_gate import gate as bar_gate
+    run, bar_ct = bar_gate.check(symbol, interval)
+    if not run:
+        log.debug("bar gate 略過（無新收線）：%s %s | 累計略過=%d", symbol, interval, bar_gate.skipped)
+        return
+
     # 2) features
     try:
         set_progress(f"features:{job_base}", "RUN",
@@ -183,6 +159,7 @@ def _job_one(symbol: str, interval: str) -> None:
         apply_decision(symbol=symbol, interval=interval, decision=res)
         set_progress(f"executor:{job_base}", "OK", symbol=symbol,
                      interval=interval, step=1, total=1, pct=100.0)
+        bar_gate.mark_done(symbol, interval, bar_ct)
     except Exception as e:
         push_error(f"executor:{job_base}", f"{type(e).__name__}: {e}")
         set_progress(f"executor:{job_base}", "ERROR", symbol=symbol,
@@ -204,7 +181,7 @@ def build_and_start_scheduler(*, only_evolver: bool = False) -> BackgroundSchedu
             create_session_if_needed()
         else:
             close_session_if_needed()
-        cur_sid = exec("SELECT current_session_id FROM settings WHERE id=1").scalar()
+        cur_sid = settings_snapshot.get().current_session_id
         log.info("Session check @boot: is_enabled=%s current_session_id=%s", enabled, cur_sid)
     except Exception as _e:
         log.exception("session 初始化失敗：%s", _e)
@@ -282,6 +259,9 @@ def _parse_interval(interval: str):
 
 if __name__ == "__main__":
     import time as _t
+    from .migrate import run as _migrate
+    if Config.MIGRATE_ON_START:
+        _migrate()
     sch = build_and_start_scheduler()
     # 二次保險：主程式入口也建一次並印 sid
     try:
@@ -0,0 +1,127 @@
+# app/scripts/bench_bandit.py
+"""
+bandit 估計器 benchmark（DB_BACKEND=sqlite 記憶體庫，不需 MySQL）：
+  per-query ：每個候選模板各查一次 template_stats（舊 Estimator 的做法）
+  load_arms ：所有候選一次 GROUP BY 查詢
+  registry  ：template_registry 的彙總組陣列（0 次查詢）
+再對三種模式各做一次選擇耗時與簡單的收斂檢查：
+反覆以 (真實平均 + 雜訊) 經 book_trade 入帳、以 template_registry 的彙總選擇，最後看選到最佳模板的比例。
+另檢查 book_trade 維護的 reward_var（M2）：registry 彙總、load_arms 與直接由 trades_log 算的變異數必須一致。
+
+用法：
+  DB_BACKEND=sqlite python -m app.scripts.bench_bandit            # 候選 20 / 200 / 1000
+  DB_BACKEND=sqlite python -m app.scripts.bench_bandit 50 500
+"""
+import sys
+import time
+import random
+
+import numpy as np
+
+from app import db, migrate
+from app.db import exec
+from app.config import Config
+from app.policy import bandit, template_registry, templates_repo as repo
+from app.learner.rewards import book_trade
+
+
+def _per_query(ids):
+    out = []
+    for t in ids:
+        out.append(exec("SELECT n_trades, reward_sum, reward_var FROM template_stats WHERE template_id=:t",
+                        t=t).mappings().all())
+    return out
+
+
+def _timeit(fn, reps):
+    t0 = time.perf_counter()
+    for _ in range(reps):
+        fn()
+    return (time.perf_counter() - t0) / reps * 1e6
+
+
+def _book(tid, reward, regime=0):
+    book_trade(symbol="BTCUSDT", interval="1m", template_id=tid, regime=regime, entry_ts=1, exit_ts=2,
+               entry_price=100.0, exit_price=100.0 + reward, qty=1.0)
+
+
+def _check_var():
+    """
+    registry 彙總 / load_arms 的 reward_var 與 trades_log 直接算的值比對：
+    彙總是各 regime 的 M2 相加後 / 總筆數（組內變異，同 summarize_stats）。
+    """
+    rows = exec("SELECT template_id, regime, reward FROM trades_log WHERE template_id IS NOT NULL").all()
+    by = {}
+    for t, g, r in rows:
+        by.setdefault(int(t), {}).setdefault(int(g), []).append(float(r))
+    ids = sorted(by)
+    want = np.array([sum(np.var(v) * len(v) for v in by[t].values()) / sum(len(v) for v in by[t].values())
+                     for t in ids])
+    multi = [any(len(v) > 1 for v in by[t].values()) for t in ids]
+    got_live = bandit.arms_from_summaries(ids, template_registry.get().summaries).var   # record_reward 增量維護
+    got_reg = bandit.arms_from_summaries(ids, template_registry.refresh(force=True).summaries).var
+    got_db = bandit.load_arms(ids).var
+    ok = (all(np.allclose(g, want, rtol=1e-9, atol=1e-12) for g in (got_live, got_reg, got_db))
+          and bool((want[multi] > 0).all()))
+    print(f"reward_var：{len(ids)} 個模板  max|Δ| registry={np.abs(got_reg - want).max():.2e} "
+          f"load_arms={np.abs(got_db - want).max():.2e} live={np.abs(got_live - want).max():.2e} "
+          f"{'OK' if ok else 'FAIL'}")
+    return ok
+
+
+def _converge(mode, n_arms=10, rounds=600):
+    """
+    真實平均 0.0 .. 0.9，最佳為最後一個；每回合經 book_trade 入帳、
+    以 registry 彙總選擇；回傳後 1/3 回合選到最佳的比例。
+    """
+    rng = random.Random(5)
+    est = bandit.BatchEstimator(mode, c=2.0 if mode == "ucb1" else 1.0, rng=np.random.default_rng(5))
+    ids = [repo.insert_template(1, "LONG", None, None, None, None) for _ in range(n_arms)]
+    truth = [k / n_arms for k in range(n_arms)]
+    hits = 0
+    for r in range(rounds):
+        reg = template_registry.refresh()
+        arms = bandit.arms_from_summaries(ids, reg.summaries)
+        k = est.select(arms, int(arms.n.sum()) or 1)
+        _book(ids[k], truth[k] + rng.gauss(0, 1.0))
+        if r >= rounds * 2 // 3:
+            hits += k == n_arms - 1
+    return hits / (rounds - rounds * 2 // 3)
+
+
+def main():
+    if db.backend() != "sqlite":
+        print("請以 DB_BACKEND=sqlite 執行")
+        return 2
+    sizes = [int(x) for x in sys.argv[1:]] or [20, 200, 1000]
+    random.seed(9)
+    Config.DB_STATS_ENABLED = False
+    migrate.run()
+    have = 0
+    for k in sorted(sizes):
+        for _ in range(k - have):
+            repo.insert_template(1, "LONG", None, None, None, None)
+        have = k
+        for _ in range(k):
+            _book(random.randint(1, k), random.uniform(-1, 1), regime=random.randint(0, 2))
+        reg = template_registry.refresh(force=True)
+        ids = [int(t["template_id"]) for t in reg.actives][:k]
+        reps = max(20, 2000 // k)
+        per_q = _timeit(lambda: _per_query(ids), reps)
+        one_q = _timeit(lambda: bandit.load_arms(ids), reps)
+        no_q = _timeit(lambda: bandit.arms_from_summaries(ids, reg.summaries), reps)
+        arms = bandit.arms_from_summaries(ids, reg.summaries)
+        sel = {m: _timeit(lambda: bandit.get_estimator(m, 2.0, 0.05).select(arms, reg.total_plays), 500)
+               for m in bandit.MODES}
+        print(f"candidates={k:<5} per-query={per_q:9.0f} µs  load_arms={one_q:7.0f} µs  registry={no_q:6.0f} µs | "
+              + "  ".join(f"{m}={v:5.1f} µs" for m, v in sel.items()))
+    ok = _check_var()
+    for m in bandit.MODES:
+        print(f"converge {m:<8} 選到最佳的比例（後 1/3）={_converge(m):.2f}")
+    ok = _check_var() and ok
+    print("OK" if ok else "FAIL")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
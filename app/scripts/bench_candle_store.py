@@ -0,0 +1,127 @@
+# app/scripts/bench_candle_store.py
+"""
+K 線快取檢查 / benchmark（DB_BACKEND=sqlite 記憶體庫，不需 MySQL）：
+1) 環形緩衝繞圈：DB 只有少量歷史（complete）之後持續 ingest 超過容量，
+   since() / covers() / before() 必須改回「無法涵蓋」，不能回傳被截斷的視窗
+2) 隨機查詢 since / before：快取有回就必須與直接查 candles 相同，回 None 則表示該改查 DB
+3) 讀取耗時：since() vs SELECT ... WHERE close_time >= :ct
+
+用法：
+  DB_BACKEND=sqlite python -m app.scripts.bench_candle_store
+"""
+import sys
+import time
+import random
+
+import numpy as np
+
+from app import db, migrate
+from app.db import exec
+from app.config import Config
+from app.data.candle_store import CandleStore
+
+_COLS = ("symbol", "interval", "open_time", "close_time", "open", "high", "low", "close", "volume")
+_CAP = 16
+
+
+def _bar(k):
+    ct = (k + 1) * 60_000 - 1
+    return (ct - 59_999, 1.0 + k, 2.0 + k, 0.5 + k, 1.5 + k, 10.0 + k, ct)
+
+
+def _write(sym, ks, st=None):
+    rows = [_bar(k) for k in ks]
+    db.bulk_upsert("candles", _COLS, [(sym, "1m", ot, ct, o, h, l, c, v) for ot, o, h, l, c, v, ct in rows])
+    if st is not None:
+        st.ingest(sym, "1m", rows)
+
+
+def _db_since(sym, ct):
+    return [int(r[0]) for r in exec("SELECT close_time FROM candles WHERE symbol=:s AND `interval`='1m' "
+                                    "AND close_time >= :ct ORDER BY close_time", s=sym, ct=ct).all()]
+
+
+def _db_before(sym, ct, n):
+    rows = exec("SELECT close_time FROM candles WHERE symbol=:s AND `interval`='1m' AND close_time <= :ct "
+                "ORDER BY close_time DESC LIMIT :n", s=sym, ct=ct, n=n).all()
+    return [int(r[0]) for r in reversed(rows)]
+
+
+def _check_wrap():
+    """cap=16：先載入 5 根（complete），再 ingest 35 根繞過一圈。"""
+    st = CandleStore(capacity=_CAP, budget_mb=1, directory="")
+    _write("WRAPUSDT", range(5))
+    st.view("WRAPUSDT", "1m")
+    ok = st.covers("WRAPUSDT", "1m", 0)
+    _write("WRAPUSDT", range(5, 40), st)
+    v = st.since("WRAPUSDT", "1m", 0)
+    b = st.before("WRAPUSDT", "1m", _bar(10)[6], 5)
+    ok = ok and not st.covers("WRAPUSDT", "1m", 0) and v is None and b is None
+    tail = st.since("WRAPUSDT", "1m", _bar(30)[6])
+    ok = ok and tail is not None and tail.close_time.astype(np.int64).tolist() == _db_since("WRAPUSDT", _bar(30)[6])
+    print(f"環形繞圈：covers(0)={st.covers('WRAPUSDT', '1m', 0)} since(0)={None if v is None else v.n} "
+          f"before(舊)={None if b is None else b.n} {'OK' if ok else 'FAIL'}")
+    return ok
+
+
+def _check_random(rng, n_sym=8, rounds=400):
+    st = CandleStore(capacity=_CAP, budget_mb=1, directory="")
+    have = {}
+    for k in range(n_sym):
+        sym = f"S{k:03d}USDT"
+        have[sym] = rng.randint(0, 30)
+        _write(sym, range(have[sym]))
+    bad = served = 0
+    for _ in range(rounds):
+        sym = rng.choice(list(have))
+        if rng.random() < 0.5:
+            add = rng.randint(1, 6)
+            _write(sym, range(have[sym], have[sym] + add), st)
+            have[sym] += add
+        ct = _bar(rng.randint(0, max(have[sym], 1)))[6]
+        if rng.random() < 0.5:
+            v, want = st.since(sym, "1m", ct), _db_since(sym, ct)
+        else:
+            n = rng.randint(1, 20)
+            v, want = st.before(sym, "1m", ct, n), _db_before(sym, ct, n)
+        if v is None:
+            continue
+        served += 1
+        if v.close_time.astype(np.int64).tolist() != want:
+            bad += 1
+    print(f"隨機 since/before：{rounds} 次，快取回答 {served} 次，不一致 {bad}")
+    return bad == 0
+
+
+def _bench():
+    st = CandleStore(capacity=2048, budget_mb=16, directory="")
+    _write("BENCHUSDT", range(1500))
+    st.view("BENCHUSDT", "1m")
+    ct = _bar(1400)[6]
+    reps = 2000
+    t0 = time.perf_counter()
+    for _ in range(reps):
+        _db_since("BENCHUSDT", ct)
+    sql_us = (time.perf_counter() - t0) / reps * 1e6
+    t0 = time.perf_counter()
+    for _ in range(reps):
+        st.since("BENCHUSDT", "1m", ct)
+    mem_us = (time.perf_counter() - t0) / reps * 1e6
+    print(f"since 100 根：SELECT={sql_us:7.1f} µs  candle_store={mem_us:5.1f} µs")
+
+
+def main():
+    if db.backend() != "sqlite":
+        print("請以 DB_BACKEND=sqlite 執行")
+        return 2
+    Config.DB_STATS_ENABLED = False
+    migrate.run()
+    ok = _check_wrap()
+    ok = _check_random(random.Random(3)) and ok
+    _bench()
+    print("OK" if ok else "FAIL")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+# app/scripts/bench_candles_upsert.py
+"""
+比較 candles 寫入速度：逐筆 exec（舊）vs 多列 bulk upsert（新）。
+
+用法：
+  python -m app.scripts.bench_candles_upsert            # 預設 1000 根
+  python -m app.scripts.bench_candles_upsert 5000       # 指定根數
+
+會寫入假幣種 BENCHUSDT 的 1m K 線，結束後自動刪除。
+"""
+import sys
+import time
+import random
+
+from app.db import exec
+from app.data.collector import _insert_candles_loop, upsert_candles_bulk
+
+SYMBOL = "BENCHUSDT"
+INTERVAL = "1m"
+
+
+def _fake_rows(n: int, start_ot: int):
+    rows = []
+    px = 50_000.0
+    for k in range(n):
+        ot = start_ot + k * 60_000
+        o = px
+        c = px * (1 + random.uniform(-0.001, 0.001))
+        h = max(o, c) * (1 + random.uniform(0, 0.0005))
+        l = min(o, c) * (1 - random.uniform(0, 0.0005))
+        v = random.uniform(1, 100)
+        rows.append((ot, o, h, l, c, v, ot + 59_999))
+        px = c
+    return rows
+
+
+def _cleanup():
+    exec("DELETE FROM candles WHERE symbol=:s AND `interval`=:i", s=SYMBOL, i=INTERVAL)
+
+
+def _bench(name: str, fn, rows) -> float:
+    t0 = time.perf_counter()
+    out = fn(SYMBOL, INTERVAL, rows)
+    dt = time.perf_counter() - t0
+    print(f"  {name:<14} {len(rows):>6} 筆  {dt:8.3f}s  {len(rows) / dt:10.1f} rows/s  -> {out}")
+    return dt
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) >= 2 and sys.argv[1].isdigit() else 1000
+    start_ot = 1_600_000_000_000
+    rows = _fake_rows(n, start_ot)
+
+    _cleanup()
+    try:
+        print(f"== 新寫入（{n} 根）==")
+        t_loop = _bench("loop insert", _insert_candles_loop, rows)
+        _cleanup()
+        t_bulk = _bench("bulk insert", upsert_candles_bulk, rows)
+
+        print("== 覆寫既有（同一批資料重寫）==")
+        _bench("loop update", _insert_candles_loop, rows)
+        _bench("bulk update", upsert_candles_bulk, rows)
+
+        print(f"\n加速比（新寫入）：{t_loop / t_bulk:.1f}x")
+    finally:
+        _cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# app/scripts/bench_collector.py
+"""
+K 線抓取 benchmark（不需連 DB、不打真實 Binance）：
+本機啟一個假的 /fapi/v1/klines（含延遲、X-MBX-USED-WEIGHT-1M 標頭、超額回 429），
+比較「逐組 requests.get + sleep(0.2)」（舊）與「共用 Session 並行 + 權重限流」（新）。
+
+用法：
+  python -m app.scripts.bench_collector                 # 50 幣 × 4 週期，延遲 30ms
+  python -m app.scripts.bench_collector 50 40 16        # 幣數、延遲 ms、執行緒數
+  python -m app.scripts.bench_collector 50 30 8 --old   # 一併量測舊流程（約 pair 數 × 0.23s）
+  python -m app.scripts.bench_collector --throttle      # 額外驗證預算打滿時不觸發 429（會等到下一個整分鐘）
+"""
+import sys
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import requests
+
+from app.data import collector as col
+from app.binance.ratelimit import WeightLimiter, klines_weight
+
+INTERVALS = ("1m", "15m", "30m", "1h")
+
+
+class _FakeBinance(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"    # keep-alive，與真實 Binance 相同
+    disable_nagle_algorithm = True
+    latency_s = 0.03
+    limit_per_min = 2400
+    used = 0
+    minute = 0
+    lock = threading.Lock()
+    hits = 0
+
+    def log_message(self, *a):  # 安靜
+        pass
+
+    def do_GET(self):
+        u = urlparse(self.path)
+        if u.path != "/fapi/v1/klines":
+            self.send_response(404); self.send_header("Content-Length", "0"); self.end_headers(); return
+        q = {k: v[0] for k, v in parse_qs(u.query).items()}
+        limit = int(q.get("limit", 500))
+        cls = type(self)
+        with cls.lock:
+            m = int(time.time() // 60)
+            if m != cls.minute:
+                cls.minute, cls.used = m, 0
+            cls.used += klines_weight(limit)
+            cls.hits += 1
+            used = cls.used
+        time.sleep(cls.latency_s)
+        if used > cls.limit_per_min:
+            self.send_response(429)
+            self.send_header("Retry-After", "1")
+            self.send_header("X-MBX-USED-WEIGHT-1M", str(used))
+            self.send_header("Content-Length", "0")
+            self.end_headers(); return
+        itv = col._interval_ms(q.get("interval", "1m"))
+        st = int(q.get("startTime", 0)) // itv * itv
+        body = json.dumps([[st + k * itv, "1", "2", "0.5", "1.5", "10", st + (k + 1) * itv - 1,
+                            "0", 1, "0", "0", "0"] for k in range(limit)]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-MBX-USED-WEIGHT-1M", str(used))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _old_fetch(base, s, i):
+    r = requests.get(f"{base}/fapi/v1/klines", params={"symbol": s, "interval": i, "limit": 3, "startTime": 0},
+                     timeout=10)
+    r.raise_for_status()
+    time.sleep(0.2)
+    return len(r.json())
+
+
+def _new_fetch(s, i):
+    return len(col._fetch_binance_klines(s, i, start_ms=0, end_ms=None, limit=3))
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    n_sym = int(args[0]) if len(args) >= 1 else 50
+    _FakeBinance.latency_s = (float(args[1]) if len(args) >= 2 else 30.0) / 1000.0
+    workers = int(args[2]) if len(args) >= 3 else 16
+    pairs = [(f"S{k:03d}USDT", i) for k in range(n_sym) for i in INTERVALS]
+
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _FakeBinance)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{srv.server_address[1]}"
+    col.BINANCE_BASE = base
+    col.limiter = WeightLimiter(2000)
+    import logging; logging.getLogger("autobot").setLevel(logging.WARNING)
+
+    print(f"pairs={len(pairs)} latency={_FakeBinance.latency_s * 1000:.0f}ms workers={workers}")
+    if "--old" in sys.argv:
+        t0 = time.perf_counter()
+        for s, i in pairs:
+            _old_fetch(base, s, i)
+        print(f"  舊（逐組 + sleep 0.2）: {time.perf_counter() - t0:8.2f}s")
+
+    col._run_pairs(_new_fetch, pairs[:workers], workers)  # 暖機：建立連線池
+    t0 = time.perf_counter()
+    res = col._run_pairs(_new_fetch, pairs, workers)
+    dt = time.perf_counter() - t0
+    bad = [k for k, v in res.items() if isinstance(v, Exception) or v != 3]
+    print(f"  新（並行 + 權重限流）: {dt:8.3f}s  失敗={len(bad)}  伺服器已用權重={col.limiter.server_used}"
+          f"  限流等待={col.limiter.waited_s:.2f}s")
+
+    # 權重打滿：預算設很小，確認限流器讓請求不觸發 429
+    if "--throttle" not in sys.argv:
+        srv.shutdown()
+        sys.exit(1 if bad else 0)
+    _FakeBinance.used = 0
+    col.limiter = WeightLimiter(60)
+    t0 = time.perf_counter()
+    res = col._run_pairs(_new_fetch, pairs[:70], workers)
+    print(f"  預算 60/min 抓 70 組 : {time.perf_counter() - t0:8.2f}s  "
+          f"失敗={sum(isinstance(v, Exception) for v in res.values())}  執行緒累計等待={col.limiter.waited_s:.2f}s")
+    srv.shutdown()
+    if bad:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# app/scripts/bench_evaluate_many.py
+"""
+policy 批次評估 benchmark（DB_BACKEND=sqlite 記憶體庫，不需 MySQL）：
+  per-pair：逐一 evaluate_symbol_interval（每組一次 features 查詢 + 逐列 Python 平均）
+  many    ：evaluate_many（所有 pair 一次 UNION ALL 查詢 + NumPy 整批計算）
+兩者在同一份狀態下的輸出必須完全相同（含 E_long / E_short 浮點位元、template_id）；
+比對時先備份 gap 視窗，兩邊各跑一次後再比較。
+
+用法：
+  DB_BACKEND=sqlite python -m app.scripts.bench_evaluate_many         # 200 組（50 symbols × 4 intervals）
+  DB_BACKEND=sqlite python -m app.scripts.bench_evaluate_many 25      # 25 symbols × 4 intervals
+"""
+import sys
+import copy
+import time
+import random
+
+from app import db, migrate
+from app.config import Config
+from app.policy import policy, gap_quantile, template_registry, templates_repo as repo
+
+_INTERVALS = ("1m", "15m", "30m", "1h")
+_COLS = ("symbol", "interval", "close_time", "rsi", "macd_dif", "macd_dea", "macd_hist",
+         "k", "d", "kd_diff", "vol_ratio", "atr_pct", "slope", "range_pct", "regime")
+
+
+def _val(lo, hi):
+    r = random.random()
+    if r < 0.02:
+        return None
+    if r < 0.03:
+        return random.choice([1e300, -1e300])   # 會讓加總溢位
+    return random.uniform(lo, hi)
+
+
+def _seed(symbols):
+    rows = []
+    for s in symbols:
+        for i in _INTERVALS:
+            # 有些 pair 資料很少（<20 / <50 筆），有些完全沒有
+            n = random.choice([0, 5, 19, 35, 80, 80, 80])
+            for k in range(n):
+                rows.append((s, i, 1_700_000_000_000 + k * 60_000, _val(0, 100), _val(-1, 1), _val(-1, 1),
+                             _val(-2, 2), _val(0, 100), _val(0, 100), _val(-20, 20), _val(0.3, 3),
+                             random.choice([_val(0, 0.002), 1e-7]), _val(-0.5, 0.5), _val(0, 0.01),
+                             random.choice([0, 1, 2, None])))
+    db.bulk_upsert("features", _COLS, rows)
+    for _ in range(60):
+        f = {k: random.choice([None, "|".join(random.sample(v, random.randint(1, len(v))))])
+             for k, v in (("rsi", ["L", "M", "H"]), ("macd", ["P", "N"]), ("kd", ["P", "N"]), ("vol", ["L", "M", "H", "X"]))}
+        repo.insert_template(1, random.choice(["LONG", "SHORT"]), f["rsi"], f["macd"], f["kd"], f["vol"])
+
+
+def _eval(p):
+    try:
+        return policy.evaluate_symbol_interval(*p)
+    except Exception as e:   # 例：最新一列 rsi 為 NULL 時 feature_bins 會丟 TypeError
+        return e
+
+
+def _same(a, b):
+    if isinstance(a, Exception) or isinstance(b, Exception):
+        return type(a) is type(b)
+    return (a["action"], a["template_id"], repr(a["E_long"]), repr(a["E_short"])) == \
+           (b["action"], b["template_id"], repr(b["E_long"]), repr(b["E_short"]))
+
+
+def main():
+    if db.backend() != "sqlite":
+        print("請以 DB_BACKEND=sqlite 執行")
+        return 2
+    n_sym = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    random.seed(11)
+    Config.DB_STATS_ENABLED = False
+    Config.GAP_SNAPSHOT_S = 0
+    migrate.run()
+    symbols = [f"S{k:03d}USDT" for k in range(n_sym)]
+    _seed(symbols)
+    pairs = [(s, i) for s in symbols for i in _INTERVALS]
+    template_registry.refresh(force=True)
+
+    ok = True
+    for rnd in range(80):   # 多輪：gap 視窗累積超過 50 筆後改走分位數門檻
+        saved = copy.deepcopy(gap_quantile._windows)
+        want = {p: _eval(p) for p in pairs}
+        gap_quantile._windows.clear()
+        gap_quantile._windows.update(saved)
+        got = policy.evaluate_many(pairs)
+        for p in pairs:
+            if not _same(want[p], got[p]):
+                ok = False
+                print("MISMATCH", rnd, p, want[p], got[p])
+    acts = {}
+    for r in got.values():
+        if isinstance(r, Exception):
+            r = {"action": type(r).__name__}
+        acts[r["action"]] = acts.get(r["action"], 0) + 1
+    print(f"pairs={len(pairs)} actions={acts}")
+
+    reps = 20
+    t0 = time.perf_counter()
+    for _ in range(reps):
+        for p in pairs:
+            _eval(p)
+    per_ms = (time.perf_counter() - t0) / reps * 1000
+    t0 = time.perf_counter()
+    for _ in range(reps):
+        policy.evaluate_many(pairs)
+    many_ms = (time.perf_counter() - t0) / reps * 1000
+    print(f"per-pair={per_ms:8.2f} ms  many={many_ms:7.2f} ms  x{per_ms / max(many_ms, 1e-9):.1f}")
+    print("OK" if ok else "MISMATCH")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
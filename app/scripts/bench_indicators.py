@@ -0,0 +1,116 @@
+# app/scripts/bench_indicators.py
+"""
+NumPy 指標引擎 vs 純 Python 版本：一致性檢查 + 速度比較（不需連 DB）。
+另外檢查增量狀態（IndicatorState，一次推一根）與 NumPy 完整重算的結果一致。
+
+用法：
+  python -m app.scripts.bench_indicators            # 預設 600 根 × 50 輪
+  python -m app.scripts.bench_indicators 5000 10    # 5000 根 × 10 輪
+"""
+import sys
+import time
+import random
+
+import numpy as np
+
+from app.data import features as f
+from app.data import indicators as ind
+from app.data.indicator_state import IndicatorState
+
+
+def _fake_series(n: int):
+    px = 100.0
+    hi, lo, cl, vol = [], [], [], []
+    for _ in range(n):
+        o = px
+        c = px * (1 + random.gauss(0, 0.002))
+        hi.append(max(o, c) * (1 + abs(random.gauss(0, 0.001))))
+        lo.append(min(o, c) * (1 - abs(random.gauss(0, 0.001))))
+        cl.append(c)
+        vol.append(random.uniform(1, 1000))
+        px = c
+    return hi, lo, cl, vol
+
+
+def _python_columns(hi, lo, cl, vol):
+    """照 compute_and_store_features 舊流程用純 Python 指標組出欄位。"""
+    rsi = f._rsi(cl, 14)
+    dif, dea, hist = f._macd(cl, 12, 26, 9)
+    k, d, kd = f._kdj(hi, lo, cl, 9, 3, 3)
+    atr = f._atr(hi, lo, cl, 14)
+    vema = f._ema_series(vol, 20)
+    slope = f._linreg_slope(cl, 10)
+    out = {nm: [] for nm in ("rsi", "macd_dif", "macd_dea", "macd_hist", "k", "d", "kd_diff",
+                             "vol_ratio", "atr_pct", "slope", "range_pct", "regime")}
+    for i in range(len(cl)):
+        c = cl[i] if cl[i] != 0 else 1.0
+        vr = vol[i] / vema[i] if vema[i] not in (None, 0) else 0.0
+        out["rsi"].append(f._finite(rsi[i], 50.0))
+        out["macd_dif"].append(f._finite(dif[i], 0.0))
+        out["macd_dea"].append(f._finite(dea[i], 0.0))
+        out["macd_hist"].append(f._finite(hist[i], 0.0))
+        out["k"].append(f._finite(k[i], 50.0))
+        out["d"].append(f._finite(d[i], 50.0))
+        out["kd_diff"].append(f._finite(kd[i], 0.0))
+        out["vol_ratio"].append(f._finite(vr, 1.0))
+        out["atr_pct"].append(f._finite(f._finite(atr[i], 0.0) / c, 0.0))
+        out["slope"].append(f._finite(slope[i], 0.0))
+        out["range_pct"].append(f._finite((hi[i] - lo[i]) / c, 0.0))
+        out["regime"].append(1 if f._finite(hist[i], 0.0) >= 0 else -1)
+    return out
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) >= 2 else 600
+    rounds = int(sys.argv[2]) if len(sys.argv) >= 3 else 50
+    hi, lo, cl, vol = _fake_series(n)
+    ahi, alo, acl, avol = (np.asarray(x, dtype=np.float64) for x in (hi, lo, cl, vol))
+
+    ref = _python_columns(hi, lo, cl, vol)
+    new = ind.compute_feature_columns(ahi, alo, acl, avol)
+    print(f"== 一致性（rtol={ind.FEATURE_RTOL}, atol={ind.FEATURE_ATOL}）==")
+    ok_all = True
+    for nm, vals in ref.items():
+        a = np.asarray(vals, dtype=np.float64)
+        b = new[nm].astype(np.float64)
+        ok = np.allclose(a, b, rtol=ind.FEATURE_RTOL, atol=ind.FEATURE_ATOL)
+        ok_all &= bool(ok)
+        print(f"  {nm:<10} max|diff|={float(np.max(np.abs(a - b))):.3e}  {'OK' if ok else 'MISMATCH'}")
+
+    print("\n== 增量狀態 vs NumPy（前半 replay、序列化還原後逐根 update）==")
+    rows = [{"close_time": i, "open": cl[i - 1] if i else cl[0], "high": hi[i], "low": lo[i],
+             "close": cl[i], "volume": vol[i]} for i in range(n)]
+    half = n // 2
+    st = IndicatorState.from_dict(IndicatorState.replay(rows[:half]).to_dict())
+    inc = [st.update(r) for r in rows[half:]]
+    for nm in ref:
+        a = new[nm][half:].astype(np.float64)
+        b = np.asarray([x[nm] for x in inc], dtype=np.float64)
+        ok = np.allclose(a, b, rtol=ind.FEATURE_RTOL, atol=ind.FEATURE_ATOL)
+        ok_all &= bool(ok)
+        print(f"  {nm:<10} max|diff|={float(np.max(np.abs(a - b))):.3e}  {'OK' if ok else 'MISMATCH'}")
+
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        st.clone().update(rows[-1])
+    t_inc = time.perf_counter() - t0
+
+    print(f"\n== 速度（{n} 根 × {rounds} 輪）==")
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        _python_columns(hi, lo, cl, vol)
+    t_py = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        ind.compute_feature_columns(ahi, alo, acl, avol)
+    t_np = time.perf_counter() - t0
+    print(f"  python : {t_py / rounds * 1000:8.3f} ms/輪")
+    print(f"  numpy  : {t_np / rounds * 1000:8.3f} ms/輪")
+    print(f"  加速比 : {t_py / t_np:.1f}x")
+    print(f"  增量1根: {t_inc / rounds * 1000:8.3f} ms/輪（含 clone）")
+    if not ok_all:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
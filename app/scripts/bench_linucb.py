@@ -0,0 +1,143 @@
+# app/scripts/bench_linucb.py
+"""
+LinUCB 模板選擇 benchmark / 檢查（DB_BACKEND=sqlite 記憶體庫，不需 MySQL）：
+1) Sherman–Morrison 累積 N 次後的 A⁻¹ / θ 與直接 inv(λI + ΣxxT) / solve 的誤差
+2) book_trade 入帳 → linucb_state 寫回；清掉行程內狀態後重讀，陣列必須逐位元相同
+3) 候選池打分：逐一模板 (A⁻¹x, θ·x) vs 一次批次矩陣-向量乘法
+4) 合成資料：每個模板的期望報酬是情境的線性函數，比較 LinUCB 與 UCB1 後段選到最佳模板的比例
+
+用法：
+  DB_BACKEND=sqlite python -m app.scripts.bench_linucb            # 候選 20 / 200 / 2000
+  DB_BACKEND=sqlite python -m app.scripts.bench_linucb 50 500
+"""
+import sys
+import time
+import random
+
+import numpy as np
+
+from app import db, migrate
+from app.config import Config
+from app.policy import linucb, bandit, templates_repo as repo
+from app.learner.rewards import book_trade
+
+
+def _rand_feat(rng):
+    return {"rsi": rng.uniform(10, 90), "macd_dif": rng.uniform(-1, 1), "macd_dea": rng.uniform(-1, 1),
+            "macd_hist": rng.uniform(-0.5, 0.5), "kd_diff": rng.uniform(-30, 30), "vol_ratio": rng.uniform(0.3, 3),
+            "atr_pct": rng.uniform(0, 0.02), "regime": rng.choice([-1, 1])}
+
+
+def _check_sm(rng):
+    st = linucb.LinUCBStore(linucb.D, 1.0)
+    A, b = np.eye(linucb.D), np.zeros(linucb.D)
+    for _ in range(2000):
+        x, r = linucb.context(_rand_feat(rng)), rng.gauss(0, 1)
+        st.update(1, x, r)
+        A += np.outer(x, x)
+        b += r * x
+    row = int(st.rows([1])[0])
+    err_a = float(np.abs(st.a_inv[row] - np.linalg.inv(A)).max())
+    err_t = float(np.abs(st.theta[row] - np.linalg.solve(A, b)).max())
+    print(f"sherman-morrison 2000 次：max|ΔA⁻¹|={err_a:.2e}  max|Δθ|={err_t:.2e}")
+    return err_a < 1e-9 and err_t < 1e-9
+
+
+def _check_persist(rng):
+    rows = []
+    for k in range(50):
+        f = _rand_feat(rng)
+        rows.append(("BTCUSDT", "1m", 1_700_000_000_000 + k * 60_000, f["rsi"], f["macd_dif"], f["macd_dea"],
+                     f["macd_hist"], f["kd_diff"], f["vol_ratio"], f["atr_pct"], f["regime"]))
+    db.bulk_upsert("features", ("symbol", "interval", "close_time", "rsi", "macd_dif", "macd_dea", "macd_hist",
+                                "kd_diff", "vol_ratio", "atr_pct", "regime"), rows)
+    tids = [repo.insert_template(1, "LONG", None, None, None, None) for _ in range(3)]
+    for _ in range(30):
+        ct = rng.choice(rows)[2]
+        book_trade(symbol="BTCUSDT", interval="1m", template_id=rng.choice(tids), regime=0,
+                   entry_ts=ct + rng.randint(0, 59_999), exit_ts=ct + 600_000,
+                   entry_price=100.0, exit_price=100.0 + rng.uniform(-1, 1), qty=1.0)
+    before = linucb.store()
+    snap = {t: (before.a_inv[r].copy(), before.b[r].copy(), int(before.n_updates[r]))
+            for t, r in zip(tids, before.rows(tids))}
+    linucb.invalidate()
+    after = linucb.store()
+    ok = all(np.array_equal(a, after.a_inv[r]) and np.array_equal(b, after.b[r]) and n == int(after.n_updates[r])
+             for (a, b, n), r in zip(snap.values(), after.rows(tids)))
+    print(f"book_trade → linucb_state → 重讀：{'一致' if ok else '不一致'}  n={[v[2] for v in snap.values()]}  {linucb.stats}")
+    return ok and sum(v[2] for v in snap.values()) == 30
+
+
+def _bench_score(sizes, rng):
+    st = linucb.LinUCBStore(linucb.D, 1.0)
+    for k in sizes:
+        ids = list(range(1, k + 1))
+        for t in ids:
+            for _ in range(3):
+                st.update(t, linucb.context(_rand_feat(rng)), rng.gauss(0, 1))
+        x = linucb.context(_rand_feat(rng))
+        reps = max(20, 20_000 // k)
+
+        def _loop():
+            out = []
+            for t in ids:
+                r = int(st.rows([t])[0])
+                a = st.a_inv[r]
+                out.append(float(st.theta[r] @ x) + float(np.sqrt(x @ a @ x)))
+            return out
+
+        t0 = time.perf_counter()
+        for _ in range(reps):
+            want = _loop()
+        loop_us = (time.perf_counter() - t0) / reps * 1e6
+        t0 = time.perf_counter()
+        for _ in range(reps):
+            got = st.score(ids, x, 1.0)
+        batch_us = (time.perf_counter() - t0) / reps * 1e6
+        assert np.allclose(want, got)
+        print(f"candidates={k:<6} loop={loop_us:9.1f} µs  batched={batch_us:7.1f} µs  x{loop_us / max(batch_us, 1e-9):.0f}")
+
+
+def _simulate(rng, n_arms=8, rounds=3000):
+    """期望報酬 = w_k · x；回傳 (LinUCB, UCB1) 後 1/3 回合選到當下最佳模板的比例。"""
+    nrng = np.random.default_rng(3)
+    W = nrng.normal(0, 1, (n_arms, linucb.D))
+    lin = linucb.LinUCBStore(linucb.D, 1.0)
+    ucb = bandit.BatchEstimator("ucb1", c=2.0)
+    n, s = np.zeros(n_arms), np.zeros(n_arms)
+    hit_lin = hit_ucb = 0
+    ids = list(range(1, n_arms + 1))
+    for r in range(rounds):
+        x = linucb.context(_rand_feat(rng))
+        best = int(np.argmax(W @ x))
+        k = int(np.argmax(lin.score(ids, x, 0.5)))
+        lin.update(ids[k], x, float(W[k] @ x) + rng.gauss(0, 0.5))
+        j = ucb.select(bandit.Arms(ids, n, np.where(n > 0, s / np.maximum(n, 1), 0.0), np.zeros(n_arms)), int(n.sum()) or 1)
+        n[j] += 1
+        s[j] += float(W[j] @ x) + rng.gauss(0, 0.5)
+        if r >= rounds * 2 // 3:
+            hit_lin += k == best
+            hit_ucb += j == best
+    m = rounds - rounds * 2 // 3
+    return hit_lin / m, hit_ucb / m
+
+
+def main():
+    if db.backend() != "sqlite":
+        print("請以 DB_BACKEND=sqlite 執行")
+        return 2
+    sizes = [int(x) for x in sys.argv[1:]] or [20, 200, 2000]
+    rng = random.Random(4)
+    Config.DB_STATS_ENABLED = False
+    migrate.run()
+    ok = _check_sm(rng)
+    ok = _check_persist(rng) and ok
+    _bench_score(sizes, rng)
+    lin, ucb = _simulate(rng)
+    print(f"合成情境：選到最佳模板的比例（後 1/3） LinUCB={lin:.2f}  UCB1={ucb:.2f}")
+    print("OK" if ok else "FAIL")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
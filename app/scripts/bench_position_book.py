@@ -0,0 +1,127 @@
+# app/scripts/bench_position_book.py
+"""
+持倉簿 benchmark / 檢查（DB_BACKEND=sqlite 記憶體庫，不需 MySQL）：
+1) 隨機開倉 / 更新峰值 / 平倉，每一步比對 position_book 與直接查 positions 的結果（欄位、版本）
+2) 別處改過該列（version+1）→ update 版本不符、重讀後重寫；別處平倉 → verify() 重讀；
+   手動平倉沒動 version → update 影響 0 列、重讀後放棄，不會把 CLOSED 列寫回
+3) unit_of_work 內開倉後丟例外（ROLLBACK）→ invalidate 後 get() 與 DB 一致
+4) 讀持倉耗時：每次 SELECT ... ORDER BY opened_at DESC LIMIT 1 vs 行程內 get()
+
+用法：
+  DB_BACKEND=sqlite python -m app.scripts.bench_position_book          # 20 組 pair、2000 步
+  DB_BACKEND=sqlite python -m app.scripts.bench_position_book 50 5000
+"""
+import sys
+import time
+import random
+
+from app import db, migrate
+from app.db import exec, unit_of_work
+from app.config import Config
+from app.exec import executor, position_book
+
+_SELECT = ("SELECT * FROM positions WHERE symbol=:s AND `interval`=:i AND status='OPEN' "
+           "ORDER BY opened_at DESC LIMIT 1")
+
+
+def _db_pos(s, i):
+    r = exec(_SELECT, s=s, i=i).mappings().first()
+    return dict(r) if r else None
+
+
+def _same(s, i):
+    a, b = position_book.get(s, i), _db_pos(s, i)
+    if a is None or b is None:
+        return a is None and b is None
+    return all(a.get(k) == v for k, v in b.items())
+
+
+def _random_walk(pairs, steps, rng):
+    bad = 0
+    for n in range(steps):
+        s, i = rng.choice(pairs)
+        pos = position_book.get(s, i)
+        if pos is None:
+            executor.open_position_v2(s, i, rng.choice(["LONG", "SHORT"]), 100.0 + rng.uniform(-5, 5),
+                                      rng.uniform(0.1, 2.0), 5, template_id=rng.randint(1, 9), regime_entry=1)
+        elif rng.random() < 0.7:
+            executor._update_peak(s, i, float(pos["peak_price"]) + rng.uniform(-1, 1))
+        else:
+            executor.close_position_v2(s, i, 100.0 + rng.uniform(-5, 5))
+        if not _same(s, i):
+            bad += 1
+            print("MISMATCH", n, s, i, position_book.get(s, i), _db_pos(s, i))
+    return bad
+
+
+def _check_conflicts(pairs):
+    bk = position_book.book()
+    s, i = pairs[0]
+    if bk.get(s, i) is None:
+        executor.open_position_v2(s, i, "LONG", 100.0, 1.0, 5, template_id=1, regime_entry=1)
+    pid = bk.get(s, i)["pos_id"]
+    exec("UPDATE positions SET qty=qty*2, version=version+1 WHERE pos_id=:id", id=pid)   # 別的行程改過
+    c0 = bk.stats["conflicts"]
+    ok = bk.update(s, i, peak_price=123.0) and bk.stats["conflicts"] == c0 + 1 and _same(s, i)
+    exec("UPDATE positions SET status='CLOSED', version=version+1 WHERE pos_id=:id", id=pid)   # 別處平倉
+    n = position_book.verify()
+    ok = ok and n >= 1 and position_book.get(s, i) is None and _same(s, i)
+    executor.open_position_v2(s, i, "LONG", 100.0, 1.0, 5, template_id=1, regime_entry=1)
+    pid = bk.get(s, i)["pos_id"]
+    exec("UPDATE positions SET status='CLOSED' WHERE pos_id=:id", id=pid)   # 手動平倉，沒動 version
+    row = exec("SELECT status, peak_price FROM positions WHERE pos_id=:id", id=pid).first()
+    ok = ok and not bk.update(s, i, peak_price=456.0) and position_book.get(s, i) is None and _same(s, i)
+    ok = ok and tuple(exec("SELECT status, peak_price FROM positions WHERE pos_id=:id", id=pid).first()) == tuple(row)
+    print(f"版本衝突 / 外部平倉：{'OK' if ok else 'FAIL'}  {bk.stats}")
+    return ok
+
+
+def _check_rollback(pairs):
+    s, i = pairs[1]
+    if position_book.get(s, i) is not None:
+        executor.close_position_v2(s, i, 100.0)
+    try:
+        with unit_of_work():
+            executor.open_position_v2(s, i, "SHORT", 100.0, 1.0, 5, template_id=2, regime_entry=1)
+            raise RuntimeError("rollback")
+    except RuntimeError:
+        position_book.invalidate(s, i)
+    ok = position_book.get(s, i) is None and _same(s, i)
+    print(f"ROLLBACK 後重讀：{'OK' if ok else 'FAIL'}")
+    return ok
+
+
+def main():
+    if db.backend() != "sqlite":
+        print("請以 DB_BACKEND=sqlite 執行")
+        return 2
+    n_pairs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    steps = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    rng = random.Random(7)
+    Config.DB_STATS_ENABLED = False
+    migrate.run()
+    pairs = [(f"S{k:03d}USDT", iv) for k in range((n_pairs + 3) // 4) for iv in ("1m", "15m", "30m", "1h")][:n_pairs]
+    print(f"reconcile：{position_book.reconcile()} 組 OPEN")
+
+    bad = _random_walk(pairs, steps, rng)
+    print(f"隨機 {steps} 步：不一致 {bad}  open={sum(position_book.get(s, i) is not None for s, i in pairs)}")
+    ok = bad == 0
+    ok = _check_conflicts(pairs) and ok
+    ok = _check_rollback(pairs) and ok
+
+    reps = 5000
+    t0 = time.perf_counter()
+    for k in range(reps):
+        _db_pos(*pairs[k % len(pairs)])
+    sel_us = (time.perf_counter() - t0) / reps * 1e6
+    t0 = time.perf_counter()
+    for k in range(reps):
+        position_book.get(*pairs[k % len(pairs)])
+    get_us = (time.perf_counter() - t0) / reps * 1e6
+    print(f"讀持倉：SELECT={sel_us:7.1f} µs  book.get={get_us:5.2f} µs  x{sel_us / max(get_us, 1e-9):.0f}")
+    print("OK" if ok else "FAIL")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
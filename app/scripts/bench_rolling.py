@@ -0,0 +1,76 @@
+# app/scripts/bench_rolling.py
+"""
+滾動高低點 micro-benchmark（不需連 DB）：
+  naive  ：舊 _kdj 的作法，每根切片再 min/max（O(n·w)）
+  deque  ：rolling_min / rolling_max（單調佇列，O(n)）
+  numpy  ：rolling_min_np / rolling_max_np（van Herk / Gil-Werman，O(n)）
+
+用法：
+  python -m app.scripts.bench_rolling            # 視窗 9，10k / 100k / 1M 根
+  python -m app.scripts.bench_rolling 50         # 指定視窗
+"""
+import sys
+import time
+import random
+
+import numpy as np
+
+from app.data.rolling import rolling_min, rolling_max, rolling_min_np, rolling_max_np, RollingMinMax
+
+
+def _naive(lo, hi, w):
+    mn, mx = [], []
+    for i in range(len(lo)):
+        j = max(0, i - w + 1)
+        mn.append(min(lo[j:i + 1]))
+        mx.append(max(hi[j:i + 1]))
+    return mn, mx
+
+
+def _deque(lo, hi, w):
+    return rolling_min(lo, w), rolling_max(hi, w)
+
+
+def _numpy(lo, hi, w):
+    return rolling_min_np(lo, w), rolling_max_np(hi, w)
+
+
+def _stream(lo, hi, w):
+    rm = RollingMinMax(w)
+    out = [rm.push(l, h) for l, h in zip(lo, hi)]
+    return [a for a, _ in out], [b for _, b in out]
+
+
+def _time(fn, *args) -> float:
+    t0 = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - t0
+
+
+def main():
+    w = int(sys.argv[1]) if len(sys.argv) >= 2 else 9
+    print(f"視窗 w={w}")
+    print(f"{'bars':>9} {'naive':>10} {'deque':>10} {'stream':>10} {'numpy':>10}")
+    for n in (10_000, 100_000, 1_000_000):
+        lo = [random.random() for _ in range(n)]
+        hi = [x + random.random() for x in lo]
+        alo, ahi = np.asarray(lo), np.asarray(hi)
+
+        ref = _naive(lo[:5000], hi[:5000], w)
+        for name, got in (("deque", _deque(lo[:5000], hi[:5000], w)),
+                          ("stream", _stream(lo[:5000], hi[:5000], w)),
+                          ("numpy", _numpy(alo[:5000], ahi[:5000], w))):
+            if list(got[0]) != ref[0] or list(got[1]) != ref[1]:
+                print(f"  !! {name} 結果與 naive 不一致")
+                sys.exit(1)
+
+        t_naive = _time(_naive, lo, hi, w)
+        t_deque = _time(_deque, lo, hi, w)
+        t_stream = _time(_stream, lo, hi, w)
+        t_np = _time(_numpy, alo, ahi, w)
+        print(f"{n:>9} {t_naive * 1000:>8.1f}ms {t_deque * 1000:>8.1f}ms "
+              f"{t_stream * 1000:>8.1f}ms {t_np * 1000:>8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# app/scripts/bench_stmt_cache.py
+"""
+db.exec 單次呼叫的用戶端開銷 benchmark（不需連 MySQL）：
+以 SQLite 記憶體庫跑同一條「最新一根 K 線」查詢，比較
+  raw      ：直接用 sqlite3 cursor（驅動本身的成本，當基準）
+  no-cache ：每次 text(sql)（DB_STMT_CACHE=0，舊行為）
+  cached   ：TextClause LRU（DB_STMT_CACHE>0）
+  prepared ：db.prepare 預編譯，exec_driver_sql 直送
+每種模式的「開銷」= 平均耗時 - raw。查詢統計關閉，避免把統計成本算進來。
+
+用法：
+  python -m app.scripts.bench_stmt_cache            # 每種 20000 次
+  python -m app.scripts.bench_stmt_cache 50000
+"""
+import sys
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+
+from app import db
+from app.config import Config
+
+SQL = "SELECT close_time, close FROM candles WHERE symbol=:s AND `interval`=:i ORDER BY close_time DESC LIMIT 1"
+
+
+def _setup():
+    db._engine = create_engine("sqlite://", poolclass=StaticPool, isolation_level="AUTOCOMMIT",
+                               connect_args={"check_same_thread": False})
+    db.exec("CREATE TABLE candles(symbol TEXT, `interval` TEXT, close_time INT, close REAL, "
+            "PRIMARY KEY(symbol, `interval`, close_time))")
+    rows = [(s, "1m", 60_000 * k - 1, 100.0 + k) for s in ("BTCUSDT", "ETHUSDT") for k in range(1, 501)]
+    db.bulk_upsert("candles", ("symbol", "interval", "close_time", "close"), rows)
+
+
+def _time(fn, n: int) -> float:
+    for _ in range(200):  # 暖身
+        fn()
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1e6   # µs / call
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    _setup()
+    Config.DB_STATS_ENABLED = False
+
+    raw_conn = db.engine().raw_connection()
+    cur = raw_conn.cursor()
+    raw_sql = SQL.replace(":s", "?").replace(":i", "?")
+
+    def raw():
+        cur.execute(raw_sql, ("BTCUSDT", "1m"))
+        return cur.fetchone()
+
+    def via_exec():
+        return db.exec(SQL, s="BTCUSDT", i="1m").first()
+
+    q = db.prepare(SQL)
+
+    def via_prepared():
+        return q(s="BTCUSDT", i="1m").first()
+
+    want = raw()
+    res = {}
+    res["raw"] = _time(raw, n)
+
+    Config.DB_STMT_CACHE = 0
+    Config.DB_PREPARED = False
+    assert tuple(via_exec()) == tuple(want)
+    res["no-cache"] = _time(via_exec, n)
+
+    Config.DB_STMT_CACHE = 512
+    assert tuple(via_exec()) == tuple(want)
+    res["cached"] = _time(via_exec, n)
+
+    Config.DB_PREPARED = True
+    assert tuple(via_prepared()) == tuple(want)
+    res["prepared"] = _time(via_prepared, n)
+
+    base = res["raw"]
+    print(f"{'mode':<10}{'µs/call':>10}{'overhead µs':>14}")
+    for k, v in res.items():
+        print(f"{k:<10}{v:>10.1f}{v - base:>14.1f}")
+    print("stmt cache:", db.stmt_cache_stats)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
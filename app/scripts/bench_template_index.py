@@ -0,0 +1,84 @@
+# app/scripts/bench_template_index.py
+"""
+模板比對 benchmark（不需連 DB）：
+隨機產生模板池（含萬用 / "*" / "L|M" 集合 / 值域外的值），
+先檢查 TemplateIndex 在 48 格 × 三種 side 的結果與 match_templates 完全相同（含順序），
+再比較每次決策的比對耗時：逐一 _field_ok 掃描 vs 索引查表（索引已建好；模板池有變時由 template_registry 重建）。
+
+用法：
+  python -m app.scripts.bench_template_index              # 池大小 50 / 500 / 5000
+  python -m app.scripts.bench_template_index 20 200
+"""
+import sys
+import time
+import random
+import itertools
+
+from app.policy import templates_eval as te
+
+
+def _rand_field(values):
+    r = random.random()
+    if r < 0.25:
+        return random.choice([None, "", "*"])
+    if r < 0.30:
+        return "X|Z"   # 含值域外的值
+    k = random.randint(1, len(values))
+    return "|".join(random.sample(values, k))
+
+
+def _pool(n: int):
+    out = []
+    for i in range(n):
+        t = {"template_id": i + 1, "side": random.choice(["LONG", "SHORT"]),
+             "status": "ACTIVE" if random.random() > 0.1 else "FROZEN"}
+        for field, values in te.BIN_VALUES:
+            t[field] = _rand_field(list(values))
+        out.append(t)
+    return out
+
+
+def _all_bins():
+    fields = [f for f, _ in te.BIN_VALUES]
+    for combo in itertools.product(*[v for _, v in te.BIN_VALUES]):
+        yield dict(zip(fields, combo))
+
+
+def main():
+    sizes = [int(x) for x in sys.argv[1:]] or [50, 500, 5000]
+    random.seed(7)
+    ok = True
+    for n in sizes:
+        pool = _pool(n)
+        idx = te.TemplateIndex(pool)
+        cells = list(_all_bins())
+        assert len(cells) == te.N_CELLS and sorted(te.cell_id(b) for b in cells) == list(range(te.N_CELLS))
+        for b in cells:
+            for side in ("LONG", "SHORT", ""):
+                want = [t["template_id"] for t in te.match_templates(pool, b, side)]
+                got = [t["template_id"] for t in idx.match(b, side)]
+                if want != got:
+                    ok = False
+                    print("MISMATCH", n, b, side, want[:5], got[:5])
+
+        reps = max(200, 200_000 // n)
+        seq = [random.choice(cells) for _ in range(reps)]
+        t0 = time.perf_counter()
+        for b in seq:
+            te.match_templates(pool, b, "LONG")
+        scan_us = (time.perf_counter() - t0) / reps * 1e6
+        t0 = time.perf_counter()
+        for b in seq:
+            idx.match(b, "LONG")
+        lookup_us = (time.perf_counter() - t0) / reps * 1e6
+        t0 = time.perf_counter()
+        te.TemplateIndex(pool)
+        build_ms = (time.perf_counter() - t0) * 1000
+        print(f"pool={n:<6} scan={scan_us:9.1f} µs  lookup={lookup_us:6.2f} µs  "
+              f"x{scan_us / max(lookup_us, 1e-9):.0f}  build={build_ms:.1f} ms")
+    print("OK" if ok else "MISMATCH")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+# app/scripts/bench_template_registry.py
+"""
+模板選擇（policy._select_template）延遲 vs 模板池大小（DB_BACKEND=sqlite 記憶體庫，不需 MySQL）：
+  old ：每次決策 SELECT templates + JOIN template_stats 彙總 + 逐一比對（舊流程）
+  new ：template_registry 快取（版本號檢查間隔內只讀記憶體）
+兩者選出的 template_id 必須相同。
+
+用法：
+  DB_BACKEND=sqlite python -m app.scripts.bench_template_registry            # 池大小 50 / 500 / 2000
+  DB_BACKEND=sqlite python -m app.scripts.bench_template_registry 100 1000
+"""
+import sys
+import time
+import random
+
+from app import db, migrate
+from app.config import Config
+from app.policy import policy, templates_eval as te, templates_repo as repo, template_registry
+from app.learner.rewards import book_trade
+
+
+def _old_select(side, last_feat):
+    bins = te.feature_bins(last_feat)
+    actives = repo.get_active_templates()
+    summaries = repo.get_all_templates_summary(active_only=True)
+    total = sum(int(s.get("n_trades") or 0) for s in summaries.values()) or 1
+    best, best_tid = -float("inf"), None
+    for t in te.match_templates(actives, bins, side=side):
+        sc = te.bandit_score(summaries.get(int(t["template_id"]), {}) or {}, total, method="ucb1",
+                             c=policy._UCB_C, risk_penalty=policy._RISK_PENALTY)
+        if sc > best:
+            best, best_tid = sc, int(t["template_id"])
+    return best_tid
+
+
+def _grow_pool(target: int) -> None:
+    have = repo.count_active_templates()
+    for _ in range(target - have):
+        f = {k: random.choice([None, "|".join(random.sample(v, random.randint(1, len(v))))])
+             for k, v in (("rsi", ["L", "M", "H"]), ("macd", ["P", "N"]), ("kd", ["P", "N"]), ("vol", ["L", "M", "H", "X"]))}
+        repo.insert_template(1, random.choice(["LONG", "SHORT"]), f["rsi"], f["macd"], f["kd"], f["vol"])
+    for _ in range(target // 2):
+        book_trade(symbol="BTCUSDT", interval="1m", template_id=random.randint(1, target), regime=random.randint(0, 2),
+                   entry_ts=1, exit_ts=2, entry_price=100.0, exit_price=100.0 + random.uniform(-1, 1), qty=1.0)
+
+
+def main():
+    if db.backend() != "sqlite":
+        print("請以 DB_BACKEND=sqlite 執行")
+        return 2
+    sizes = [int(x) for x in sys.argv[1:]] or [50, 500, 2000]
+    random.seed(3)
+    Config.DB_STATS_ENABLED = False
+    Config.TEMPLATE_REGISTRY_TTL_S = 5.0
+    migrate.run()
+    feats = [{"rsi": random.uniform(10, 90), "macd_hist": random.uniform(-1, 1), "kd_diff": random.uniform(-5, 5),
+              "vol_ratio": random.uniform(0.5, 2.5)} for _ in range(200)]
+    ok = True
+    for n in sorted(sizes):
+        _grow_pool(n)
+        template_registry.refresh(force=True)
+        for f in feats:
+            for side in ("LONG", "SHORT"):
+                if _old_select(side, f) != policy._select_template(side, f):
+                    ok = False
+        reps = len(feats)
+        t0 = time.perf_counter()
+        for f in feats:
+            _old_select("LONG", f)
+        old_us = (time.perf_counter() - t0) / reps * 1e6
+        t0 = time.perf_counter()
+        for f in feats:
+            policy._select_template("LONG", f)
+        new_us = (time.perf_counter() - t0) / reps * 1e6
+        print(f"pool={n:<6} old={old_us:10.1f} µs  new={new_us:8.1f} µs  x{old_us / max(new_us, 1e-9):.0f}")
+    print("registry:", template_registry.stats)
+    print("OK" if ok else "MISMATCH")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
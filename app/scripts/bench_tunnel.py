@@ -0,0 +1,213 @@
+# app/scripts/bench_tunnel.py
+"""
+SSH 轉發器驗證 / benchmark（不需真實 SSH 主機與 DB）：
+本機啟一個 paramiko SSH server stub（接受 direct-tcpip，轉到本機 echo server），
+再用 db_connect._ForwardServer 在本機埠轉發，開多條並行連線來回送隨機資料，
+檢查內容逐位元組一致，並印出吞吐量、執行緒數與各 channel 流量計數。
+
+用法：
+  python -m app.scripts.bench_tunnel                # 15 條連線（= pool_size 5 + max_overflow 10），每條 4 MB
+  python -m app.scripts.bench_tunnel 30 8           # 連線數、每條 MB
+"""
+import os
+import sys
+import time
+import socket
+import hashlib
+import threading
+
+import paramiko
+
+from app.db_connect import _ForwardServer
+
+
+# ---------- 本機 echo server（扮演遠端 MySQL）----------
+def _echo_server() -> int:
+    srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    srv.bind(("127.0.0.1", 0))
+    srv.listen(64)
+
+    def _serve(c: socket.socket):
+        with c:
+            while True:
+                d = c.recv(65536)
+                if not d:
+                    return
+                c.sendall(d)
+
+    def _accept():
+        while True:
+            c, _ = srv.accept()
+            threading.Thread(target=_serve, args=(c,), daemon=True).start()
+
+    threading.Thread(target=_accept, daemon=True).start()
+    return srv.getsockname()[1]
+
+
+# ---------- paramiko SSH server stub ----------
+class _Stub(paramiko.ServerInterface):
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_direct_tcpip_request(self, chanid, origin, destination):
+        return paramiko.OPEN_SUCCEEDED
+
+
+def _ssh_server(host_key: paramiko.PKey):
+    srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    srv.bind(("127.0.0.1", 0))
+    srv.listen(4)
+
+    def _bridge(chan: paramiko.Channel, dest):
+        up = socket.create_connection(dest)
+
+        def c2u():
+            while True:
+                d = chan.recv(65536)
+                if not d:
+                    break
+                up.sendall(d)
+            try:
+                up.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+
+        def u2c():
+            while True:
+                d = up.recv(65536)
+                if not d:
+                    break
+                chan.sendall(d)
+            chan.close()
+
+        threading.Thread(target=c2u, daemon=True).start()
+        threading.Thread(target=u2c, daemon=True).start()
+
+    def _run():
+        c, _ = srv.accept()
+        t = paramiko.Transport(c)
+        t.add_server_key(host_key)
+        stub = _Stub()
+        # 記下每個 direct-tcpip 的目的地
+        dests = {}
+        orig = stub.check_channel_direct_tcpip_request
+
+        def _chk(chanid, origin, destination):
+            dests[chanid] = destination
+            return orig(chanid, origin, destination)
+        stub.check_channel_direct_tcpip_request = _chk
+        t.start_server(server=stub)
+        while t.is_active():
+            ch = t.accept(1.0)
+            if ch is not None:
+                _bridge(ch, dests.get(ch.get_id()))
+
+    threading.Thread(target=_run, daemon=True).start()
+    return srv.getsockname()[1]
+
+
+def _free_port() -> int:
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    p = s.getsockname()[1]
+    s.close()
+    return p
+
+
+def _client(port: int, nbytes: int, out: list, idx: int) -> None:
+    payload = os.urandom(nbytes)
+    want = hashlib.sha1(payload).hexdigest()
+    s = socket.create_connection(("127.0.0.1", port))
+    s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    got = hashlib.sha1()
+    n = 0
+
+    def _send():
+        mv = memoryview(payload)
+        for i in range(0, nbytes, 16384):   # MySQL 封包量級的小塊
+            s.sendall(mv[i:i + 16384])
+
+    t = threading.Thread(target=_send, daemon=True)
+    t.start()
+    while n < nbytes:
+        d = s.recv(65536)
+        if not d:
+            break
+        got.update(d)
+        n += len(d)
+    t.join()
+    s.close()
+    out[idx] = (n == nbytes and got.hexdigest() == want)
+
+
+def main():
+    conns = int(sys.argv[1]) if len(sys.argv) > 1 else 15
+    mb = float(sys.argv[2]) if len(sys.argv) > 2 else 4
+    nbytes = int(mb * 1024 * 1024)
+
+    echo_port = _echo_server()
+    ssh_port = _ssh_server(paramiko.RSAKey.generate(2048))
+
+    cli = paramiko.SSHClient()
+    cli.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    cli.connect("127.0.0.1", port=ssh_port, username="u", password="p",
+                allow_agent=False, look_for_keys=False)
+    local_port = _free_port()
+    fwd = _ForwardServer(cli.get_transport(), local_port, "127.0.0.1", echo_port)
+    fwd.start()
+
+    # 1) 單條小封包 RTT（MySQL 查詢型態）
+    s = socket.create_connection(("127.0.0.1", local_port))
+    s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    lat = []
+    for _ in range(200):
+        t0 = time.perf_counter()
+        s.sendall(b"x" * 64)
+        got = 0
+        while got < 64:
+            got += len(s.recv(64 - got))
+        lat.append((time.perf_counter() - t0) * 1000)
+    s.close()
+    lat.sort()
+    print(f"small RTT: p50={lat[len(lat)//2]:.3f}ms p99={lat[int(len(lat)*0.99)]:.3f}ms")
+
+    # 2) 並行大量資料
+    res = [False] * conns
+    ths = [threading.Thread(target=_client, args=(local_port, nbytes, res, i)) for i in range(conns)]
+    t0 = time.perf_counter()
+    for t in ths:
+        t.start()
+    time.sleep(0.2)
+    pf_threads = sorted(t.name for t in threading.enumerate() if t.name.startswith("pf-"))
+    for t in ths:
+        t.join()
+    dt = time.perf_counter() - t0
+    total_mb = conns * nbytes * 2 / 1024 / 1024
+
+    # client 端收完不代表 pf-loop 已記完最後一段並關閉 channel：等全部連線（含 RTT 那條）關閉再比對
+    deadline = time.time() + 10
+    st = fwd.stats()
+    while st["closed"] < conns + 1 and time.time() < deadline:
+        time.sleep(0.01)
+        st = fwd.stats()
+    print(f"conns={conns} each={mb}MB  {dt:.2f}s  {total_mb / dt:.1f} MB/s (up+down)")
+    print(f"forwarder threads under load: {len(pf_threads)} {pf_threads}（舊版為 1 + 每連線 2 條）")
+    print(f"accepted={st['accepted']} closed={st['closed']} active={st['active']} "
+          f"up={st['bytes_up']} down={st['bytes_down']}")
+    ok = all(res) and st["closed"] == st["accepted"] == conns + 1 and st["bytes_up"] == st["bytes_down"] == conns * nbytes + 200 * 64
+    fwd.stop()
+    cli.close()
+    print("OK" if ok else f"MISMATCH: sha1={res} closed={st['closed']}/{conns + 1}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+# app/scripts/replay_stream.py
+"""
+用「錄下來的 frame」重播 KlineStream（不需網路、不寫 DB）：
+本機假連線依序吐出 frame，中途斷線一次，檢查
+  1) 只有 x=true 的 K 線被寫入，且每組 close_time 不重複、遞增
+  2) 重連後對所有組合呼叫 REST 補洞；串流跳號的組合也會補
+  3) 收線 frame 到寫入（sink）的延遲
+  4) 第一次連線：DB 最後一根之後漏掉一根才開始串流的組合要補洞，接得上的組合不補
+
+用法：
+  python -m app.scripts.replay_stream                  # 合成 20 幣 × 1m、每根 5 個 frame
+  python -m app.scripts.replay_stream frames.jsonl     # 重播錄下的 frame（每行一個原始 JSON）
+錄 frame：websocket-client 連上 stream_url(...) 後把 recv() 的字串逐行寫進檔案即可。
+"""
+import sys
+import json
+import time
+import threading
+
+from app.data.stream import KlineStream, stream_url
+
+
+def _synth_frames(n_sym: int = 20, n_bars: int = 30, ticks: int = 5):
+    """每根 bar 先吐 ticks-1 個未收線 frame，再吐 1 個 x=true；第 2 個幣故意跳過一根。"""
+    frames = []
+    t0 = 1_700_000_000_000 // 60_000 * 60_000
+    for b in range(n_bars):
+        ot = t0 + b * 60_000
+        for k in range(n_sym):
+            sym = f"S{k:03d}USDT"
+            if k == 1 and b == n_bars // 2:
+                continue  # 製造串流跳號
+            for j in range(ticks):
+                frames.append(json.dumps({
+                    "stream": f"{sym.lower()}@kline_1m",
+                    "data": {"e": "kline", "E": ot, "s": sym, "k": {
+                        "t": ot, "T": ot + 59_999, "s": sym, "i": "1m",
+                        "o": "1.0", "c": str(1.0 + j * 0.01), "h": "1.1", "l": "0.9", "v": str(10 + j),
+                        "x": j == ticks - 1}}}))
+    return frames
+
+
+class _ReplayConn:
+    """假的 websocket 連線：依序 recv() 出 frame；drop_at 之後丟出斷線，frame 吐完則 timeout。"""
+
+    def __init__(self, frames, drop_at=None):
+        self.frames = list(frames)
+        self.drop_at = drop_at
+        self.i = 0
+        self.timeout = 0.2
+
+    def settimeout(self, t):
+        self.timeout = t
+
+    def recv(self):
+        if self.drop_at is not None and self.i >= self.drop_at:
+            raise ConnectionError("replay: 模擬斷線")
+        if self.i >= len(self.frames):
+            time.sleep(self.timeout)
+            raise TimeoutError("timed out")
+        f = self.frames[self.i]
+        self.i += 1
+        return f
+
+    def close(self):
+        pass
+
+
+def _check_first_connect_gap() -> bool:
+    """DB 最後一根 close_time=T：A 的第一個 frame 是 T+2 根（漏 1 根）、B 是 T+1 根（接得上）。"""
+    t0 = 1_700_000_000_000 // 60_000 * 60_000
+    db_last = {("AAAUSDT", "1m"): t0 - 1, ("BBBUSDT", "1m"): t0 - 1}
+
+    def frame(sym, ot):
+        return json.dumps({"stream": f"{sym.lower()}@kline_1m", "data": {"e": "kline", "E": ot, "s": sym, "k": {
+            "t": ot, "T": ot + 59_999, "s": sym, "i": "1m", "o": "1", "c": "1", "h": "1", "l": "1", "v": "1",
+            "x": True}}})
+
+    conns = [_ReplayConn([frame("AAAUSDT", t0 + 60_000), frame("BBBUSDT", t0)])]
+    repaired = []
+    ks = KlineStream(list(db_last), connect=lambda url: conns.pop(0) if conns else _ReplayConn([]),
+                     sink=lambda s, i, rows: None, repair=lambda s, i: repaired.append((s, i)),
+                     last_close=lambda s, i: db_last[(s, i)], flush_ms=50)
+    th = threading.Thread(target=ks.run_forever, daemon=True)
+    th.start()
+    deadline = time.time() + 5
+    while time.time() < deadline and (conns or ks.stats["closed"] < 2 or ks.pending()):
+        time.sleep(0.05)
+    time.sleep(0.2)
+    ks.stop()
+    ok = repaired == [("AAAUSDT", "1m")]
+    print(f"第一次連線的缺口：補洞={repaired} {'OK' if ok else 'FAIL'}")
+    return ok
+
+
+def main():
+    if len(sys.argv) >= 2:
+        with open(sys.argv[1], encoding="utf-8") as fh:
+            frames = [ln.strip() for ln in fh if ln.strip()]
+    else:
+        frames = _synth_frames()
+
+    pairs = []
+    for f in frames:
+        k = json.loads(f).get("data", {}).get("k") or {}
+        if k:
+            pairs.append((k["s"].upper(), k["i"]))
+    pairs = list(dict.fromkeys(pairs))
+
+    half = len(frames) // 2
+    conns = [_ReplayConn(frames[:half], drop_at=half), _ReplayConn(frames[half:])]
+    written = {}
+    repaired = []
+    lat = []
+
+    def connect(url):
+        assert url == stream_url(pairs)
+        return conns.pop(0) if conns else _ReplayConn([])
+
+    def sink(s, i, rows):
+        now = time.time()
+        lat.append(now - ks.closed_at[(s, i)])
+        written.setdefault((s, i), []).extend(r[6] for r in rows)
+
+    ks = KlineStream(pairs, connect=connect, sink=sink, repair=lambda s, i: repaired.append((s, i)),
+                     last_close=lambda s, i: None, flush_ms=50)
+    th = threading.Thread(target=ks.run_forever, daemon=True)
+    th.start()
+    deadline = time.time() + 10
+    while time.time() < deadline and (conns or ks.pending() or ks.stats["closed"] == 0):
+        time.sleep(0.05)
+    time.sleep(0.3)
+    ks.stop()
+
+    closed_frames = sum(1 for f in frames if (json.loads(f).get("data", {}).get("k") or {}).get("x"))
+    total = sum(len(v) for v in written.values())
+    ok = total == closed_frames
+    for key, cts in written.items():
+        if cts != sorted(set(cts)):
+            ok = False
+            print(f"  !! {key} close_time 重複或亂序")
+    rec_repairs = [p for p in repaired if p in pairs]
+    ok &= ks.stats["reconnects"] >= 1 and set(rec_repairs) >= set(pairs)
+
+    lat.sort()
+    p50 = lat[len(lat) // 2] * 1000 if lat else 0.0
+    p99 = lat[min(len(lat) - 1, int(len(lat) * 0.99))] * 1000 if lat else 0.0
+    print(f"frames={len(frames)} 收線={closed_frames} 寫入={total} 組數={len(pairs)}")
+    print(f"stats={ks.stats}")
+    print(f"補洞呼叫={len(repaired)}（含重連 {len(pairs)} 組 + 跳號）")
+    print(f"收線→寫入延遲 p50={p50:.1f}ms p99={p99:.1f}ms（flush_ms=50）")
+    ok = _check_first_connect_gap() and ok
+    print("OK" if ok else "FAIL")
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
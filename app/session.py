@@ -3,6 +3,7 @@ from __future__ import annotations
 from time import time
 from typing import Optional, Tuple
 from .db import exec  # 直接用你現有的 exec()
+from . import settings_snapshot
 
 # -------------------------------------------------
 # 基本工具
@@ -15,19 +16,15 @@ def now_ms() -> int:
 # -------------------------------------------------
 def read_settings_basic() -> Tuple[int, str, Optional[int]]:
     """回傳 (is_enabled, trade_mode, current_session_id)"""
-    row = exec("SELECT is_enabled, trade_mode, current_session_id FROM settings WHERE id=1").mappings().first()
-    if not row:
-        return 1, "SIM", None
-    is_enabled = int(row.get("is_enabled") or 1)
-    trade_mode = str(row.get("trade_mode") or "SIM").upper()
-    cur_sid = row.get("current_session_id")
-    return is_enabled, trade_mode, (int(cur_sid) if cur_sid is not None else None)
+    st = settings_snapshot.get()
+    return int(st.is_enabled), st.trade_mode, st.current_session_id
 
 def set_current_session(session_id: Optional[int]) -> None:
     if session_id is None:
         exec("UPDATE settings SET current_session_id=NULL WHERE id=1")
     else:
         exec("UPDATE settings SET current_session_id=:sid WHERE id=1", sid=int(session_id))
+    settings_snapshot.invalidate()
 
 # -------------------------------------------------
 # Session 建立/結束邏輯
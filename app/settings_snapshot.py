@@ -0,0 +1,171 @@
+# app/settings_snapshot.py
+"""
+settings(id=1) 的行程內快照：一次讀入全部欄位，所有模組共用。
+
+- get()：回傳目前快照；距上次檢查超過 SETTINGS_TTL_S 才會問 DB
+- refresh()：每輪開頭呼叫一次；先只讀 updated_at（1 次往返），有變才重讀整列
+- invalidate()：本行程自己寫了 settings（例如 session.set_current_session）後呼叫，下次 get() 強制重讀
+
+注意：updated_at 精度為秒，同一秒內的兩次修改若剛好夾著一次檢查，第二次要等下一次寫入或 TTL 後的重讀才會生效；
+因此 RELOAD_EVERY_S 仍會定期整列重讀一次作為保底。
+"""
+from __future__ import annotations
+import json
+import time
+import threading
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from .db import exec
+from .config import Config
+
+log = logging.getLogger("autobot")
+
+# 整列重讀的保底週期（秒），避免 updated_at 同秒修改被漏掉
+RELOAD_EVERY_S = 600.0
+
+
+def _f(x: Any, default: Optional[float]) -> Optional[float]:
+    try:
+        return float(x) if x is not None else default
+    except (TypeError, ValueError):
+        return default
+
+
+def _i(x: Any, default: Optional[int]) -> Optional[int]:
+    try:
+        return int(x) if x is not None else default
+    except (TypeError, ValueError):
+        return default
+
+
+def _json(s: Any, fallback):
+    try:
+        v = json.loads(s) if s else fallback
+        return v if isinstance(v, type(fallback)) else fallback
+    except Exception:
+        return fallback
+
+
+@dataclass(frozen=True)
+class SettingsSnapshot:
+    symbols: List[str] = field(default_factory=lambda: ["BTCUSDT"])
+    intervals: List[str] = field(default_factory=lambda: ["1m"])
+    leverage: Dict[str, Any] = field(default_factory=dict)      # leverage_json
+    invest_usdt: Dict[str, Any] = field(default_factory=dict)   # invest_usdt_json
+    max_risk_pct: float = 0.01
+    max_daily_dd_pct: Optional[float] = 0.03
+    hard_sl_pct: Optional[float] = None
+    trail_backoff_pct: Optional[float] = None
+    trail_trigger_pct: Optional[float] = None
+    max_consec_losses: int = 4
+    entry_threshold: float = 0.3
+    reverse_gap: float = 0.2
+    cooldown_bars: int = 2
+    min_hold_bars: int = 2
+    max_hold_bars: Optional[int] = None
+    is_enabled: int = 1
+    trade_mode: str = "SIM"
+    current_session_id: Optional[int] = None
+    live_armed: int = 0
+    fee_rate: Optional[float] = None
+    slip_rate: Optional[float] = None
+    adv_enabled: int = 0
+    exit_horizon_auto: int = 0
+    bandit_mode: str = "ucb1"     # 模板選擇：ucb1 / ucbv / thompson（app/policy/bandit.py）/ linucb（linucb.py）
+    updated_at: Any = None
+    loaded: bool = False   # False：DB 沒有 id=1 或讀取失敗，使用預設值
+
+    @classmethod
+    def from_row(cls, r: Optional[Dict[str, Any]]) -> "SettingsSnapshot":
+        if not r:
+            return cls()
+        return cls(
+            symbols=list(_json(r.get("symbols_json"), [])) or ["BTCUSDT"],
+            intervals=list(_json(r.get("intervals_json"), [])) or ["1m"],
+            leverage=_json(r.get("leverage_json"), {}),
+            invest_usdt=_json(r.get("invest_usdt_json"), {}),
+            max_risk_pct=_f(r.get("max_risk_pct"), 0.01) or 0.01,
+            max_daily_dd_pct=_f(r.get("max_daily_dd_pct"), None),
+            hard_sl_pct=_f(r.get("hard_sl_pct"), None),
+            trail_backoff_pct=_f(r.get("trail_backoff_pct"), None),
+            trail_trigger_pct=_f(r.get("trail_trigger_pct"), None),
+            max_consec_losses=_i(r.get("max_consec_losses"), 0) or 0,
+            entry_threshold=_f(r.get("entry_threshold"), 0.3),
+            reverse_gap=_f(r.get("reverse_gap"), 0.2),
+            cooldown_bars=_i(r.get("cooldown_bars"), 0) or 0,
+            min_hold_bars=_i(r.get("min_hold_bars"), 0) or 0,
+            max_hold_bars=_i(r.get("max_hold_bars"), None),
+            # ★ 嚴格讀 is_enabled，避免 0 被 or 1 吃掉
+            is_enabled=_i(r.get("is_enabled"), 1),
+            trade_mode=str(r.get("trade_mode") or "SIM").upper(),
+            current_session_id=_i(r.get("current_session_id"), None),
+            live_armed=_i(r.get("live_armed"), 0) or 0,
+            fee_rate=_f(r.get("fee_rate"), None),
+            slip_rate=_f(r.get("slip_rate"), None),
+            adv_enabled=_i(r.get("adv_enabled"), 0) or 0,
+            exit_horizon_auto=_i(r.get("exit_horizon_auto"), 0) or 0,
+            bandit_mode=str(r.get("bandit_mode") or "ucb1").lower(),
+            updated_at=r.get("updated_at"),
+            loaded=True,
+        )
+
+    # ---- 常用衍生值 ----
+    def leverage_for(self, symbol: str) -> int:
+        m = self.leverage
+        return int(m.get(symbol) or next(iter(m.values()), 1) or 1)
+
+    def invest_for(self, symbol: str) -> float:
+        m = self.invest_usdt
+        return float(m.get(symbol) or next(iter(m.values()), 100.0) or 100.0)
+
+
+_snap: Optional[SettingsSnapshot] = None
+_checked_at = 0.0
+_loaded_at = 0.0
+_lock = threading.Lock()
+stats = {"checks": 0, "reloads": 0}
+
+
+def _load() -> SettingsSnapshot:
+    global _snap, _checked_at, _loaded_at
+    r = exec("SELECT * FROM settings WHERE id=1").mappings().first()
+    _snap = SettingsSnapshot.from_row(dict(r) if r else None)
+    _checked_at = _loaded_at = time.monotonic()
+    stats["reloads"] += 1
+    return _snap
+
+
+def refresh(force: bool = False) -> SettingsSnapshot:
+    """檢查 updated_at；有變（或 force / 超過保底週期）才整列重讀。"""
+    global _checked_at
+    with _lock:
+        now = time.monotonic()
+        if force or _snap is None or now - _loaded_at >= RELOAD_EVERY_S:
+            return _load()
+        stats["checks"] += 1
+        ua = exec("SELECT updated_at FROM settings WHERE id=1").scalar()
+        if ua is None or ua != _snap.updated_at:
+            return _load()
+        _checked_at = now
+        return _snap
+
+
+def get() -> SettingsSnapshot:
+    """取目前快照；超過 SETTINGS_TTL_S 沒檢查過才會碰 DB。讀取失敗時沿用舊快照（沒有就用預設值）。"""
+    snap = _snap
+    if snap is not None and time.monotonic() - _checked_at < float(Config.SETTINGS_TTL_S):
+        return snap
+    try:
+        return refresh()
+    except Exception as e:
+        log.error("讀取 settings 失敗（沿用%s）：%s", "舊快照" if snap is not None else "預設值", e)
+        return snap if snap is not None else SettingsSnapshot()
+
+
+def invalidate() -> None:
+    """本行程寫入 settings 後呼叫；下次 get() 會整列重讀。"""
+    global _snap
+    with _lock:
+        _snap = None
@@ -35,6 +35,7 @@ if ($method === 'POST') {
     $is_enabled       = array_key_exists('is_enabled', $j)        ? (int)$j['is_enabled']                : null;
     $adv_enabled    = array_key_exists('adv_enabled', $j)    ? (int)$j['adv_enabled']    : null;
     $exit_horizon_auto = array_key_exists('exit_horizon_auto', $j) ? (int)$j['exit_horizon_auto'] : null;
+    $bandit_mode    = array_key_exists('bandit_mode', $j)    ? (in_array($j['bandit_mode'], ['ucb1', 'ucbv', 'thompson', 'linucb']) ? $j['bandit_mode'] : 'ucb1') : null;
 
 
     $max_risk_pct       = array_key_exists('max_risk_pct', $j)       ? (float)$j['max_risk_pct']       : null;
@@ -94,6 +95,11 @@ if ($method === 'POST') {
                 $params[':eha'] = $exit_horizon_auto;
             }
 
+            if (!is_null($bandit_mode)) {
+                $sets[] = "bandit_mode = :bm";
+                $params[':bm'] = $bandit_mode;
+            }
+
             if (!is_null($max_risk_pct)) {
                 $sets[] = "max_risk_pct = :f1";
                 $params[':f1'] = $max_risk_pct;
@@ -198,11 +204,11 @@ if ($method === 'POST') {
                 INSERT INTO settings(
                   id, symbols_json, intervals_json, leverage_json, invest_usdt_json, is_enabled,
                   max_risk_pct, max_daily_dd_pct, max_consec_losses, entry_threshold, reverse_gap, cooldown_bars, min_hold_bars, adv_enabled,
-                  trade_mode, live_armed, fee_rate, slip_rate, exit_horizon_auto
+                  trade_mode, live_armed, fee_rate, slip_rate, exit_horizon_auto, bandit_mode
                 ) VALUES (
                   1, :a, :b, :c, :d, :e,
                   :f1, :f2, :f3, :f4, :f5, :f6, :f7, :adv,
-                  :tm, :la, :fr, :sr, :eha
+                  :tm, :la, :fr, :sr, :eha, :bm
                 )
             ");
             $stmt->execute([
@@ -224,6 +230,7 @@ if ($method === 'POST') {
                 ':fr' => $fee_rate           ?? 0.0004,
                 ':sr' => $slip_rate          ?? 0.0005,
                 ':eha' => $exit_horizon_auto ?? 0,
+                ':bm' => $bandit_mode        ?? 'ucb1',
 
             ]);
 
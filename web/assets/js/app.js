@@ -183,6 +183,7 @@ function setCoreControlsDisabled(disabled) {
     'cooldown_bars',
     'min_hold_bars',
     'exitHorizonAuto',
+    'banditMode',
     'tradeMode',
     'liveArmed',
   ];
@@ -264,6 +265,7 @@ async function loadSettings() {
     if ($('exitHorizonAuto'))
       $('exitHorizonAuto').checked = Number(row.exit_horizon_auto || 0) === 1;
     if ($('useAdv')) $('useAdv').checked = Number(row.adv_enabled || 0) === 1;
+    if ($('banditMode')) $('banditMode').value = ['ucb1', 'ucbv', 'thompson', 'linucb'].includes(row.bandit_mode) ? row.bandit_mode : 'ucb1';
     if ($('tradeMode')) $('tradeMode').value = row.trade_mode === 'LIVE' ? 'LIVE' : 'SIM';
     if ($('liveArmed')) $('liveArmed').checked = Number(row.live_armed || 0) === 1;
     toggleLiveArmedVisibility();
@@ -502,6 +504,7 @@ function buildCorePayload(extra = {}) {
   if (payload.trade_mode !== 'LIVE') payload.live_armed = 0;
   payload.adv_enabled = useAdv ? 1 : 0;
   payload.exit_horizon_auto = $('exitHorizonAuto') && $('exitHorizonAuto').checked ? 1 : 0;
+  if ($('banditMode')) payload.bandit_mode = $('banditMode').value;
   return payload;
 }
 